@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Scraper asíncrono de varios cAdvisor (uno por nodo, cadvisor-daemonset.yml)
+
+Descarga y parsea todos los targets en paralelo con un límite de
+concurrencia. Cada target se descarga y se parsea en un proceso del pool
+(con su propio MetricsFetcher), así el event loop nunca se bloquea y el
+cuerpo no cruza de un proceso a otro: vuelven sólo las series (tuplas con
+las cadenas internadas) y dos arrays numpy de valores y timestamps. Los
+resultados se fusionan en un único snapshot con la etiqueta `node`: cada
+serie de cada nodo se resuelve en el SeriesStore una sola vez y, en los
+scrapes siguientes, la fusión es una búsqueda en un dict por muestra y
+una concatenación de arrays.
+
+Uso:
+    python3 async_scraper.py http://10.0.0.1:8080/metrics nodo2=http://10.0.0.2:8080/metrics
+    python3 async_scraper.py --kubectl            # pods app=cadvisor en kube-system
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+
+from columnar import ColumnarSnapshot
+from http_fetch import MetricsFetcher
+from prom_parser import DEFAULT_PARSE_FILTER, parse_text
+from series_store import NO_TIMESTAMP, Scrape, SeriesStore
+
+DEFAULT_CONCURRENCY = 16
+NODE_LABEL = 'node'
+
+
+def parse_targets(specs):
+    """Convierte 'url' o 'nodo=url' en una lista de (nodo, url)"""
+    targets = []
+    for spec in specs:
+        if '=' in spec and not spec.startswith('http'):
+            node, url = spec.split('=', 1)
+        else:
+            url = spec
+            node = urlparse(url).netloc
+        targets.append((node, url))
+    return targets
+
+
+def discover_daemonset_targets(namespace='kube-system', selector='app=cadvisor', port=8080):
+    """Targets de los pods del DaemonSet usando kubectl (IP del host de cada nodo)"""
+    output = subprocess.run(
+        ['kubectl', 'get', 'pods', '-n', namespace, '-l', selector, '-o', 'json'],
+        check=True, capture_output=True, text=True).stdout
+    targets = []
+    for pod in json.loads(output)['items']:
+        node = pod['spec'].get('nodeName')
+        host_ip = pod['status'].get('hostIP')
+        if node and host_ip:
+            targets.append((node, f"http://{host_ip}:{port}/metrics"))
+    return targets
+
+
+# Cliente de cada proceso del pool (se crea al arrancar el proceso)
+_WORKER_FETCHER = None
+
+
+def _init_worker(pool_maxsize):
+    global _WORKER_FETCHER
+    _WORKER_FETCHER = MetricsFetcher(pool_maxsize=pool_maxsize)
+
+
+def _scrape_columns(url):
+    """Se ejecuta en el pool de procesos: descarga y parsea url
+
+    Devuelve (series, valores, timestamps, bytes en la red, segundos de
+    descarga, segundos de parseo). series son tuplas (familia, nombre,
+    etiquetas como pares) con las cadenas internadas: pickle escribe una
+    sola vez cada familia y cada nombre de etiqueta.
+    """
+    start = time.perf_counter()
+    fetch = _WORKER_FETCHER.fetch(url)
+    fetch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    intern = sys.intern
+    series, values, timestamps = [], [], []
+    for sample in parse_text(fetch.text, parse_filter=DEFAULT_PARSE_FILTER):
+        labels = tuple((intern(k), v) for k, v in sample.labels.items())
+        series.append((intern(sample.family), intern(sample.name), labels))
+        values.append(sample.value)
+        timestamps.append(NO_TIMESTAMP if sample.timestamp is None else sample.timestamp)
+    columns = (series, np.array(values, dtype=np.float64), np.array(timestamps, dtype=np.int64))
+    return columns + (fetch.wire_bytes, fetch_seconds, time.perf_counter() - start)
+
+
+class TargetResult:
+    """Resultado de un target: series parseadas (columnas) o error, y tiempos"""
+
+    __slots__ = ('node', 'url', 'series', 'values', 'timestamps', 'wire_bytes', 'error',
+                 'fetch_seconds', 'parse_seconds')
+
+    def __init__(self, node, url):
+        self.node = node
+        self.url = url
+        self.series = None
+        self.values = None
+        self.timestamps = None
+        self.wire_bytes = 0
+        self.error = None
+        self.fetch_seconds = 0.0
+        self.parse_seconds = 0.0
+
+
+class FleetScraper:
+    """Scrape concurrente de una flota de cAdvisor"""
+
+    def __init__(self, targets, concurrency=DEFAULT_CONCURRENCY, parse_workers=None,
+                 store=None):
+        self.targets = targets
+        self.concurrency = concurrency
+        self.store = store if store is not None else SeriesStore()
+        # nodo -> {serie tal como la devuelve el worker: sid del store}
+        self._sids = {}
+        self._epoch = self.store.epoch
+        # Un proceso descarga y parsea un target cada vez: sin parse_workers,
+        # tantos procesos como descargas simultáneas
+        workers = parse_workers or max(min(concurrency, len(targets)), 1)
+        self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                         initargs=(max(len(targets), 1),))
+
+    async def _scrape_one(self, node, url, semaphore):
+        loop = asyncio.get_running_loop()
+        result = TargetResult(node, url)
+        async with semaphore:
+            try:
+                (result.series, result.values, result.timestamps, result.wire_bytes,
+                 result.fetch_seconds, result.parse_seconds) = await loop.run_in_executor(
+                    self._pool, _scrape_columns, url)
+            except Exception as e:
+                result.error = e
+        return result
+
+    async def scrape_async(self):
+        """Scrapea todos los targets y devuelve la lista de TargetResult"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(
+            *(self._scrape_one(node, url, semaphore) for node, url in self.targets))
+
+    def _node_sids(self, node, series):
+        """sid del store de cada serie de un nodo (get_series sólo para las nuevas)"""
+        cache = self._sids.setdefault(node, {})
+        sids = [cache.get(key) for key in series]
+        if None in sids:
+            for i, key in enumerate(series):
+                if sids[i] is None:
+                    family, name, pairs = key
+                    labels = dict(pairs)
+                    labels[NODE_LABEL] = node
+                    sids[i] = cache[key] = self.store.get_series(name, labels, family).sid
+        return sids
+
+    def merge(self, results):
+        """Fusiona los resultados en un único Scrape añadiendo la etiqueta `node`"""
+        if self.store.epoch != self._epoch:
+            # El store se ha compactado: los sids cacheados ya no valen
+            self._sids, self._epoch = {}, self.store.epoch
+        scrape = Scrape(self.store)
+        parts = [(self._node_sids(r.node, r.series), r.values, r.timestamps)
+                 for r in results if r.series is not None]
+        if parts:
+            sids, values, timestamps = zip(*parts)
+            scrape.sids.frombytes(np.concatenate(
+                [np.asarray(s, dtype=scrape.sids.typecode) for s in sids]).tobytes())
+            scrape.values.frombytes(np.concatenate(values).astype(np.float64).tobytes())
+            scrape.timestamps.frombytes(np.concatenate(timestamps).astype(np.int64).tobytes())
+        return scrape
+
+    def scrape(self):
+        """Versión síncrona: (snapshot columnar fusionado, resultados por target)"""
+        results = asyncio.run(self.scrape_async())
+        return ColumnarSnapshot.from_scrape(self.merge(results)), results
+
+    def close(self):
+        self._pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape concurrente de varios cAdvisor")
+    parser.add_argument('targets', nargs='*', help="url o nodo=url")
+    parser.add_argument('--kubectl', action='store_true',
+                        help="descubrir los pods del DaemonSet cadvisor con kubectl")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+
+    targets = parse_targets(args.targets)
+    if args.kubectl:
+        targets += discover_daemonset_targets()
+    if not targets:
+        parser.error("no hay targets")
+
+    scraper = FleetScraper(targets, concurrency=args.concurrency)
+    try:
+        start = time.perf_counter()
+        snapshot, results = scraper.scrape()
+        total = time.perf_counter() - start
+    finally:
+        scraper.close()
+
+    print(f"Targets: {len(targets)} (concurrencia {args.concurrency})\n")
+    for r in results:
+        if r.error is not None:
+            print(f"  ✗ {r.node:24} {r.error}")
+        else:
+            print(f"  ✓ {r.node:24} {len(r.series):6} series  "
+                  f"fetch {r.fetch_seconds * 1000:6.0f} ms  parse {r.parse_seconds * 1000:6.0f} ms")
+
+    slowest = max((r.fetch_seconds + r.parse_seconds for r in results), default=0)
+    print(f"\nSeries fusionadas: {sum(len(c) for c in snapshot.families.values())} "
+          f"en {len(snapshot)} familias")
+    print(f"Tiempo total: {total * 1000:.0f} ms (target más lento: {slowest * 1000:.0f} ms)")
+    return 0 if all(r.error is None for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
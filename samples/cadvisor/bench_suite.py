@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los caminos de parseo de los scripts con payloads sintéticos
+
+Genera payloads con synthetic_metrics.py a escala 1x, 10x y 100x y, para
+cada script (extract_metrics, export_metrics, monitor_metrics,
+demo_metrics), mide en un proceso aparte:
+
+- parseo: lo que hace el script desde el cuerpo descargado hasta tener sus
+  estructuras (MB/s y series/s)
+- agregación: lo que hace después con ellas (resumen, selección de
+  contenedores, tasas y árbol de cgroups, consultas PromQL), en ms
+- pico de memoria: ru_maxrss menos el RSS con el payload ya leído
+
+La descarga se sustituye por un fetch que devuelve el payload, así se usa
+la misma ScrapeCache que en producción sin depender de un cAdvisor.
+monitor_metrics y demo_metrics se miden en streaming, como los scripts:
+el cuerpo falso entrega las líneas según se leen del texto, sin partirlo
+en una lista.
+
+Uso:
+    python3 bench_suite.py [--scales 1 10 100] [--paths extract_metrics monitor_metrics]
+    python3 bench_suite.py --file cadvisor_metrics.txt     # un dump real en vez de sintéticos
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from http_fetch import FetchResult
+from scrape_cache import ScrapeCache
+from synthetic_metrics import generate
+
+BENCH_URL = 'http://bench/metrics'
+DEFAULT_SCALES = (1, 10, 100)
+
+
+def _static_fetch(text):
+    """fetch para ScrapeCache que siempre devuelve `text` (sin red)"""
+    size = len(text.encode('utf-8'))
+
+    def fetch(url, headers):
+        return FetchResult(url, 200, text, {}, size, size, 0.0)
+    return fetch
+
+
+class _StaticBody:
+    """Sustituto de http_fetch.StreamedBody que lee las líneas de `text`"""
+
+    def __init__(self, url, text):
+        self.url = url
+        self.text = text
+        self.status = 200
+        self.headers = {}
+        self.decoded_bytes = 0
+
+    def lines(self):
+        # Trozos del texto ya leído: ni una lista de líneas ni una copia
+        # (io.StringIO copia el texto a UCS-4, 4 veces su tamaño)
+        text, pos = self.text, 0
+        while pos < len(text):
+            end = text.find('\n', pos)
+            end = len(text) if end == -1 else end
+            self.decoded_bytes += end + 1 - pos
+            yield text[pos:end]
+            pos = end + 1
+
+    def result(self):
+        return FetchResult(self.url, 200, None, {}, self.decoded_bytes, self.decoded_bytes, 0.0)
+
+    def close(self):
+        pass
+
+
+def _static_stream(text):
+    """open_stream para ScrapeCache(stream=True) que siempre entrega `text`"""
+    def open_stream(url, headers):
+        return _StaticBody(url, text)
+    return open_stream
+
+
+def _rss_mb():
+    """RSS actual en MB (Linux; 0 si no hay /proc)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        return 0.0
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Cada camino devuelve (parseo, agregación): parseo recibe la caché y
+# devuelve el estado que necesita la agregación
+
+def _extract_metrics():
+    from extract_metrics import extract_key_metrics, group_samples
+
+    def parse(cache):
+        metrics = group_samples(cache.samples(BENCH_URL))
+        cache.categories(BENCH_URL)
+        return metrics
+    return parse, extract_key_metrics
+
+
+def _export_metrics():
+    from export_metrics import extract_container_metrics, extract_specific_metrics
+    from label_index import LabelIndex
+    from stream_export import NDJSONWriter, export_samples
+
+    def parse(cache):
+        scrape = cache.scrape(BENCH_URL)
+        with NDJSONWriter(os.devnull) as writer:
+            export_samples(cache.samples(BENCH_URL), [writer])
+        return cache, scrape
+
+    def aggregate(state):
+        cache, scrape = state
+        extract_container_metrics(scrape, LabelIndex(cache.store))
+        extract_specific_metrics(cache.samples(BENCH_URL))
+    return parse, aggregate
+
+
+def _monitor_metrics():
+    from cgroup_tree import CgroupTree
+    from rates import RateTracker, counter_families
+
+    def parse(cache):
+        snapshot = cache.snapshot(BENCH_URL)
+        return snapshot, counter_families(cache.metadata(BENCH_URL), snapshot.families)
+
+    def aggregate(state):
+        snapshot, counters = state
+        # Dos refrescos con el mismo cuerpo: el segundo ya calcula tasas
+        tracker = RateTracker()
+        tracker.update(snapshot, counters, scrape_time_ms=0)
+        rates = tracker.update(snapshot, counters, scrape_time_ms=5000)
+        for family in snapshot.families:
+            snapshot[family].stats()
+        CgroupTree.from_snapshot(snapshot, rates=rates).qos_totals()
+    return parse, aggregate
+
+
+def _demo_metrics():
+    from demo_metrics import PROMQL_QUERIES
+    from promql import QueryEngine
+
+    def parse(cache):
+        cache.categories(BENCH_URL)
+        cache.snapshot(BENCH_URL)
+        return cache
+
+    def aggregate(cache):
+        engine = QueryEngine(cache.store, cache.label_index())
+        engine.add_snapshot(cache.snapshot(BENCH_URL))
+        for query_list in PROMQL_QUERIES.values():
+            for _, query in query_list:
+                engine.query(query)
+    return parse, aggregate
+
+
+PATHS = {
+    'extract_metrics': _extract_metrics,
+    'export_metrics': _export_metrics,
+    'monitor_metrics': _monitor_metrics,
+    'demo_metrics': _demo_metrics,
+}
+
+# Caminos cuyo script usa ScrapeCache(stream=True) (los otros necesitan el texto)
+STREAMED_PATHS = {'monitor_metrics', 'demo_metrics'}
+
+
+def measure(path, payload):
+    """Mide un camino sobre un payload (llamar en un proceso nuevo)"""
+    parse, aggregate = PATHS[path]()
+    with open(payload, encoding='utf-8') as f:
+        text = f.read()
+    cache = ScrapeCache(ttl=float('inf'), fetch=_static_fetch(text), stream=path in STREAMED_PATHS,
+                        open_stream=_static_stream(text))
+    baseline = _rss_mb()
+
+    start = time.perf_counter()
+    state = parse(cache)
+    parse_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    aggregate(state)
+    aggregate_seconds = time.perf_counter() - start
+    peak_mb = _peak_rss_mb() - baseline
+
+    size_mb = os.path.getsize(payload) / 1e6
+    series = len(cache.scrape(BENCH_URL))
+    return {
+        'path': path,
+        'stream': cache.stream,
+        'size_mb': round(size_mb, 2),
+        'series': series,
+        'parse_s': round(parse_seconds, 3),
+        'mb_per_s': round(size_mb / parse_seconds, 2),
+        'series_per_s': round(series / parse_seconds),
+        'aggregate_ms': round(aggregate_seconds * 1000, 1),
+        'peak_mb': round(peak_mb, 1),
+    }
+
+
+def run(payloads, paths=tuple(PATHS)):
+    """{(etiqueta, camino): resultado} ejecutando cada medida en un proceso aparte"""
+    results = {}
+    here = os.path.dirname(os.path.abspath(__file__))
+    for label, payload in payloads:
+        for path in paths:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--measure', path, payload],
+                check=True, capture_output=True, text=True, cwd=here).stdout
+            results[(label, path)] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de parseo con payloads sintéticos de cAdvisor")
+    parser.add_argument('--scales', type=int, nargs='+', default=list(DEFAULT_SCALES))
+    parser.add_argument('--paths', nargs='+', choices=list(PATHS), default=list(PATHS))
+    parser.add_argument('--file', help="medir un dump existente en lugar de payloads sintéticos")
+    parser.add_argument('--json', action='store_true', help="resultados en JSON")
+    parser.add_argument('--measure', nargs=2, metavar=('CAMINO', 'PAYLOAD'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.file:
+            payloads = [(os.path.basename(args.file), args.file)]
+        else:
+            payloads = []
+            for scale in args.scales:
+                payload = os.path.join(tmp, f"synthetic_{scale}x.txt")
+                with open(payload, 'w', encoding='utf-8') as f:
+                    generate(f, scale=scale)
+                payloads.append((f"{scale}x", payload))
+        results = run(payloads, args.paths)
+
+    if args.json:
+        print(json.dumps([r for r in results.values()], indent=2))
+        return 0
+    print(f"{'payload':>8} {'MB':>7} {'series':>8} {'camino':>16} {'modo':>6} {'parseo (s)':>10} "
+          f"{'MB/s':>6} {'series/s':>9} {'agreg. (ms)':>11} {'pico (MB)':>9}")
+    for (label, _), r in results.items():
+        mode = 'stream' if r['stream'] else 'buffer'
+        print(f"{label:>8} {r['size_mb']:7.1f} {r['series']:8d} {r['path']:>16} {mode:>6} {r['parse_s']:10.3f} "
+              f"{r['mb_per_s']:6.1f} {r['series_per_s']:9d} {r['aggregate_ms']:11.1f} {r['peak_mb']:9.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
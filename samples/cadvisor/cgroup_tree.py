@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Árbol de cgroups (etiqueta `id` de cAdvisor) con subtotales de abajo arriba
+
+La etiqueta `id` es la ruta del cgroup, p.ej.
+
+    /kubepods.slice/kubepods-burstable.slice/kubepods-burstable-pod<uid>.slice/crio-<id>
+
+El árbol permite navegar clase QoS -> pod -> contenedor. Los valores de
+cada métrica se asignan a su nodo (sumando dispositivos, interfaces...) y
+los totales se calculan en un único recorrido en postorden que se cachea
+hasta que cambian los valores, así los totales por pod y por QoS no
+vuelven a recorrer las series.
+
+cAdvisor ya publica cada cgroup padre con sus hijos incluidos, así que el
+total de un nodo es la suma de los totales de sus hijos (sólo se usa el
+valor propio en las hojas o si ningún hijo tiene la métrica): nunca se
+cuenta dos veces lo mismo. Lo que consumen procesos del propio cgroup
+intermedio se ve con unaccounted().
+
+Uso:
+    python3 cgroup_tree.py [cadvisor_metrics.txt]
+"""
+
+import re
+import sys
+
+import numpy as np
+
+from columnar import ColumnarSnapshot
+
+ID_LABEL = 'id'
+
+# Métricas por defecto: nombre -> familia (gauges; las tasas se añaden aparte)
+DEFAULT_FAMILIES = {
+    'memory_working_set_bytes': 'container_memory_working_set_bytes',
+    'fs_usage_bytes': 'container_fs_usage_bytes',
+}
+CPU_RATE = 'cpu_rate'
+CPU_FAMILY = 'container_cpu_usage_seconds_total'
+
+QOS_CLASSES = ('guaranteed', 'burstable', 'besteffort')
+
+_KUBEPODS_RE = re.compile(r'^kubepods(\.slice)?$')
+_QOS_RE = re.compile(r'^(?:kubepods-)?(burstable|besteffort)(\.slice)?$')
+# uid con guiones (en systemd, '_') o de 32 hex sin guiones (pods estáticos)
+_POD_RE = re.compile(r'pod([0-9a-f]{8}[-_][0-9a-f]{4}[-_][0-9a-f]{4}[-_][0-9a-f]{4}[-_][0-9a-f]{12}|[0-9a-f]{32})(\.slice)?$')
+_CONTAINER_RE = re.compile(r'^(?:(?:crio|docker|cri-containerd|containerd)-)?([0-9a-f]{64})(\.scope)?$')
+
+
+def classify_segment(segment):
+    """Tipo de un segmento de ruta: (kind, detalle)
+
+    kind: 'kubepods', 'qos' (detalle = clase), 'pod' (uid), 'container' (id)
+    u 'other'. Acepta el driver systemd (.slice/.scope) y cgroupfs.
+    """
+    if _KUBEPODS_RE.match(segment):
+        return 'kubepods', None
+    m = _QOS_RE.match(segment)
+    if m:
+        return 'qos', m.group(1)
+    m = _POD_RE.search(segment)
+    if m:
+        return 'pod', m.group(1).replace('_', '-')
+    m = _CONTAINER_RE.match(segment)
+    if m:
+        return 'container', m.group(1)
+    return 'other', None
+
+
+class CgroupNode:
+    """Nodo del árbol; kind es 'root', 'kubepods', 'qos', 'pod', 'container' u 'other'"""
+
+    __slots__ = ('index', 'path', 'name', 'kind', 'detail', 'parent', 'children', 'qos')
+
+    def __init__(self, index, path, name, kind, detail, parent):
+        self.index = index
+        self.path = path
+        self.name = name
+        self.kind = kind
+        self.detail = detail
+        self.parent = parent
+        self.children = []
+        self.qos = None
+
+    def __repr__(self):
+        return f"CgroupNode({self.path!r}, {self.kind})"
+
+    def walk(self):
+        """Preorden: el nodo y luego sus descendientes"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+
+class CgroupTree:
+    """Árbol de cgroups con valores propios por nodo y totales cacheados"""
+
+    def __init__(self):
+        self.root = CgroupNode(0, '/', '/', 'root', None, None)
+        self.nodes = [self.root]
+        self._by_path = {'/': self.root}
+        self.metrics = []
+        self._own = np.empty((0, 1))
+        self._has = np.empty((0, 1), dtype=bool)
+        self._totals = None
+
+    def node(self, path):
+        """Nodo de una ruta (creando los intermedios que falten)"""
+        node = self._by_path.get(path)
+        if node is not None:
+            return node
+        parent_path, _, name = path.rstrip('/').rpartition('/')
+        parent = self.node(parent_path or '/')
+        kind, detail = classify_segment(name)
+        node = CgroupNode(len(self.nodes), path, name, kind, detail, parent)
+        if kind == 'qos':
+            node.qos = detail
+        elif kind == 'pod':
+            node.qos = parent.qos or 'guaranteed'
+        else:
+            node.qos = parent.qos
+        parent.children.append(node)
+        self.nodes.append(node)
+        self._by_path[path] = node
+        self._totals = None
+        return node
+
+    def get(self, path):
+        return self._by_path.get(path)
+
+    def _resize(self):
+        """Ajusta las matrices (nodo x métrica) si se han añadido nodos o métricas"""
+        rows, columns = len(self.nodes), len(self.metrics)
+        if self._own.shape != (rows, columns):
+            own = np.zeros((rows, columns))
+            has = np.zeros((rows, columns), dtype=bool)
+            old_rows, old_columns = self._own.shape
+            own[:old_rows, :old_columns] = self._own
+            has[:old_rows, :old_columns] = self._has
+            self._own, self._has = own, has
+
+    def _metric_column(self, metric):
+        if metric not in self.metrics:
+            self.metrics.append(metric)
+        self._resize()
+        return self.metrics.index(metric)
+
+    def set_values(self, metric, paths, values):
+        """Asigna los valores propios de una métrica (se suman los de la misma ruta)"""
+        indices = np.fromiter((self.node(p).index for p in paths), dtype=np.int64, count=len(paths))
+        column = self._metric_column(metric)
+        self._own[:, column] = np.bincount(indices, weights=values, minlength=len(self.nodes))
+        self._has[:, column] = np.bincount(indices, minlength=len(self.nodes)) > 0
+        self._totals = None
+
+    def _rollup(self):
+        """Totales de todos los nodos y métricas en un recorrido en postorden"""
+        if self._totals is None:
+            self._resize()
+            own, has = self._own, self._has
+            totals = own.copy()
+            has_total = has.copy()
+            child_sum = np.zeros_like(own)
+            child_has = np.zeros_like(has)
+            for node in reversed(list(self.root.walk())):
+                i = node.index
+                use_children = child_has[i]
+                totals[i] = np.where(use_children, child_sum[i], own[i])
+                has_total[i] = use_children | has[i]
+                if node.parent is not None:
+                    p = node.parent.index
+                    child_sum[p] += np.where(has_total[i], totals[i], 0.0)
+                    child_has[p] |= has_total[i]
+            self._totals = (totals, has_total)
+        return self._totals
+
+    def total(self, node, metric):
+        """Total de la métrica en el subárbol (None si ningún nodo la tiene)"""
+        node = self._by_path[node] if isinstance(node, str) else node
+        if metric not in self.metrics:
+            return None
+        totals, has_total = self._rollup()
+        column = self.metrics.index(metric)
+        return float(totals[node.index, column]) if has_total[node.index, column] else None
+
+    def own(self, node, metric):
+        """Valor publicado por cAdvisor para ese cgroup (None si no hay serie)"""
+        node = self._by_path[node] if isinstance(node, str) else node
+        if metric not in self.metrics:
+            return None
+        column = self._metric_column(metric)
+        return float(self._own[node.index, column]) if self._has[node.index, column] else None
+
+    def unaccounted(self, node, metric):
+        """Valor publicado menos la suma de los hijos: procesos del propio cgroup"""
+        own, total = self.own(node, metric), self.total(node, metric)
+        return None if own is None or total is None else own - total
+
+    def totals(self, node):
+        """{métrica: total} de un nodo"""
+        return {metric: self.total(node, metric) for metric in self.metrics}
+
+    def of_kind(self, kind):
+        return [node for node in self.nodes if node.kind == kind]
+
+    def pods(self):
+        return self.of_kind('pod')
+
+    def containers(self, pod=None):
+        """Contenedores de un pod (o de todo el árbol)"""
+        nodes = self.nodes if pod is None else pod.walk()
+        return [node for node in nodes if node.kind == 'container']
+
+    def pod_totals(self):
+        """{uid del pod: {métrica: total}}"""
+        return {pod.detail: self.totals(pod) for pod in self.pods()}
+
+    def qos_totals(self):
+        """{clase QoS: {métrica: total}} sumando los pods de cada clase"""
+        totals, has_total = self._rollup()
+        result = {}
+        for qos in QOS_CLASSES:
+            rows = [pod.index for pod in self.pods() if pod.qos == qos]
+            if not rows:
+                continue
+            result[qos] = {
+                metric: (float(totals[rows, c][has_total[rows, c]].sum())
+                         if has_total[rows, c].any() else None)
+                for c, metric in enumerate(self.metrics)
+            }
+        return result
+
+    @classmethod
+    def from_snapshot(cls, snapshot, families=None, rates=None):
+        """Construye el árbol desde un ColumnarSnapshot.
+
+        families: {métrica: familia} de gauges (DEFAULT_FAMILIES por defecto).
+        rates: salida de RateTracker.update; si incluye CPU_FAMILY se añade
+        la métrica 'cpu_rate' (núcleos usados).
+        """
+        tree = cls()
+        codes, vocabulary = snapshot.label_codes(ID_LABEL)
+        paths = [None] * len(vocabulary)
+        for path, code in vocabulary.items():
+            paths[code] = path
+            tree.node(path)
+
+        def assign(metric, series_ids, values):
+            sid_codes = codes[series_ids]
+            keep = (sid_codes >= 0) & ~np.isnan(values)
+            tree.set_values(metric, [paths[c] for c in sid_codes[keep]], values[keep])
+
+        for metric, family in (families or DEFAULT_FAMILIES).items():
+            columns = snapshot.get(family)
+            assign(metric, columns.series_ids, columns.values)
+        if rates and CPU_FAMILY in rates:
+            cpu = rates[CPU_FAMILY]
+            assign(CPU_RATE, cpu.series_ids, cpu.rates)
+        return tree
+
+    def format(self, node=None, max_depth=None, metrics=None):
+        """Representación indentada del subárbol con los totales de cada nodo"""
+        node = self.root if node is None else node
+        metrics = metrics or self.metrics
+        lines = []
+
+        def visit(node, depth):
+            values = '  '.join(f"{m}={_fmt(self.total(node, m))}" for m in metrics)
+            label = node.kind if node.detail is None else f"{node.kind} {node.detail[:12]}"
+            lines.append(f"{'  ' * depth}{node.name[:60]} [{label}] {values}")
+            if max_depth is None or depth < max_depth:
+                for child in node.children:
+                    visit(child, depth + 1)
+
+        visit(node, 0)
+        return '\n'.join(lines)
+
+
+def _fmt(value):
+    return '-' if value is None else f"{value:.4g}"
+
+
+def main():
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'cadvisor_metrics.txt'
+    with open(filepath, encoding='utf-8') as f:
+        snapshot = ColumnarSnapshot.from_text(f.read())
+    tree = CgroupTree.from_snapshot(snapshot)
+    kubepods = next((n for n in tree.nodes if n.kind == 'kubepods'), None)
+    print(tree.format(kubepods))
+    print("\nTotales por clase QoS:")
+    for qos, totals in tree.qos_totals().items():
+        print(f"  {qos:12} " + '  '.join(f"{m}={_fmt(v)}" for m, v in totals.items()))
+    print(f"\nPods: {len(tree.pods())}, contenedores: {len(tree.containers())}, "
+          f"cgroups: {len(tree.nodes)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Snapshot columnar (NumPy) de un scrape de cAdvisor, agrupado por familia
+
+Cada familia guarda tres arrays paralelos: valores, timestamps e ids de
+serie. Las agregaciones, filtros por etiqueta y joins entre familias se
+hacen de forma vectorizada sobre esos arrays.
+
+Uso:
+    python3 columnar.py [cadvisor_metrics.txt]   # latencia de construcción y agregación
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from series_store import NO_TIMESTAMP, SeriesStore
+
+
+class FamilyColumns:
+    """Columnas de una familia: values (float64), timestamps (int64), series_ids (int64)"""
+
+    __slots__ = ('family', 'values', 'timestamps', 'series_ids')
+
+    def __init__(self, family, values, timestamps, series_ids):
+        self.family = family
+        self.values = values
+        self.timestamps = timestamps
+        self.series_ids = series_ids
+
+    def __len__(self):
+        return len(self.values)
+
+    def select(self, mask):
+        """Devuelve una nueva FamilyColumns con las filas donde mask es True"""
+        return FamilyColumns(self.family, self.values[mask],
+                             self.timestamps[mask], self.series_ids[mask])
+
+    def stats(self):
+        """count, sum, avg, min y max de los valores"""
+        values = self.values
+        if not len(values):
+            return {'count': 0, 'sum': 0.0, 'avg': None, 'min': None, 'max': None}
+        total = float(values.sum())
+        return {
+            'count': len(values),
+            'sum': total,
+            'avg': total / len(values),
+            'min': float(values.min()),
+            'max': float(values.max()),
+        }
+
+
+class ColumnarSnapshot:
+    """Scrape completo en formato columnar, indexado por nombre de familia"""
+
+    def __init__(self, store, families):
+        self.store = store
+        self.families = families
+        self._label_codes = {}
+        self._label_set_ids = None
+
+    @classmethod
+    def from_scrape(cls, scrape):
+        """Construye el snapshot a partir de un series_store.Scrape"""
+        store = scrape.store
+        sids = np.asarray(scrape.sids, dtype=np.int64)
+        values = np.asarray(scrape.values, dtype=np.float64)
+        timestamps = np.asarray(scrape.timestamps, dtype=np.int64)
+        family_codes = np.asarray(store.family_ids, dtype=np.int64)[sids]
+
+        # Ordenación estable por familia y corte en bloques contiguos
+        order = np.argsort(family_codes, kind='stable')
+        sorted_codes = family_codes[order]
+        bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(order)]))
+
+        names = {code: name for name, code in store.families.items()}
+        families = {}
+        for start, end in zip(starts, ends):
+            if start == end:
+                continue
+            rows = order[start:end]
+            name = names[int(sorted_codes[start])]
+            families[name] = FamilyColumns(name, values[rows], timestamps[rows], sids[rows])
+        return cls(store, families)
+
+    @classmethod
+    def from_text(cls, metrics_text, store=None):
+        store = store if store is not None else SeriesStore()
+        return cls.from_scrape(store.ingest_text(metrics_text))
+
+    def __getitem__(self, family):
+        return self.families[family]
+
+    def __contains__(self, family):
+        return family in self.families
+
+    def __len__(self):
+        return len(self.families)
+
+    def get(self, family):
+        """Columnas de la familia o columnas vacías si no existe"""
+        columns = self.families.get(family)
+        if columns is None:
+            empty = np.empty(0)
+            columns = FamilyColumns(family, empty, empty.astype(np.int64), empty.astype(np.int64))
+        return columns
+
+    def label_codes(self, name):
+        """Código entero del valor de la etiqueta `name` por sid (-1 si falta).
+
+        Devuelve (codes, vocabulario {valor: código}). Sólo se miran las
+        series de este snapshot: las que el SeriesStore compartido recuerda
+        de scrapes anteriores quedan a -1 y no entran en el vocabulario. Se
+        calcula una vez por snapshot y etiqueta; después los filtros son
+        comparaciones de arrays.
+        """
+        cached = self._label_codes.get(name)
+        if cached is None:
+            vocabulary = {}
+            codes = np.full(len(self.store.series), -1, dtype=np.int64)
+            if self.families:
+                sids = np.unique(np.concatenate([c.series_ids for c in self.families.values()]))
+                series = self.store.series
+                codes[sids] = np.fromiter(
+                    (-1 if (v := series[sid].labels.get(name)) is None
+                     else vocabulary.setdefault(v, len(vocabulary)) for sid in sids.tolist()),
+                    dtype=np.int64, count=len(sids))
+            cached = self._label_codes[name] = (codes, vocabulary)
+        return cached
+
+    def where(self, family, **labels):
+        """Filtra una familia por igualdad de etiquetas: where('x', id='/')"""
+        columns = self.get(family)
+        mask = np.ones(len(columns), dtype=bool)
+        for name, value in labels.items():
+            codes, vocabulary = self.label_codes(name)
+            code = vocabulary.get(value)
+            if code is None:
+                return columns.select(np.zeros(len(columns), dtype=bool))
+            mask &= codes[columns.series_ids] == code
+        return columns.select(mask)
+
+    def label_set_ids(self):
+        """Id entero del LabelSet de cada sid (mismas etiquetas => mismo id)"""
+        if self._label_set_ids is None or len(self._label_set_ids) != len(self.store.series):
+            ids = {}
+            self._label_set_ids = np.fromiter(
+                (ids.setdefault(s.labels, len(ids)) for s in self.store.series),
+                dtype=np.int64, count=len(self.store.series))
+        return self._label_set_ids
+
+    def join(self, left, right):
+        """Empareja dos familias por conjunto de etiquetas idéntico.
+
+        Devuelve (left_values, right_values, series_ids de la izquierda).
+        Si un conjunto de etiquetas se repite en una familia (_sum y _count
+        de un histograma, o una serie duplicada) se usa su primera serie.
+        """
+        lcols, rcols = self.get(left), self.get(right)
+        label_ids = self.label_set_ids()
+        # Sin assume_unique: con ids repetidos devuelve índices erróneos
+        _, li, ri = np.intersect1d(label_ids[lcols.series_ids], label_ids[rcols.series_ids],
+                                   return_indices=True)
+        return lcols.values[li], rcols.values[ri], lcols.series_ids[li]
+
+    def has_timestamps(self, family):
+        return bool((self.get(family).timestamps != NO_TIMESTAMP).any())
+
+
+def benchmark(filepath, repeat=20):
+    """Mide la construcción del snapshot y las agregaciones típicas del monitor"""
+    with open(filepath, encoding='utf-8') as f:
+        metrics_text = f.read()
+    store = SeriesStore()
+    scrape = store.ingest_text(metrics_text)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        snapshot = ColumnarSnapshot.from_scrape(scrape)
+    build_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    snapshot.label_codes('id')
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for family in snapshot.families:
+            snapshot[family].stats()
+        snapshot.where('container_memory_usage_bytes', id='/')
+        snapshot.join('container_memory_usage_bytes', 'container_spec_memory_limit_bytes')
+    query_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    return {'series': len(scrape), 'families': len(snapshot),
+            'build_ms': round(build_ms, 2), 'aggregate_ms': round(query_ms, 2)}
+
+
+def main():
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'cadvisor_metrics.txt'
+    for key, value in benchmark(filepath).items():
+        print(f"  {key:14}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Snapshots delta entre scrapes sucesivos
+
+En dos scrapes seguidos de cAdvisor la mayoría de series no cambian
+(límites, container_spec_*, cadvisor_version_info, gauges estables). En
+lugar de reescribir el dump completo, cada scrape se compara con el
+anterior por identidad de serie y sólo se escriben:
+
+- las muestras cuyo valor ha cambiado (o cuya serie es nueva)
+- las series que han desaparecido
+
+El fichero usa los mismos registros que tsdb.py (tipo | longitud | payload)
+para los esquemas 'L' y las series 'S', más un registro por scrape:
+    'D' delta: nº de scrape, hora, bajas y cambios (sid, valor, timestamp)
+    'F' completo (keyframe): igual que un delta desde un estado vacío
+La comparación es vectorial (numpy, por bits del float: NaN == NaN) y lo
+que se escribe en disco crece con los cambios, no con el nº de series.
+Los sids (como saltos) y los timestamps (relativos a la hora del scrape)
+van en arrays de ancho fijo (1, 2, 4 u 8 bytes según el máximo), así que
+codificar y decodificar tampoco tiene bucles en Python.
+
+Las muestras que no cambian de valor conservan al reconstruir el
+timestamp de su último cambio (el valor es exacto).
+
+Cada DEFAULT_KEYFRAME_EVERY scrapes se escribe un keyframe. Al reabrir el
+fichero (export_metrics.py lo hace en cada ejecución) se mapea en memoria,
+se saltan los registros por su cabecera y sólo se decodifican las series y
+los scrapes desde el último keyframe: el coste de añadir no crece con la
+longitud del histórico.
+
+Uso:
+    python3 delta_snapshots.py FICHERO.delta [N]                 # reconstruye el scrape N
+    python3 delta_snapshots.py --benchmark [cadvisor_metrics.txt] [n_scrapes] [keyframe_every]
+"""
+
+import mmap
+import os
+import sys
+import time
+
+import numpy as np
+
+from series_store import NO_TIMESTAMP, Scrape, SeriesStore
+from tsdb import (_iter_records, _open_append, _read_schema_or_series, _read_varint, _series_key,
+                  _synthetic_snapshots, _unzigzag, _write_record, _write_series, _write_varint, _zigzag)
+
+MAGIC = b'CADELTA2\n'       # v2: arrays de ancho fijo en lugar de varints por sid
+DELTA_RECORD = b'D'
+KEYFRAME_RECORD = b'F'
+# Un keyframe ocupa ≈ 2 deltas del dump de ejemplo; acota lo que se reproduce al reabrir
+DEFAULT_KEYFRAME_EVERY = 60
+
+
+class DeltaStats:
+    """Resultado de añadir un scrape: cambios, altas, bajas y bytes escritos"""
+
+    __slots__ = ('index', 'changed', 'added', 'removed', 'unchanged', 'bytes_written', 'keyframe')
+
+    def __init__(self, index, changed, added, removed, unchanged, bytes_written, keyframe):
+        self.index = index
+        self.changed = changed
+        self.added = added
+        self.removed = removed
+        self.unchanged = unchanged
+        self.bytes_written = bytes_written
+        self.keyframe = keyframe
+
+    def __repr__(self):
+        kind = 'keyframe' if self.keyframe else 'delta'
+        return (f"DeltaStats(#{self.index} {kind}: {self.changed} cambios, {self.added} altas, "
+                f"{self.removed} bajas, {self.unchanged} sin cambios, {self.bytes_written} bytes)")
+
+
+class _State:
+    """Último valor/timestamp conocido de cada serie del fichero (arrays por sid)"""
+
+    def __init__(self):
+        self.values = np.zeros(0)
+        self.timestamps = np.zeros(0, dtype=np.int64)
+        self.present = np.zeros(0, dtype=bool)
+
+    def ensure(self, n):
+        if n > len(self.present):
+            size = max(n, 2 * len(self.present))
+            for name in ('values', 'timestamps', 'present'):
+                old = getattr(self, name)
+                new = np.zeros(size, dtype=old.dtype)
+                new[:len(old)] = old
+                setattr(self, name, new)
+
+    def clear(self):
+        self.present[:] = False
+
+    def apply(self, removed, sids, values, timestamps):
+        self.present[removed] = False
+        self.ensure(int(sids.max()) + 1 if len(sids) else 0)
+        self.values[sids] = values
+        self.timestamps[sids] = timestamps
+        self.present[sids] = True
+
+
+# Ancho de los arrays de enteros de un registro (código de 1 byte delante del array)
+_WIDTHS = tuple(np.dtype(t).newbyteorder('<') for t in (np.uint8, np.uint16, np.uint32, np.uint64))
+
+
+def _pack_uints(payload, values):
+    """Enteros no negativos con el menor ancho que admite el máximo: código + array little-endian"""
+    top = int(values.max()) if len(values) else 0
+    code = next(i for i, dtype in enumerate(_WIDTHS) if top <= np.iinfo(dtype).max)
+    payload.append(code)
+    payload += values.astype(_WIDTHS[code]).tobytes()
+
+
+def _unpack_uints(data, pos, count):
+    """(array uint64, posición tras el array) de un array escrito con _pack_uints"""
+    dtype = _WIDTHS[data[pos]]
+    values = np.frombuffer(data, dtype=dtype, count=count, offset=pos + 1).astype(np.uint64)
+    return values, pos + 1 + count * dtype.itemsize
+
+
+def _encode(index, scrape_time_ms, removed, sids, values, timestamps):
+    """Payload de un registro D/F: sids ordenados como saltos y timestamps relativos, en arrays de ancho fijo"""
+    payload = bytearray()
+    _write_varint(payload, index)
+    _write_varint(payload, _zigzag(scrape_time_ms))
+    for group in (removed, sids):
+        _write_varint(payload, len(group))
+        _pack_uints(payload, np.diff(group, prepend=-1) - 1)
+    payload += values.astype('<f8').tobytes()
+    # 0 = sin timestamp; si no, zigzag(ts - hora del scrape) + 1
+    offsets = timestamps - scrape_time_ms
+    encoded = ((offsets << 1) ^ (offsets >> 63)).view(np.uint64) + np.uint64(1)
+    encoded[timestamps == NO_TIMESTAMP] = 0
+    _pack_uints(payload, encoded)
+    return payload
+
+
+def _decode(data, start, end):
+    """(nº de scrape, hora, bajas, sids, valores, timestamps) de un registro D/F"""
+    index, pos = _read_varint(data, start)
+    scrape_time_ms, pos = _read_varint(data, pos)
+    scrape_time_ms = _unzigzag(scrape_time_ms)
+    groups = []
+    for _ in range(2):
+        count, pos = _read_varint(data, pos)
+        gaps, pos = _unpack_uints(data, pos, count)
+        groups.append(np.cumsum(gaps.astype(np.int64) + 1) - 1)
+    removed, sids = groups
+    values = np.frombuffer(data, dtype='<f8', count=len(sids), offset=pos).astype(np.float64)
+    pos += 8 * len(sids)
+    encoded, pos = _unpack_uints(data, pos, len(sids))
+    shifted = encoded - np.uint64(1)
+    offsets = (shifted >> np.uint64(1)).astype(np.int64) ^ -(shifted & np.uint64(1)).astype(np.int64)
+    timestamps = np.where(encoded == 0, NO_TIMESTAMP, offsets + scrape_time_ms)
+    return index, scrape_time_ms, removed, sids, values, timestamps
+
+
+class DeltaWriter:
+    """Escritor append-only de deltas. Reabrir un fichero continúa donde se quedó.
+
+    keyframe_every: cada cuántos scrapes se escribe uno completo (0 = sólo
+    el primero); acota lo que hay que reproducir para reconstruir o para
+    reabrir, a costa de que esos scrapes guarden todas las series.
+    """
+
+    def __init__(self, path, keyframe_every=DEFAULT_KEYFRAME_EVERY):
+        self.path = path
+        self.keyframe_every = keyframe_every
+        self._sids = {}             # (nombre, tupla de etiquetas) -> sid del fichero
+        self._schemas = {}
+        self._state = _State()
+        self._store = None
+        self._epoch = 0
+        self._by_store_sid = np.zeros(0, dtype=np.int64)
+        self.count = 0              # scrapes en el fichero
+
+        valid_size = 0
+        if os.path.exists(path) and os.path.getsize(path) >= len(MAGIC):
+            with DeltaReader(path) as reader:
+                self._schemas = {names: i for i, names in enumerate(reader.schemas)}
+                for sid, (family, name, labels) in reader.series.items():
+                    self._sids[_series_key(name, labels)] = sid
+                self.count = len(reader)
+                if self.count:
+                    reader._replay(self.count - 1, self._state)
+                valid_size = reader.valid_size
+        self._file = _open_append(path, MAGIC, valid_size)
+
+    def _file_sids(self, scrape):
+        """sid del fichero de cada fila del scrape (cacheado por sid del SeriesStore)"""
+        store = scrape.store
+        if store is not self._store or store.epoch != self._epoch:
+            self._store, self._epoch = store, store.epoch
+            self._by_store_sid = np.zeros(0, dtype=np.int64)
+        store_sids = np.asarray(scrape.sids, dtype=np.int64)
+        if len(store.series) > len(self._by_store_sid):
+            known = len(self._by_store_sid)
+            mapping = np.empty(len(store.series), dtype=np.int64)
+            mapping[:known] = self._by_store_sid
+            for series in store.series[known:]:
+                key = _series_key(series.name, series.labels)
+                sid = self._sids.get(key)
+                if sid is None:
+                    sid = self._sids[key] = len(self._sids)
+                    _write_series(self._file, self._schemas, sid, series)
+                mapping[series.sid] = sid
+            self._by_store_sid = mapping
+        return self._by_store_sid[store_sids]
+
+    def append_scrape(self, scrape, scrape_time_ms=None):
+        """Añade un series_store.Scrape como delta del anterior; devuelve DeltaStats"""
+        if scrape_time_ms is None:
+            scrape_time_ms = int(time.time() * 1000)
+        offset = self._file.tell()      # bytes_written incluye los registros 'S'/'L' nuevos
+        sids = self._file_sids(scrape)
+        values = np.frombuffer(scrape.values, dtype=np.float64)
+        timestamps = np.frombuffer(scrape.timestamps, dtype=np.int64)
+        state = self._state
+        state.ensure(len(self._sids))
+        if (np.diff(sids) <= 0).any():
+            # Fuera de orden o con una serie repetida: se ordena y gana la última muestra
+            # (lo normal, sids crecientes, sólo cuesta esta comprobación)
+            sids, last = np.unique(sids[::-1], return_index=True)
+            last = len(values) - 1 - last
+            values, timestamps = values[last], timestamps[last]
+
+        new = ~state.present[sids]
+        keyframe = self.count == 0 or (self.keyframe_every and self.count % self.keyframe_every == 0)
+
+        if keyframe:
+            changed = np.ones(len(sids), dtype=bool)
+            removed = np.zeros(0, dtype=np.int64)
+        else:
+            # Comparación por bits: NaN == NaN y -0.0 != 0.0
+            changed = new | (values.view(np.int64) != state.values[sids].view(np.int64))
+            # Bajas: sólo si quedan series presentes que no vienen en este scrape
+            if int(state.present.sum()) > len(sids) - int(new.sum()):
+                current = np.zeros(len(state.present), dtype=bool)
+                current[sids] = True
+                removed = np.flatnonzero(state.present & ~current)
+            else:
+                removed = np.zeros(0, dtype=np.int64)
+
+        payload = _encode(self.count, scrape_time_ms, removed,
+                          sids[changed], values[changed], timestamps[changed])
+        _write_record(self._file, KEYFRAME_RECORD if keyframe else DELTA_RECORD, payload)
+
+        if keyframe:
+            state.clear()
+        state.apply(removed, sids[changed], values[changed], timestamps[changed])
+        added = int(new.sum())
+        stats = DeltaStats(self.count, int(changed.sum()) - added, added, len(removed),
+                           len(sids) - int(changed.sum()), self._file.tell() - offset, bool(keyframe))
+        self.count += 1
+        return stats
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DeltaReader:
+    """Lector: tabla de series + índice de registros por scrape (sin decodificar)
+
+    El fichero se mapea en memoria: de los deltas sólo se lee la cabecera
+    hasta que se reproducen.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        if self._data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} no es un fichero {MAGIC!r}")
+        self.schemas = []
+        self.series = {}            # sid -> (familia, nombre, etiquetas)
+        self.records = []           # (es keyframe, inicio, fin) por nº de scrape
+        self.valid_size = len(MAGIC)    # fin del último registro completo
+        data = self._data
+        for kind, start, end in _iter_records(data, len(MAGIC)):
+            self.valid_size = end
+            if _read_schema_or_series(kind, data, start, end, self.schemas, self.series):
+                continue
+            if kind in (DELTA_RECORD, KEYFRAME_RECORD):
+                self.records.append((kind == KEYFRAME_RECORD, start, end))
+
+    def __len__(self):
+        return len(self.records)
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def scrape_time(self, index):
+        return _decode(self._data, *self.records[index][1:])[1]
+
+    def _replay(self, index, state):
+        """Deja en `state` el scrape `index` desde el último keyframe anterior"""
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"scrape {index} fuera de rango (hay {len(self)})")
+        index %= len(self)
+        first = max(i for i in range(index + 1) if self.records[i][0])
+        state.ensure(len(self.series))
+        state.clear()
+        for is_keyframe, start, end in self.records[first:index + 1]:
+            _, _, removed, sids, values, timestamps = _decode(self._data, start, end)
+            state.apply(removed, sids, values, timestamps)
+        return state
+
+    def _to_scrape(self, state, store):
+        scrape = Scrape(store)
+        for sid in np.flatnonzero(state.present).tolist():
+            family, name, labels = self.series[sid]
+            scrape.append(store.get_series(name, labels, family),
+                          float(state.values[sid]), int(state.timestamps[sid]))
+        return scrape
+
+    def reconstruct(self, index, store=None):
+        """series_store.Scrape del scrape `index` (admite índices negativos)"""
+        return self._to_scrape(self._replay(index, _State()), store or SeriesStore())
+
+    def __iter__(self):
+        """Todos los scrapes en orden, reproduciendo cada delta una sola vez"""
+        state = _State()
+        state.ensure(len(self.series))
+        store = SeriesStore()
+        for is_keyframe, start, end in self.records:
+            _, _, removed, sids, values, timestamps = _decode(self._data, start, end)
+            if is_keyframe:
+                state.clear()
+            state.apply(removed, sids, values, timestamps)
+            yield self._to_scrape(state, store)
+
+
+# --- Benchmark ----------------------------------------------------------------------
+
+def benchmark(filepath, n_scrapes=30, out_path='/tmp/cadvisor_delta_bench.delta',
+              keyframe_every=DEFAULT_KEYFRAME_EVERY):
+    """Delta frente a reescribir el dump completo en cada scrape, con el escritor abierto y reabierto"""
+    with open(filepath, encoding='utf-8') as f:
+        metrics_text = f.read()
+    scrapes = list(_synthetic_snapshots(metrics_text, n_scrapes))
+    if os.path.exists(out_path):
+        os.remove(out_path)
+
+    full_seconds = 0.0
+    full_path = out_path + '.txt'
+    for _ in range(n_scrapes):
+        start = time.perf_counter()
+        with open(full_path, 'w', encoding='utf-8') as f:
+            f.write(metrics_text)
+        full_seconds += time.perf_counter() - start
+    os.remove(full_path)
+
+    deltas, delta_seconds = [], []
+    with DeltaWriter(out_path, keyframe_every=keyframe_every) as writer:
+        for scrape, scrape_time in scrapes:
+            start = time.perf_counter()
+            deltas.append(writer.append_scrape(scrape, scrape_time))
+            delta_seconds.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with DeltaReader(out_path) as reader:
+        rebuilt = reader.reconstruct(-1)
+    reconstruct_seconds = time.perf_counter() - start
+    last = scrapes[-1][0]
+    expected = {(s.series.name, s.series.labels): s.value for s in last}
+    ok = len(rebuilt) == len(expected) and all(
+        expected[(p.series.name, p.series.labels)] == p.value for p in rebuilt)
+
+    # Como export_metrics: un escritor por scrape (reabrir + añadir + cerrar)
+    reopen_path = out_path + '.reopen'
+    if os.path.exists(reopen_path):
+        os.remove(reopen_path)
+    reopen_seconds = []
+    for scrape, scrape_time in scrapes:
+        start = time.perf_counter()
+        with DeltaWriter(reopen_path, keyframe_every=keyframe_every) as writer:
+            writer.append_scrape(scrape, scrape_time)
+        reopen_seconds.append(time.perf_counter() - start)
+    reopen_bytes = os.path.getsize(reopen_path)
+    os.remove(reopen_path)
+    half = max(n_scrapes // 2, 1)
+
+    return {
+        'scrapes': n_scrapes,
+        'keyframe_every': keyframe_every,
+        'series': len(last),
+        'changed_per_scrape': round(sum(d.changed + d.added for d in deltas[1:]) / max(n_scrapes - 1, 1)),
+        'full_bytes': len(metrics_text.encode('utf-8')) * n_scrapes,
+        'delta_bytes': os.path.getsize(out_path),
+        'first_scrape_bytes': deltas[0].bytes_written,
+        'delta_bytes_per_scrape': round(sum(d.bytes_written for d in deltas[1:]) / max(n_scrapes - 1, 1)),
+        'full_write_ms_per_scrape': round(full_seconds / n_scrapes * 1000, 2),
+        # El primero registra todas las series ('S'/'L') y es un keyframe
+        'first_write_ms': round(delta_seconds[0] * 1000, 2),
+        'delta_write_ms_per_scrape': round(sum(delta_seconds[1:]) / max(n_scrapes - 1, 1) * 1000, 2),
+        'reopen_bytes': reopen_bytes,
+        'reopen_write_ms_1st_half': round(sum(reopen_seconds[1:half]) / max(half - 1, 1) * 1000, 2),
+        'reopen_write_ms_2nd_half': round(sum(reopen_seconds[half:]) / max(n_scrapes - half, 1) * 1000, 2),
+        'reconstruct_last_ms': round(reconstruct_seconds * 1000, 1),
+        'reconstruct_ok': ok,
+    }
+
+
+def main():
+    args = sys.argv[1:]
+    if args[:1] == ['--benchmark']:
+        filepath = args[1] if len(args) > 1 else 'cadvisor_metrics.txt'
+        n_scrapes = int(args[2]) if len(args) > 2 else 30
+        keyframe_every = int(args[3]) if len(args) > 3 else DEFAULT_KEYFRAME_EVERY
+        for key, value in benchmark(filepath, n_scrapes, keyframe_every=keyframe_every).items():
+            print(f"  {key:26}: {value}")
+        return 0
+    if not args:
+        print(f"Uso: {sys.argv[0]} FICHERO.delta [N] | --benchmark [DUMP] [n_scrapes]")
+        return 1
+    reader = DeltaReader(args[0])
+    index = int(args[1]) if len(args) > 1 else -1
+    scrape = reader.reconstruct(index)
+    print(f"{len(reader)} scrapes, {len(reader.series)} series en {args[0]}")
+    print(f"Scrape {index}: {len(scrape)} muestras (hora {reader.scrape_time(index)})")
+    for point in list(scrape)[:10]:
+        print(f"  {point.series.name}{dict(point.labels)} {point.value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
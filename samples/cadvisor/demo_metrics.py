@@ -3,12 +3,45 @@
 Script para demostrar diferentes formas de acceder a las métricas de cAdvisor
 """
 
-import requests
 import json
+import os
+import time
 from datetime import datetime
 
+from export_metrics import HISTORY_FILE
+from promql import QueryEngine, Vector, format_labels
+from scrape_cache import ScrapeCache
+
 CADVISOR_URL = "http://localhost:8080/metrics"
 
+# Una sola descarga para todas las demos, en streaming: el cuerpo se parsea
+# mientras llega y nunca está entero en memoria (ninguna demo usa el texto)
+DEMO_CACHE = ScrapeCache(stream=True)
+
+# Consultas de la demo 7 (también las usa bench_suite.py)
+PROMQL_QUERIES = {
+    'CPU': [
+        ('Uso de CPU actual', 'container_cpu_usage_seconds_total'),
+        ('Tasa de CPU (5 min)', 'rate(container_cpu_usage_seconds_total[5m])'),
+        ('CPU throttled', 'rate(container_cpu_cfs_throttled_seconds_total[5m])'),
+    ],
+    'Memoria': [
+        ('Memoria usada', 'container_memory_usage_bytes'),
+        ('Porcentaje de memoria', '(container_memory_usage_bytes / (container_spec_memory_limit_bytes > 0)) * 100'),
+        ('Working set', 'container_memory_working_set_bytes'),
+        ('Working set por namespace', 'sum by (container_label_io_kubernetes_pod_namespace) (container_memory_working_set_bytes{container_label_io_kubernetes_pod_namespace!=""})'),
+    ],
+    'Red': [
+        ('Bytes recibidos/seg', 'rate(container_network_receive_bytes_total[5m])'),
+        ('Bytes enviados/seg', 'rate(container_network_transmit_bytes_total[5m])'),
+        ('Paquetes recibidos', 'container_network_receive_packets_total'),
+    ],
+    'Filesystem': [
+        ('Uso de disco', 'container_fs_usage_bytes'),
+        ('Porcentaje disco', '(container_fs_usage_bytes / container_fs_limit_bytes) * 100'),
+    ],
+}
+
 def demo_basic_metrics():
     """Demo 1: Obtener métricas básicas"""
     print("\n" + "="*80)
@@ -16,14 +49,11 @@ def demo_basic_metrics():
     print("="*80)
     
     try:
-        response = requests.get(CADVISOR_URL)
-        metrics_text = response.text
-        
-        # Contar líneas
-        lines = [l for l in metrics_text.split('\n') if l.strip() and not l.startswith('#')]
-        metric_types = set(l.split('{')[0] for l in lines if '{' in l)
+        # Contar líneas (una sola descarga y un solo parseo para todas las demos)
+        samples = DEMO_CACHE.samples(CADVISOR_URL)
+        metric_types = set(s.name for s in samples if s.labels)
         
-        print(f"\n✓ Total de líneas de métrica: {len(lines)}")
+        print(f"\n✓ Total de líneas de métrica: {len(samples)}")
         print(f"✓ Tipos de métrica únicos: {len(metric_types)}")
         print(f"\nPrimeros 5 tipos de métrica:")
         for i, metric in enumerate(sorted(metric_types)[:5], 1):
@@ -39,22 +69,20 @@ def demo_filter_metrics():
     print("="*80)
     
     try:
-        response = requests.get(CADVISOR_URL)
-        metrics_text = response.text
+        summary = DEMO_CACHE.categories(CADVISOR_URL)
         
         filters = {
-            'CPU': 'container_cpu',
-            'Memoria': 'container_memory',
-            'Red': 'container_network',
-            'Filesystem': 'container_fs'
+            'CPU': 'cpu',
+            'Memoria': 'memory',
+            'Red': 'network',
+            'Filesystem': 'filesystem'
         }
         
         print("\nMétricas encontradas por categoría:\n")
         
-        for category, filter_str in filters.items():
-            count = len([l for l in metrics_text.split('\n') 
-                        if filter_str in l and not l.startswith('#')])
-            print(f"  {category:15} : {count:5} series")
+        for category, key in filters.items():
+            stats = summary.categories[key]
+            print(f"  {category:15} : {stats['series']:5} series en {stats['families']:3} familias")
             
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -66,23 +94,14 @@ def demo_extract_values():
     print("="*80)
     
     try:
-        response = requests.get(CADVISOR_URL)
-        metrics_text = response.text
-        
         # Buscar cadvisor_version_info
         print("\nInformación de cAdvisor:")
-        for line in metrics_text.split('\n'):
-            if 'cadvisor_version_info' in line and not line.startswith('#'):
-                print(f"\n  {line[:100]}...")
+        for sample in DEMO_CACHE.samples(CADVISOR_URL):
+            if sample.name == 'cadvisor_version_info':
+                labels = sample.labels
+                print(f"\n  {sample.name} = {sample.value}")
                 
-                # Extraer labels
-                if '{' in line:
-                    labels_part = line.split('{')[1].split('}')[0]
-                    labels = {}
-                    for pair in labels_part.split(','):
-                        k, v = pair.split('=')
-                        labels[k.strip()] = v.strip('"')
-                    
+                if labels:
                     print(f"\n  Detalles:")
                     print(f"    - Versión: {labels.get('cadvisorVersion', 'N/A')}")
                     print(f"    - Kernel: {labels.get('kernelVersion', 'N/A')}")
@@ -100,42 +119,23 @@ def demo_parse_numeric_metrics():
     print("="*80)
     
     try:
-        response = requests.get(CADVISOR_URL)
-        metrics_text = response.text
-        
-        # Buscar container_memory_usage_bytes
-        memory_values = []
-        cpu_values = []
-        
-        for line in metrics_text.split('\n'):
-            if not line.startswith('#') and line.strip():
-                if 'container_memory_usage_bytes{' in line:
-                    try:
-                        value = float(line.split('} ')[1].split()[0])
-                        memory_values.append(value)
-                    except:
-                        pass
-                
-                if 'container_cpu_usage_seconds_total{' in line:
-                    try:
-                        value = float(line.split('} ')[1].split()[0])
-                        cpu_values.append(value)
-                    except:
-                        pass
+        snapshot = DEMO_CACHE.snapshot(CADVISOR_URL)
+        memory = snapshot.get('container_memory_usage_bytes').stats()
+        cpu = snapshot.get('container_cpu_usage_seconds_total').stats()
         
         print(f"\nMemoria en contenedores:")
-        if memory_values:
-            print(f"  - Total de series: {len(memory_values)}")
-            print(f"  - Promedio: {sum(memory_values)/len(memory_values)/1024/1024:.2f} MB")
-            print(f"  - Máximo: {max(memory_values)/1024/1024:.2f} MB")
-            print(f"  - Mínimo: {min(memory_values)/1024/1024:.2f} MB")
+        if memory['count']:
+            print(f"  - Total de series: {memory['count']}")
+            print(f"  - Promedio: {memory['avg']/1024/1024:.2f} MB")
+            print(f"  - Máximo: {memory['max']/1024/1024:.2f} MB")
+            print(f"  - Mínimo: {memory['min']/1024/1024:.2f} MB")
         
         print(f"\nCPU en contenedores:")
-        if cpu_values:
-            print(f"  - Total de series: {len(cpu_values)}")
-            print(f"  - Promedio: {sum(cpu_values)/len(cpu_values):.4f} segundos")
-            print(f"  - Máximo: {max(cpu_values):.4f} segundos")
-            print(f"  - Mínimo: {min(cpu_values):.4f} segundos")
+        if cpu['count']:
+            print(f"  - Total de series: {cpu['count']}")
+            print(f"  - Promedio: {cpu['avg']:.4f} segundos")
+            print(f"  - Máximo: {cpu['max']:.4f} segundos")
+            print(f"  - Mínimo: {cpu['min']:.4f} segundos")
         
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -147,24 +147,18 @@ def demo_json_export():
     print("="*80)
     
     try:
-        response = requests.get(CADVISOR_URL)
-        metrics_text = response.text
+        counts = DEMO_CACHE.categories(CADVISOR_URL).counts()
         
         # Crear estructura JSON
         export_data = {
             'timestamp': datetime.now().isoformat(),
             'source': CADVISOR_URL,
             'summary': {
-                'total_metrics': len([l for l in metrics_text.split('\n') 
-                                     if l.strip() and not l.startswith('#')]),
-                'cpu_metrics': len([l for l in metrics_text.split('\n') 
-                                   if 'container_cpu' in l and not l.startswith('#')]),
-                'memory_metrics': len([l for l in metrics_text.split('\n') 
-                                      if 'container_memory' in l and not l.startswith('#')]),
-                'network_metrics': len([l for l in metrics_text.split('\n') 
-                                       if 'container_network' in l and not l.startswith('#')]),
-                'fs_metrics': len([l for l in metrics_text.split('\n') 
-                                  if 'container_fs' in l and not l.startswith('#')]),
+                'total_metrics': sum(counts.values()),
+                'cpu_metrics': counts['cpu'],
+                'memory_metrics': counts['memory'],
+                'network_metrics': counts['network'],
+                'fs_metrics': counts['filesystem'],
             }
         }
         
@@ -214,39 +208,39 @@ def demo_curl_examples():
         print(f"     {cmd}\n")
 
 def demo_prometheus_queries():
-    """Demo 7: Ejemplos de consultas Prometheus"""
+    """Demo 7: Ejemplos de consultas Prometheus evaluadas en local (promql.py)"""
     print("\n" + "="*80)
     print("DEMO 7: EJEMPLOS DE CONSULTAS PROMETHEUS (PromQL)")
     print("="*80)
     
-    queries = {
-        'CPU': [
-            ('Uso de CPU actual', 'container_cpu_usage_seconds_total'),
-            ('Tasa de CPU (5 min)', 'rate(container_cpu_usage_seconds_total[5m])'),
-            ('CPU throttled', 'rate(container_cpu_cfs_throttled_seconds_total[5m])'),
-        ],
-        'Memoria': [
-            ('Memoria usada', 'container_memory_usage_bytes'),
-            ('Porcentaje de memoria', '(container_memory_usage_bytes / container_memory_limit_bytes) * 100'),
-            ('Working set', 'container_memory_working_set_bytes'),
-        ],
-        'Red': [
-            ('Bytes recibidos/seg', 'rate(container_network_receive_bytes_total[5m])'),
-            ('Bytes enviados/seg', 'rate(container_network_transmit_bytes_total[5m])'),
-            ('Paquetes recibidos', 'container_network_receive_packets_total'),
-        ],
-        'Filesystem': [
-            ('Uso de disco', 'container_fs_usage_bytes'),
-            ('Porcentaje disco', '(container_fs_usage_bytes / container_fs_limit_bytes) * 100'),
-        ],
-    }
+    # Snapshot actual (caché de las demos) + histórico de export_metrics.py si existe
+    engine = QueryEngine(DEMO_CACHE.store, DEMO_CACHE.label_index())
+    engine.add_snapshot(DEMO_CACHE.snapshot(CADVISOR_URL))
+    if os.path.exists(HISTORY_FILE):
+        print(f"\nHistórico cargado: {engine.load_tsdb(HISTORY_FILE)} muestras de {HISTORY_FILE}")
     
-    print("\nConsultas por categoría:\n")
-    for category, query_list in queries.items():
+    print("\nConsultas por categoría (evaluadas en local):\n")
+    for category, query_list in PROMQL_QUERIES.items():
         print(f"  {category}:")
         for desc, query in query_list:
             print(f"    • {desc}")
-            print(f"      {query}\n")
+            print(f"      {query}")
+            start = time.perf_counter()
+            result = engine.query(query)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if not isinstance(result, Vector):
+                print(f"      = {result}  ({elapsed_ms:.1f} ms)\n")
+                continue
+            if not len(result) and query.startswith(('rate(', 'irate(', 'increase(')):
+                print(f"      (sin datos: hacen falta al menos dos scrapes en el histórico)\n")
+                continue
+            print(f"      → {len(result)} series ({elapsed_ms:.1f} ms)")
+            top = sorted(result.items(), key=lambda item: item[1], reverse=True)[:3]
+            for labels, value in top:
+                labels = {k: v for k, v in labels.items() if not k.startswith('container_label_')
+                          or k == 'container_label_io_kubernetes_pod_namespace'}
+                print(f"        {value:>16.6g}  {format_labels(labels)}")
+            print()
 
 def main():
     """Ejecutar todas las demos"""
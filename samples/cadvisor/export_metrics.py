@@ -3,14 +3,28 @@
 Script para descargar y exportar métricas de cAdvisor en varios formatos
 """
 
-import requests
+import argparse
 import json
-import re
 from pathlib import Path
 from datetime import datetime
 
+import numpy as np
+
+from delta_snapshots import DeltaWriter
+from label_index import LabelIndex, matcher
+from pod_metadata import (KubectlFileProvider, KubectlProvider, PodEnricher, PodMetadataCache,
+                          readable_name)
+from scrape_cache import SCRAPE_CACHE
+from self_metrics import SELF_METRICS
+from series_store import NO_TIMESTAMP, Point
+from stream_export import default_writers, export_samples
+from tsdb import TSDBWriter
+
 CADVISOR_URL = "http://localhost:8080/metrics"
 OUTPUT_DIR = "/home/rojaldo/cursos/contenedores/repo/samples/cadvisor/metrics_export"
+HISTORY_FILE = f"{OUTPUT_DIR}/cadvisor_history.tsdb"
+DELTA_FILE = f"{OUTPUT_DIR}/cadvisor_snapshots.delta"
+SELF_METRICS_FILE = f"{OUTPUT_DIR}/self_metrics.json"
 
 def create_output_dir():
     """Crea el directorio de salida si no existe"""
@@ -18,9 +32,7 @@ def create_output_dir():
 
 def fetch_metrics():
     """Obtiene las métricas de cAdvisor"""
-    response = requests.get(CADVISOR_URL)
-    response.raise_for_status()
-    return response.text
+    return SCRAPE_CACHE.text(CADVISOR_URL)
 
 def save_raw_metrics(metrics_text):
     """Guarda las métricas en formato Prometheus raw"""
@@ -29,48 +41,83 @@ def save_raw_metrics(metrics_text):
         f.write(metrics_text)
     return filepath
 
-def extract_container_metrics(metrics_text):
-    """Extrae métricas específicas de contenedores"""
+def append_history(scrape):
+    """Añade el scrape al histórico comprimido (append-only, estilo Gorilla)"""
+    with TSDBWriter(HISTORY_FILE) as writer:
+        writer.append_scrape(scrape)
+    return HISTORY_FILE
+
+def append_delta(scrape):
+    """Añade el scrape como delta del anterior (sólo cambios, altas y bajas)"""
+    with DeltaWriter(DELTA_FILE) as writer:
+        return writer.append_scrape(scrape)
+
+def save_streaming_exports(samples):
+    """Exporta todas las series en streaming: NDJSON, CSV por familia y Parquet si hay pyarrow
+
+    `samples` son las del parseo ya hecho por SCRAPE_CACHE (no se vuelve a parsear el cuerpo).
+    """
+    writers = default_writers(OUTPUT_DIR)
+    try:
+        count = export_samples(samples, writers)
+    finally:
+        for writer in writers:
+            writer.close()
+    return count, writers
+
+# Series de contenedores: cgroup id que contiene kubepods o container
+CONTAINER_MATCHER = matcher('id', '=~', '.*(kubepods|container).*')
+
+@SELF_METRICS.timed('extract_container_metrics')
+def extract_container_metrics(scrape, label_index=None):
+    """Extrae métricas específicas de contenedores
+    
+    Recibe un series_store.Scrape; cada muestra es un series_store.Point y
+    las etiquetas se comparten entre muestras y entre scrapes. Las series de
+    contenedores se seleccionan con el índice invertido de etiquetas.
+    """
     container_data = {}
+    if label_index is None:
+        if scrape.store is SCRAPE_CACHE.store:
+            label_index = SCRAPE_CACHE.label_index()
+        else:
+            label_index = LabelIndex(scrape.store)
     
-    # Regex para parsear líneas Prometheus
-    pattern = r'(\w+)\{([^}]+)\}\s+([\d.e+-]+)\s+(\d+)?'
+    # Filas del scrape cuyas series son de contenedores
+    container_sids = label_index.select([CONTAINER_MATCHER])
+    rows = np.flatnonzero(np.isin(np.asarray(scrape.sids), container_sids))
+    series = scrape.store.series
+    SELF_METRICS.set_series('extract_container_metrics', len(rows))
     
-    for line in metrics_text.split('\n'):
-        if line.startswith('#') or not line.strip():
-            continue
+    for row in rows:
+        timestamp = scrape.timestamps[row]
+        point = Point(series[scrape.sids[row]], scrape.values[row],
+                      None if timestamp == NO_TIMESTAMP else timestamp)
+        container_id = point.labels['id']
+        metric_name = point.series.name
+        if container_id not in container_data:
+            container_data[container_id] = {}
+        
+        if metric_name not in container_data[container_id]:
+            container_data[container_id][metric_name] = []
         
-        match = re.match(pattern, line)
-        if match:
-            metric_name, labels_str, value, timestamp = match.groups()
-            
-            # Parsear labels
-            labels = {}
-            for label_pair in labels_str.split(','):
-                if '=' in label_pair:
-                    k, v = label_pair.split('=', 1)
-                    labels[k.strip()] = v.strip('"')
-            
-            # Filtrar métricas de contenedores
-            container_id = labels.get('id', '')
-            if 'kubepods' in container_id or 'container' in container_id:
-                if container_id not in container_data:
-                    container_data[container_id] = {}
-                
-                if metric_name not in container_data[container_id]:
-                    container_data[container_id][metric_name] = []
-                
-                container_data[container_id][metric_name].append({
-                    'labels': labels,
-                    'value': float(value),
-                    'timestamp': int(timestamp) if timestamp else None
-                })
+        container_data[container_id][metric_name].append(point)
     
     return container_data
 
-def save_container_metrics(container_data):
-    """Guarda métricas de contenedores en JSON"""
+def save_container_metrics(container_data, enricher=None):
+    """Guarda métricas de contenedores en JSON
+    
+    Con un pod_metadata.PodEnricher, cada contenedor se guarda como
+    namespace/pod/contenedor (con la ruta del cgroup en 'cgroup') en lugar
+    de por la ruta.
+    """
     filepath = f"{OUTPUT_DIR}/container_metrics.json"
+    identities = {}
+    if enricher is not None:
+        first_labels = {path: next(iter(metrics.values()))[0].labels
+                        for path, metrics in container_data.items() if metrics}
+        identities = enricher.identities(container_data.keys(), first_labels.get)
     
     # Convertir a formato serializable
     output = {
@@ -80,47 +127,57 @@ def save_container_metrics(container_data):
     }
     
     for container_id, metrics in container_data.items():
-        output['containers'][container_id] = {
+        identity = identities.get(container_id)
+        key = readable_name(identity, container_id)
+        if key in output['containers']:
+            key = container_id
+        entry = output['containers'][key] = {}
+        if identity is not None and identity.pod:
+            entry.update({'cgroup': container_id, 'namespace': identity.namespace, 'pod': identity.pod,
+                          'container': identity.container, 'pod_uid': identity.pod_uid,
+                          'workload': identity.workload})
+        entry.update({
             'metric_count': len(metrics),
             'metric_types': list(metrics.keys()),
             'metrics_summary': {
                 name: {
                     'count': len(values),
-                    'sample_value': values[0]['value'] if values else None
+                    'sample_value': values[0].value if values else None
                 }
                 for name, values in metrics.items()
             }
-        }
+        })
     
     with open(filepath, 'w') as f:
         json.dump(output, f, indent=2, ensure_ascii=False)
     
     return filepath
 
-def extract_specific_metrics(metrics_text):
+def extract_specific_metrics(samples):
     """Extrae métricas específicas más útiles"""
     metrics = {}
     
-    # Patrones para encontrar métricas específicas
-    patterns = {
-        'cadvisor_version': r'cadvisor_version_info.*',
-        'cpu_usage': r'container_cpu_usage_seconds_total.*',
-        'memory_usage': r'container_memory_usage_bytes.*',
-        'memory_limit': r'container_memory_limit_bytes.*',
-        'network_rx': r'container_network_receive_bytes_total.*',
-        'network_tx': r'container_network_transmit_bytes_total.*',
-        'fs_usage': r'container_fs_usage_bytes.*'
+    # Familias a buscar
+    families = {
+        'cadvisor_version': 'cadvisor_version_info',
+        'cpu_usage': 'container_cpu_usage_seconds_total',
+        'memory_usage': 'container_memory_usage_bytes',
+        'memory_limit': 'container_memory_limit_bytes',
+        'network_rx': 'container_network_receive_bytes_total',
+        'network_tx': 'container_network_transmit_bytes_total',
+        'fs_usage': 'container_fs_usage_bytes'
     }
+    keys = {family: key for key, family in families.items()}
     
-    for key, pattern in patterns.items():
-        matches = re.findall(pattern, metrics_text)
-        if matches:
-            metrics[key] = {
-                'count': len(matches),
-                'sample': matches[0] if matches else None
-            }
+    for sample in samples:
+        key = keys.get(sample.family)
+        if key is None:
+            continue
+        if key not in metrics:
+            metrics[key] = {'count': 0, 'sample': sample}
+        metrics[key]['count'] += 1
     
-    return metrics
+    return {key: metrics[key] for key in families if key in metrics}
 
 def create_readme():
     """Crea un README con instrucciones de uso"""
@@ -133,9 +190,15 @@ sobre el uso de recursos de contenedores en Kubernetes.
 
 ## Archivos
 
-- **cadvisor_metrics_raw.txt**: Métricas en formato Prometheus raw
-- **container_metrics.json**: Métricas estructuradas de contenedores en JSON
+- **cadvisor_metrics_raw.txt**: Métricas en formato Prometheus raw (último scrape)
+- **cadvisor_history.tsdb**: Histórico comprimido de todos los scrapes (ver tsdb.py)
+- **cadvisor_snapshots.delta**: Cada scrape como delta del anterior; cualquier snapshot se reconstruye con delta_snapshots.py
+- **container_metrics.json**: Métricas estructuradas de contenedores en JSON (con --pods o --kubectl, por namespace/pod/contenedor; ver pod_metadata.py)
+- **cadvisor_metrics.ndjson**: Todas las series (nombre, etiquetas, valor, timestamp), una por línea
+- **csv/**: Un CSV por familia de métricas (una columna por etiqueta)
+- **parquet/**: Un Parquet por familia (sólo si pyarrow está instalado)
 - **cadvisor_metrics_summary.json**: Resumen de tipos de métricas disponibles
+- **self_metrics.json**: Coste de la exportación por etapa (fetch, decode, parse...; ver self_metrics.py)
 
 ## Cómo usar las métricas
 
@@ -211,7 +274,29 @@ Luego accede a:
     
     return filepath
 
+def export_delta():
+    """Modo delta: sólo se añade al fichero de deltas lo que ha cambiado"""
+    create_output_dir()
+    stats = append_delta(SCRAPE_CACHE.scrape(CADVISOR_URL))
+    print(f"✓ Scrape #{stats.index} -> {DELTA_FILE}")
+    print(f"  {stats.changed} cambios, {stats.added} altas, {stats.removed} bajas, "
+          f"{stats.unchanged} sin cambios ({stats.bytes_written} bytes escritos)")
+    print(f"  {SCRAPE_CACHE.transfer_summary(CADVISOR_URL)}")
+
 def main():
+    parser = argparse.ArgumentParser(description="Exporta las métricas de cAdvisor en varios formatos")
+    parser.add_argument('--delta', action='store_true',
+                        help="sólo añadir el scrape como delta del anterior (sin reescribir el dump)")
+    pods = parser.add_mutually_exclusive_group()
+    pods.add_argument('--pods', metavar='FICHERO',
+                      help="`kubectl get pods -A -o json` para nombrar los contenedores por pod")
+    pods.add_argument('--kubectl', action='store_true',
+                      help="resolver los pods con kubectl (en lugar de --pods)")
+    args = parser.parse_args()
+    if args.delta:
+        export_delta()
+        return
+    
     print("Exportando métricas de cAdvisor...\n")
     
     create_output_dir()
@@ -220,26 +305,47 @@ def main():
     # Obtener métricas
     print("Descargando métricas...")
     metrics_text = fetch_metrics()
-    print(f"✓ {len(metrics_text)} bytes descargados\n")
+    print(f"✓ {len(metrics_text)} bytes descargados")
+    print(f"  {SCRAPE_CACHE.transfer_summary(CADVISOR_URL)}\n")
     
     # Guardar métricas raw
     print("Exportando en diferentes formatos...")
     filepath1 = save_raw_metrics(metrics_text)
     print(f"  1. Prometheus raw: {filepath1}")
     
+    # Añadir al histórico comprimido
+    scrape = SCRAPE_CACHE.scrape(CADVISOR_URL)
+    history = append_history(scrape)
+    print(f"     Histórico: {history}")
+    delta = append_delta(scrape)
+    print(f"     Delta: {DELTA_FILE} (#{delta.index}, {delta.bytes_written} bytes)")
+    
+    # Exportación completa en streaming (sin construir el resultado en memoria)
+    count, writers = save_streaming_exports(SCRAPE_CACHE.samples(CADVISOR_URL))
+    print(f"     Streaming: {count} series -> " + ", ".join(
+        getattr(w, 'path', None) or w.directory for w in writers))
+    
     # Extraer y guardar métricas de contenedores
-    container_data = extract_container_metrics(metrics_text)
-    filepath2 = save_container_metrics(container_data)
+    container_data = extract_container_metrics(scrape)
+    enricher = None
+    if args.pods or args.kubectl:
+        provider = KubectlFileProvider(args.pods) if args.pods else KubectlProvider()
+        enricher = PodEnricher(PodMetadataCache(provider))
+    filepath2 = save_container_metrics(container_data, enricher)
     print(f"  2. Contenedores JSON: {filepath2}")
     
     # Extraer métricas específicas
-    specific = extract_specific_metrics(metrics_text)
+    specific = extract_specific_metrics(SCRAPE_CACHE.samples(CADVISOR_URL))
     print(f"  3. Métricas específicas encontradas: {len(specific)}")
     
     # Crear README
     filepath3 = create_readme()
     print(f"  4. Documentación: {filepath3}")
     
+    # Coste de la propia exportación (fetch, decode, parse... por etapa)
+    filepath4 = SELF_METRICS.save_json(SELF_METRICS_FILE)
+    print(f"  5. Auto-instrumentación: {filepath4}")
+    
     # Resumen
     print("\n" + "="*80)
     print("RESUMEN DE EXPORTACIÓN")
@@ -3,61 +3,70 @@
 Script para extraer y analizar métricas de cAdvisor
 """
 
+import argparse
 import requests
 import json
 from collections import defaultdict
 from datetime import datetime
 
+from metric_categories import summarize_text
+from offline_index import DumpIndex
+from parallel_parse import parse_file, parse_text_parallel
+from prom_parser import ParseFilter, parse_text
+from scrape_cache import SCRAPE_CACHE
+from self_metrics import SELF_METRICS
+
 CADVISOR_URL = "http://localhost:8080/metrics"
 
+# Familias que usa extract_key_metrics (en modo offline sólo se leen estas)
+KEY_FAMILIES = [
+    'cadvisor_version_info',
+    'container_cpu_cfs_periods_total',
+    'container_cpu_cfs_throttled_periods_total',
+    'container_cpu_load_average_10s',
+    'container_memory_usage_bytes',
+    'container_memory_limit_bytes',
+    'container_memory_working_set_bytes',
+    'container_network_receive_bytes_total',
+    'container_network_transmit_bytes_total',
+    'container_network_receive_packets_total',
+    'container_network_transmit_packets_total',
+    'container_fs_usage_bytes',
+    'container_fs_limit_bytes',
+]
+
 def fetch_metrics():
     """Obtiene las métricas de cAdvisor en formato Prometheus"""
     try:
-        response = requests.get(CADVISOR_URL)
-        response.raise_for_status()
-        return response.text
+        return SCRAPE_CACHE.text(CADVISOR_URL)
     except requests.exceptions.RequestException as e:
         print(f"Error fetching metrics: {e}")
         return None
 
-def parse_prometheus_metrics(metrics_text):
-    """Parsea métricas en formato Prometheus"""
+@SELF_METRICS.timed('parse_prometheus_metrics')
+def parse_prometheus_metrics(metrics_text, families=None, jobs=1):
+    """Parsea métricas en formato Prometheus
+    
+    Con `families` (p.ej. KEY_FAMILIES) el resto de familias se salta sin
+    tokenizar; las etiquetas vacías no se crean en ningún caso.
+    Con jobs > 1 (o None = nº de CPUs) se parsea por familias en varios
+    procesos (parallel_parse.py), para dumps de cientos de MB.
+    """
+    parse_filter = ParseFilter(include=families, drop_empty_labels=True)
+    if jobs != 1:
+        return parse_text_parallel(metrics_text, jobs, parse_filter).grouped()
+    return group_samples(parse_text(metrics_text, None, parse_filter))
+
+@SELF_METRICS.timed('group_samples')
+def group_samples(samples):
+    """Agrupa muestras parseadas por nombre de métrica"""
     metrics = defaultdict(list)
     
-    for line in metrics_text.split('\n'):
-        line = line.strip()
-        
-        # Saltar comentarios y líneas vacías
-        if not line or line.startswith('#'):
-            continue
-        
-        # Parsear métrica
-        try:
-            if '{' in line:
-                metric_name = line.split('{')[0]
-                labels_part = line.split('{')[1].split('}')[0]
-                value_part = line.split('} ')[1].split(' ')
-                value = float(value_part[0])
-                timestamp = int(value_part[1]) if len(value_part) > 1 else None
-                
-                metrics[metric_name].append({
-                    'labels': labels_part,
-                    'value': value,
-                    'timestamp': timestamp
-                })
-            else:
-                parts = line.split()
-                if len(parts) >= 2:
-                    metric_name = parts[0]
-                    value = float(parts[1])
-                    timestamp = int(parts[2]) if len(parts) > 2 else None
-                    
-                    metrics[metric_name].append({
-                        'value': value,
-                        'timestamp': timestamp
-                    })
-        except (ValueError, IndexError):
-            pass
+    for sample in samples:
+        entry = {'value': sample.value, 'timestamp': sample.timestamp}
+        if sample.labels:
+            entry['labels'] = sample.labels
+        metrics[sample.name].append(entry)
     
     return metrics
 
@@ -125,24 +134,22 @@ def print_summary(metrics):
     
     print("\n" + "="*80)
 
-def save_metrics_json(metrics_text, filepath):
-    """Guarda las métricas en un archivo JSON formateado"""
+def save_metrics_json(metrics_text, filepath, summary=None):
+    """Guarda las métricas en un archivo JSON formateado
+    
+    Los recuentos salen de metric_categories: cada familia se clasifica una
+    vez por su nombre y su # TYPE / # HELP (sin buscar subcadenas por línea).
+    """
     try:
-        # Parsear y contar métricas
-        lines = [l.strip() for l in metrics_text.split('\n') if l.strip() and not l.strip().startswith('#')]
+        if summary is None:
+            summary = summarize_text(metrics_text)
         
         output = {
             'timestamp': datetime.now().isoformat(),
-            'total_metric_lines': len(lines),
+            'total_metric_lines': summary.total_series,
             'cadvisor_url': CADVISOR_URL,
-            'metric_types': {
-                'cpu': len([l for l in lines if 'cpu' in l.lower()]),
-                'memory': len([l for l in lines if 'memory' in l.lower()]),
-                'network': len([l for l in lines if 'network' in l.lower()]),
-                'filesystem': len([l for l in lines if 'fs' in l.lower()]),
-                'disk': len([l for l in lines if 'disk' in l.lower()]),
-                'accelerator': len([l for l in lines if 'accelerator' in l.lower()])
-            }
+            'metric_types': summary.counts(),
+            'categories': summary.categories,
         }
         
         with open(filepath, 'w') as f:
@@ -154,15 +161,60 @@ def save_metrics_json(metrics_text, filepath):
         print(f"Error guardando métricas: {e}")
         return None
 
+def analyze_dump(filepath, families=(), jobs=1):
+    """Modo offline: analiza un dump leyendo sólo las familias necesarias
+    
+    Con jobs > 1 el dump se parsea por trozos en varios procesos (para
+    dumps de varios nodos, donde cada familia aparece muchas veces).
+    """
+    wanted = KEY_FAMILIES + [f for f in families if f not in KEY_FAMILIES]
+    if jobs != 1:
+        parsed = parse_file(filepath, jobs, ParseFilter(include=wanted, drop_empty_labels=True))
+        print(f"✓ Dump parseado en {len(parsed.chunk_seconds)} trozos: {len(parsed)} series")
+        metrics = parsed.grouped()
+    else:
+        with DumpIndex(filepath) as index:
+            read_bytes = sum(index.slice_bytes(f) for f in wanted)
+            print(f"✓ Dump indexado: {len(index.ranges)} familias ({index.index_path})")
+            print(f"  Leyendo {read_bytes} bytes de {index.size}")
+            
+            metrics = group_samples(index.samples(wanted, parse_filter=ParseFilter(drop_empty_labels=True)))
+    
+    print_summary(extract_key_metrics(metrics))
+    
+    for family in families:
+        entries = metrics.get(family, [])
+        print(f"\n{family}: {len(entries)} series")
+        for entry in entries[:10]:
+            labels = entry.get('labels', {})
+            print(f"  {labels.get('id', '') or labels}  {entry['value']}")
+        if len(entries) > 10:
+            print(f"  ... ({len(entries) - 10} más)")
+
 def main():
+    parser = argparse.ArgumentParser(description="Extrae y analiza métricas de cAdvisor")
+    parser.add_argument('--file', help="analizar un dump existente en lugar del endpoint")
+    parser.add_argument('--family', action='append', default=[],
+                        help="familia a mostrar en modo offline (repetible)")
+    parser.add_argument('--self-metrics', metavar='FICHERO',
+                        help="guardar el coste por etapa (fetch, decode, parse...) en JSON")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="procesos para parsear --file (0 = uno por CPU)")
+    args = parser.parse_args()
+    
+    if args.file:
+        analyze_dump(args.file, args.family, args.jobs or None)
+        return
+    
     print("Conectando a cAdvisor...")
     metrics_text = fetch_metrics()
     
     if metrics_text:
         print(f"✓ Métricas obtenidas correctamente ({len(metrics_text)} bytes)")
+        print(f"  {SCRAPE_CACHE.transfer_summary(CADVISOR_URL)}")
         
-        # Parsear métricas
-        metrics = parse_prometheus_metrics(metrics_text)
+        # Parsear métricas (un único parseo compartido con el resumen por categorías)
+        metrics = group_samples(SCRAPE_CACHE.samples(CADVISOR_URL))
         print(f"✓ {len(metrics)} tipos de métricas diferentes encontrados")
         
         # Extraer métricas clave
@@ -173,11 +225,15 @@ def main():
         
         # Guardar en JSON
         output = save_metrics_json(metrics_text, 
-                                   '/home/rojaldo/cursos/contenedores/repo/samples/cadvisor/cadvisor_metrics_summary.json')
+                                   '/home/rojaldo/cursos/contenedores/repo/samples/cadvisor/cadvisor_metrics_summary.json',
+                                   SCRAPE_CACHE.categories(CADVISOR_URL))
         
         if output:
             print("\nDetalles del resumen:")
             print(json.dumps(output, indent=2, ensure_ascii=False))
+        
+        if args.self_metrics:
+            print(f"\n✓ Auto-instrumentación: {SELF_METRICS.save_json(args.self_metrics)}")
     else:
         print("✗ No se pudieron obtener las métricas")
 
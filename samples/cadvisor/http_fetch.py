@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Capa HTTP para descargar /metrics de cAdvisor
+
+- Sesión requests con pool de conexiones keep-alive (sin handshake TCP por poll)
+- Negocia Accept-Encoding: gzip
+- Timeouts de conexión y lectura acotados
+- Reintentos con backoff exponencial en errores de conexión y 429/5xx
+- Informa de bytes en la red frente a bytes decodificados en cada scrape
+  y del tiempo de descompresión + decodificación por separado
+- stream(): el cuerpo llega como líneas a medida que se descarga
+  (gunzip y UTF-8 incrementales), sin tener nunca el payload entero en
+  memoria; el parser (prom_parser.iter_samples) trabaja mientras llegan
+  los siguientes trozos
+"""
+
+import codecs
+import time
+import zlib
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError
+from urllib3.util.retry import Retry
+
+# (conexión, lectura) en segundos
+DEFAULT_TIMEOUT = (3.05, 15.0)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+# Bytes leídos del socket por trozo y máximo descomprimido de una vez
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_DECOMPRESSED_CHUNK = 256 * 1024
+
+
+class FetchResult:
+    """Resultado de un scrape: cuerpo decodificado y contadores de transferencia"""
+
+    __slots__ = ('url', 'status', 'text', 'headers', 'wire_bytes', 'decoded_bytes', 'elapsed',
+                 'decode_seconds')
+
+    def __init__(self, url, status, text, headers, wire_bytes, decoded_bytes, elapsed,
+                 decode_seconds=0.0):
+        self.url = url
+        self.status = status
+        self.text = text
+        self.headers = headers
+        self.wire_bytes = wire_bytes
+        self.decoded_bytes = decoded_bytes
+        self.elapsed = elapsed
+        # Parte de elapsed dedicada a gunzip + bytes -> str
+        self.decode_seconds = decode_seconds
+
+    @property
+    def content_encoding(self):
+        return self.headers.get('Content-Encoding', 'identity')
+
+    def summary(self):
+        """Línea legible: bytes en la red / decodificados y tiempo"""
+        if self.status == 304:
+            return f"304 Not Modified ({self.wire_bytes} bytes) en {self.elapsed * 1000:.0f} ms"
+        ratio = self.decoded_bytes / self.wire_bytes if self.wire_bytes else 0
+        return (f"{self.wire_bytes} bytes en la red ({self.content_encoding}), "
+                f"{self.decoded_bytes} decodificados (x{ratio:.1f}) en {self.elapsed * 1000:.0f} ms")
+
+
+def _decompress(raw, content_encoding):
+    """Cuerpo sin Content-Encoding (sólo se negocia gzip; deflate por si acaso)"""
+    if content_encoding.lower() in ('gzip', 'x-gzip', 'deflate'):
+        try:
+            # wbits 32+: detecta cabecera gzip o zlib
+            return zlib.decompress(raw, zlib.MAX_WBITS | 32)
+        except zlib.error as e:
+            raise requests.exceptions.ContentDecodingError(e) from e
+    return raw
+
+
+def _body_encoding(response):
+    # El formato de exposición es UTF-8 salvo que se indique otro charset
+    if 'charset=' in response.headers.get('Content-Type', ''):
+        return response.encoding
+    return 'utf-8'
+
+
+class StreamedBody:
+    """Cuerpo de una respuesta leído por trozos: lines() genera las líneas según llegan
+
+    Los contadores (wire_bytes, decoded_bytes, decode_seconds, elapsed y
+    first_line_seconds, desde el inicio de la petición) se completan al
+    agotar lines(); result() los devuelve como un FetchResult sin texto.
+    """
+
+    def __init__(self, url, response, start, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.url = url
+        self.response = response
+        self.status = response.status_code
+        self.headers = response.headers
+        self.chunk_size = chunk_size
+        self.start = start
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self.decode_seconds = 0.0
+        self.first_line_seconds = None
+        self.elapsed = 0.0
+
+    def _decoded_chunks(self):
+        """Texto decodificado, trozo a trozo (nunca más de MAX_DECOMPRESSED_CHUNK bytes)"""
+        encoding = self.headers.get('Content-Encoding', 'identity').lower()
+        decompressor = (zlib.decompressobj(zlib.MAX_WBITS | 32)
+                        if encoding in ('gzip', 'x-gzip', 'deflate') else None)
+        decoder = codecs.getincrementaldecoder(_body_encoding(self.response))(errors='replace')
+        for raw in self.response.raw.stream(self.chunk_size, decode_content=False):
+            self.wire_bytes += len(raw)
+            while raw:
+                started = time.perf_counter()
+                if decompressor is not None:
+                    data = decompressor.decompress(raw, MAX_DECOMPRESSED_CHUNK)
+                    raw = decompressor.unconsumed_tail
+                else:
+                    data, raw = raw, b''
+                self.decoded_bytes += len(data)
+                text = decoder.decode(data)
+                self.decode_seconds += time.perf_counter() - started
+                yield text
+        tail = decompressor.flush() if decompressor is not None else b''
+        self.decoded_bytes += len(tail)
+        yield decoder.decode(tail, final=True)
+
+    def lines(self):
+        """Líneas del cuerpo (sin '\\n'); la conexión vuelve al pool al terminar"""
+        if self.status == 304:
+            self.close()
+            return
+        pending = ''
+        completed = False
+        try:
+            for text in self._decoded_chunks():
+                if '\n' not in text:
+                    pending += text
+                    continue
+                lines = (pending + text).split('\n')
+                pending = lines.pop()
+                if self.first_line_seconds is None:
+                    self.first_line_seconds = time.perf_counter() - self.start
+                yield from lines
+            if pending:
+                yield pending
+            completed = True
+        except zlib.error as e:
+            raise requests.exceptions.ContentDecodingError(e) from e
+        except (OSError, HTTPError) as e:
+            raise requests.exceptions.ConnectionError(e) from e
+        finally:
+            self.elapsed = time.perf_counter() - self.start
+            if completed:
+                # Cuerpo leído completo: la conexión vuelve al pool (keep-alive)
+                self.response.raw.release_conn()
+            else:
+                self.close()
+
+    __iter__ = lines
+
+    def result(self):
+        """FetchResult (text None) con los contadores de la descarga"""
+        return FetchResult(self.url, self.status, None, self.headers, self.wire_bytes,
+                           self.decoded_bytes, self.elapsed, self.decode_seconds)
+
+    def close(self):
+        self.elapsed = self.elapsed or time.perf_counter() - self.start
+        self.response.close()
+
+
+class MetricsFetcher:
+    """Cliente reutilizable para /metrics (una instancia por proceso)"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, pool_maxsize=10):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip'
+
+        retry = Retry(total=retries, connect=retries, read=retries,
+                      backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize,
+                              max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, url, headers=None):
+        """Descarga url y devuelve un FetchResult (status 304 => text None)"""
+        start = time.perf_counter()
+        response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+        try:
+            if response.status_code != 304:
+                response.raise_for_status()
+            # Sin descomprimir aquí: así se mide la descompresión aparte
+            raw = response.raw.read(decode_content=False)
+            wire_bytes = len(raw)
+        except requests.exceptions.HTTPError:
+            # Antes que OSError: requests.HTTPError es subclase de OSError
+            response.close()
+            raise
+        except (OSError, HTTPError) as e:
+            response.close()
+            raise requests.exceptions.ConnectionError(e) from e
+        # Cuerpo leído completo: la conexión vuelve al pool (keep-alive)
+        response.raw.release_conn()
+
+        if response.status_code == 304:
+            return FetchResult(url, 304, None, response.headers, wire_bytes, 0,
+                               time.perf_counter() - start)
+
+        decode_start = time.perf_counter()
+        body = _decompress(raw, response.headers.get('Content-Encoding', 'identity'))
+        text = body.decode(_body_encoding(response), errors='replace')
+        end = time.perf_counter()
+        return FetchResult(url, response.status_code, text, response.headers,
+                           wire_bytes, len(body), end - start, end - decode_start)
+
+    def stream(self, url, headers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Inicia la descarga de url y devuelve un StreamedBody (status 304 => sin líneas)"""
+        start = time.perf_counter()
+        response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+        if response.status_code != 304:
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError:
+                response.close()
+                raise
+        return StreamedBody(url, response, start, chunk_size)
+
+    def close(self):
+        self.session.close()
+
+
+# Cliente compartido por los scripts de este directorio
+DEFAULT_FETCHER = MetricsFetcher()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Índice invertido (etiqueta, valor) -> bitmap de ids de serie
+
+Cubre todas las etiquetas de las series de un SeriesStore (id,
+container_label_io_kubernetes_pod_name, ..._pod_namespace, image, name...)
+y el nombre de la métrica como __name__. Cada posting es la lista ordenada
+de sids; el bitmap (un int de Python, un bit por sid) se construye la
+primera vez que se usa y se cachea.
+
+Matchers al estilo Prometheus: =, !=, =~ y !~ (regex ancladas). Una
+etiqueta ausente equivale a valor "". Las regex se evalúan sobre los
+valores distintos de la etiqueta, no sobre las series, así que una
+selección cuesta en función de los postings implicados y no del total.
+
+Uso:
+    python3 label_index.py [cadvisor_metrics.txt] [n_nodos]   # latencia frente a escaneo lineal
+"""
+
+import re
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+from prom_parser import parse_text
+from series_store import SeriesStore
+
+NAME_LABEL = '__name__'
+
+Matcher = namedtuple('Matcher', ['name', 'op', 'value', 'regex'])
+Matcher.__doc__ = """Matcher de etiqueta: op es '=', '!=', '=~' o '!~'"""
+
+_SELECTOR_RE = re.compile(r'\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*(=~|!~|!=|=)\s*"((?:[^"\\]|\\.)*)"\s*(,|$)')
+
+
+def _unescape(value):
+    """Deshace los escapes de un literal de cadena (\\\\, \\" y \\n)"""
+    return re.sub(r'\\(.)', lambda m: {'n': '\n', '\\': '\\', '"': '"'}.get(
+        m.group(1), '\\' + m.group(1)), value)
+
+
+def matcher(name, op, value):
+    """Crea un Matcher (compila la regex si hace falta)"""
+    if op not in ('=', '!=', '=~', '!~'):
+        raise ValueError(f"operador no soportado: {op}")
+    regex = re.compile(value) if op in ('=~', '!~') else None
+    return Matcher(name, op, value, regex)
+
+
+def parse_selector(selector):
+    """'nombre{a="x",b=~"y.*"}' o '{...}' -> lista de Matcher"""
+    selector = selector.strip()
+    matchers = []
+    brace = selector.find('{')
+    name = selector if brace == -1 else selector[:brace].strip()
+    if name:
+        matchers.append(matcher(NAME_LABEL, '=', name))
+    if brace != -1:
+        if not selector.endswith('}'):
+            raise ValueError(f"selector sin cerrar: {selector}")
+        body = selector[brace + 1:-1].strip()
+        pos = 0
+        while pos < len(body):
+            m = _SELECTOR_RE.match(body, pos)
+            if m is None:
+                raise ValueError(f"matcher inválido en: {body[pos:]}")
+            value = _unescape(m.group(3))
+            matchers.append(matcher(m.group(1), m.group(2), value))
+            pos = m.end()
+    return matchers
+
+
+def sids_to_bitmap(sids, n_series):
+    bits = np.zeros(n_series, dtype=np.uint8)
+    bits[np.asarray(sids, dtype=np.int64)] = 1
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little')
+
+
+def bitmap_to_sids(bitmap, n_series):
+    raw = bitmap.to_bytes((n_series + 7) // 8, 'little')
+    bits = np.unpackbits(np.frombuffer(raw, dtype=np.uint8), bitorder='little')
+    return np.flatnonzero(bits[:n_series])
+
+
+class LabelIndex:
+    """Índice invertido incremental sobre un SeriesStore"""
+
+    def __init__(self, store):
+        self.store = store
+        self._postings = {}    # etiqueta -> {valor: array('l') de sids}
+        self._bitmaps = {}     # (etiqueta, valor) -> (nº de sids al construir, bitmap)
+        self._has_label = {}   # etiqueta -> (nº de series, bitmap de series con la etiqueta)
+        self._indexed = 0
+        self._epoch = store.epoch
+        self.refresh()
+
+    def refresh(self):
+        """Indexa las series añadidas al store desde la última llamada
+
+        Tras una compactación del store (sids renumerados) se reindexa todo.
+        """
+        if self.store.epoch != self._epoch:
+            self._postings, self._bitmaps, self._has_label = {}, {}, {}
+            self._indexed, self._epoch = 0, self.store.epoch
+        series = self.store.series
+        postings = self._postings
+        for s in series[self._indexed:]:
+            sid = s.sid
+            postings.setdefault(NAME_LABEL, {}).setdefault(s.name, array('l')).append(sid)
+            for name, value in s.labels.items():
+                if value:  # "" equivale a etiqueta ausente: no se indexa
+                    postings.setdefault(name, {}).setdefault(value, array('l')).append(sid)
+        self._indexed = len(series)
+
+    def __len__(self):
+        return self._indexed
+
+    def label_names(self):
+        return list(self._postings)
+
+    def label_values(self, name):
+        return list(self._postings.get(name, ()))
+
+    def postings(self, name, value):
+        return self._postings.get(name, {}).get(value, array('l'))
+
+    def _all(self):
+        return (1 << self._indexed) - 1
+
+    def bitmap(self, name, value):
+        """Bitmap de las series con name == value (cacheado)"""
+        sids = self.postings(name, value)
+        cached = self._bitmaps.get((name, value))
+        if cached is None or cached[0] != len(sids):
+            cached = self._bitmaps[(name, value)] = (len(sids), sids_to_bitmap(sids, self._indexed))
+        return cached[1]
+
+    def _has_label_bitmap(self, name):
+        cached = self._has_label.get(name)
+        if cached is None or cached[0] != self._indexed:
+            bitmap = 0
+            for value in self._postings.get(name, ()):
+                bitmap |= self.bitmap(name, value)
+            cached = self._has_label[name] = (self._indexed, bitmap)
+        return cached[1]
+
+    def _equal(self, name, value):
+        if value == '':
+            return self._all() & ~self._has_label_bitmap(name)
+        return self.bitmap(name, value)
+
+    def _regex(self, m):
+        bitmap = 0
+        for value in self._postings.get(m.name, ()):
+            if m.regex.fullmatch(value):
+                bitmap |= self.bitmap(m.name, value)
+        if m.regex.fullmatch(''):
+            bitmap |= self._all() & ~self._has_label_bitmap(m.name)
+        return bitmap
+
+    def match(self, m):
+        """Bitmap de las series que cumplen un Matcher"""
+        if m.op == '=':
+            return self._equal(m.name, m.value)
+        if m.op == '!=':
+            return self._all() & ~self._equal(m.name, m.value)
+        if m.op == '=~':
+            return self._regex(m)
+        return self._all() & ~self._regex(m)
+
+    def select_bitmap(self, matchers):
+        """Bitmap de las series que cumplen todos los matchers.
+
+        Primero se aplican los matchers positivos (postings concretos) y los
+        negativos se restan después, sin materializar su complemento.
+        """
+        self.refresh()
+        result = None
+        negatives = []
+        for m in matchers:
+            if m.op == '!=' and m.value != '':
+                negatives.append(self._equal(m.name, m.value))
+            elif m.op == '!~' and not m.regex.fullmatch(''):
+                negatives.append(self._regex(m))
+            else:
+                bitmap = self.match(m)
+                result = bitmap if result is None else result & bitmap
+            if result == 0:
+                return 0
+        if result is None:
+            result = self._all()
+        for bitmap in negatives:
+            result &= ~bitmap
+        return result
+
+    def select(self, matchers):
+        """Array ordenado de sids que cumplen todos los matchers"""
+        if isinstance(matchers, str):
+            matchers = parse_selector(matchers)
+        return bitmap_to_sids(self.select_bitmap(matchers), self._indexed)
+
+
+def benchmark(filepath, n_nodes=20, repeat=50):
+    """Compara selecciones con el índice frente a recorrer todas las series"""
+    with open(filepath, encoding='utf-8') as f:
+        metrics_text = f.read()
+    samples = list(parse_text(metrics_text))
+    store = SeriesStore()
+    for node in range(n_nodes):
+        for s in samples:
+            labels = dict(s.labels)
+            labels['node'] = f"node-{node}"
+            store.get_series(s.name, labels, s.family)
+
+    start = time.perf_counter()
+    index = LabelIndex(store)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    queries = [
+        'container_memory_usage_bytes{node="node-3"}',
+        '{id=~"/kubepods.slice/kubepods-burstable.slice/.*",node="node-7"}',
+        'container_cpu_usage_seconds_total{id!~"/system.slice.*",cpu="total"}',
+    ]
+    results = {}
+    for query in queries:
+        matchers = parse_selector(query)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            sids = index.select(matchers)
+        indexed_ms = (time.perf_counter() - start) * 1000 / repeat
+
+        start = time.perf_counter()
+        linear = [s.sid for s in store.series if all(_linear_match(s, m) for m in matchers)]
+        linear_ms = (time.perf_counter() - start) * 1000
+        assert list(sids) == linear
+        results[query] = (len(sids), round(indexed_ms, 3), round(linear_ms, 2))
+
+    return len(store), round(build_ms, 1), results
+
+
+def _linear_match(series, m):
+    value = series.name if m.name == NAME_LABEL else series.labels.get(m.name, '')
+    if m.op == '=':
+        return value == m.value
+    if m.op == '!=':
+        return value != m.value
+    ok = m.regex.fullmatch(value) is not None
+    return ok if m.op == '=~' else not ok
+
+
+def main():
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'cadvisor_metrics.txt'
+    n_nodes = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    n_series, build_ms, results = benchmark(filepath, n_nodes)
+    print(f"Series: {n_series}, construcción del índice: {build_ms} ms\n")
+    for query, (count, indexed_ms, linear_ms) in results.items():
+        print(f"  {query}\n    {count} series | índice {indexed_ms} ms | escaneo lineal {linear_ms} ms")
+
+
+if __name__ == '__main__':
+    main()
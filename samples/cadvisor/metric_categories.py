@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Clasificación de las familias de métricas por categoría (cpu, memory, network...)
+
+Cada familia se clasifica una sola vez a partir de su nombre y de sus
+metadatos # TYPE / # HELP; cada muestra sólo suma uno al contador de su
+familia, así que los recuentos por categoría salen del mismo recorrido que
+el parseo. Antes se buscaban subcadenas en cada línea y 'fs' in línea
+también contaba series de cpu_cfs_* o con 'fs' en alguna etiqueta.
+
+Uso:
+    python3 metric_categories.py [cadvisor_metrics.txt]
+"""
+
+import json
+import re
+import sys
+
+from prom_parser import parse_text
+
+CATEGORIES = ('cpu', 'memory', 'network', 'filesystem', 'disk', 'accelerator',
+              'process', 'exporter', 'other')
+
+# Prefijos de ámbito que se quitan antes de mirar el recurso
+_SCOPES = ('container_spec_', 'container_', 'machine_')
+
+# (prefijo tras quitar el ámbito, categoría); gana el primero que coincide
+_RESOURCE_PREFIXES = (
+    ('cpu_', 'cpu'),
+    ('memory_', 'memory'),
+    ('oom_', 'memory'),
+    ('nvm_', 'memory'),
+    ('network_', 'network'),
+    ('fs_', 'filesystem'),
+    ('blkio_', 'disk'),
+    ('disk', 'disk'),
+    ('accelerator_', 'accelerator'),
+    ('processes', 'process'),
+    ('threads', 'process'),
+    ('sockets', 'process'),
+    ('file_descriptors', 'process'),
+    ('ulimits', 'process'),
+    ('tasks_', 'process'),
+    ('scrape_error', 'exporter'),
+)
+
+# Métricas del propio proceso exportador (runtime de Go, proceso, versión)
+_EXPORTER_PREFIXES = ('go_', 'process_', 'cadvisor_')
+
+# Último recurso para familias desconocidas: palabras del texto de # HELP
+_HELP_KEYWORDS = (
+    (re.compile(r'\bcpu\b', re.I), 'cpu'),
+    (re.compile(r'\bmemory\b', re.I), 'memory'),
+    (re.compile(r'\bnetwork\b', re.I), 'network'),
+    (re.compile(r'\bfile ?system\b', re.I), 'filesystem'),
+    (re.compile(r'\bdisk\b', re.I), 'disk'),
+    (re.compile(r'\b(accelerator|gpu)\b', re.I), 'accelerator'),
+)
+
+
+def classify_family(family, help_text=''):
+    """Categoría de una familia según su nombre (y su # HELP si el nombre no basta)"""
+    if family.startswith(_EXPORTER_PREFIXES):
+        return 'exporter'
+    for scope in _SCOPES:
+        if family.startswith(scope):
+            resource = family[len(scope):]
+            for prefix, category in _RESOURCE_PREFIXES:
+                if resource.startswith(prefix):
+                    return category
+            break
+    for pattern, category in _HELP_KEYWORDS:
+        if pattern.search(help_text):
+            return category
+    return 'other'
+
+
+class CategorySummary:
+    """Recuento de series por familia y por categoría de un scrape"""
+
+    def __init__(self, family_series, metadata=None):
+        metadata = metadata or {}
+        self.total_series = 0
+        self.families = {}
+        self.categories = {category: {'families': 0, 'series': 0, 'types': {}}
+                           for category in CATEGORIES}
+        for family, series in family_series.items():
+            info = metadata.get(family, {})
+            metric_type = info.get('type', 'untyped')
+            category = classify_family(family, info.get('help', ''))
+            self.families[family] = {'category': category, 'type': metric_type, 'series': series}
+
+            stats = self.categories[category]
+            stats['families'] += 1
+            stats['series'] += series
+            stats['types'][metric_type] = stats['types'].get(metric_type, 0) + series
+            self.total_series += series
+
+    def counts(self):
+        """{categoría: nº de series}"""
+        return {category: stats['series'] for category, stats in self.categories.items()}
+
+    def category(self, family):
+        entry = self.families.get(family)
+        return entry['category'] if entry else None
+
+    def families_in(self, category):
+        return [f for f, entry in self.families.items() if entry['category'] == category]
+
+    def to_dict(self):
+        return {'total_series': self.total_series, 'categories': self.categories}
+
+
+def summarize(samples, metadata=None):
+    """CategorySummary de un iterable de Sample.
+
+    Si `samples` es el generador de prom_parser, el parseo y el recuento son
+    el mismo recorrido; `metadata` es el dict que el parser va rellenando.
+    """
+    family_series = {}
+    for sample in samples:
+        family = sample.family
+        family_series[family] = family_series.get(family, 0) + 1
+    return CategorySummary(family_series, metadata)
+
+
+def summarize_text(metrics_text):
+    """Parsea y resume el texto de /metrics en una sola pasada"""
+    metadata = {}
+    return summarize(parse_text(metrics_text, metadata), metadata)
+
+
+def main():
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'cadvisor_metrics.txt'
+    with open(filepath, encoding='utf-8') as f:
+        summary = summarize_text(f.read())
+    print(json.dumps(summary.to_dict(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,70 @@
 #!/usr/bin/env python3
 """
 Script interactivo para monitorear métricas de cAdvisor en tiempo real
+
+Con --tui se abre monitor_tui.py: top-N de contenedores a pantalla
+completa con pintado diferencial y refresco configurable.
+
+Cada refresco alimenta un sketch de cuantiles por contenedor
+(quantile_sketch.py): p50/p95/p99 de CPU y working set desde el arranque,
+o desde antes si se pasa --sketches con un histórico guardado.
+
+Además se guarda un histórico de memoria fija (ring_history.py): cubos de
+5 s durante 15 min, de 1 min durante 24 h y de 1 h durante 30 días.
 """
 
+import argparse
+import contextlib
+import io
 import requests
+import sys
 import time
 import os
 from datetime import datetime
-from collections import defaultdict
+
+from cgroup_tree import CPU_RATE, CgroupTree
+from metric_categories import classify_family
+from monitor_tui import ContainerView
+from poll_scheduler import PollScheduler
+from quantile_sketch import ContainerHistory, report
+from ring_history import DEFAULT_MAX_SERIES, TieredHistory
+from rates import RateTracker, counter_families
+from scrape_cache import ScrapeCache
+from self_metrics import SELF_METRICS
+from term_render import clear_sequence
 
 CADVISOR_URL = "http://localhost:8080/metrics"
 
+# Sin TTL: cada refresco hace una petición condicional y, si falla,
+# se sigue mostrando el último scrape. En streaming: el cuerpo se parsea
+# mientras se descarga y nunca está entero en memoria. Las series que llevan
+# MONITOR_EVICT_AFTER refrescos sin aparecer se eliminan (rotación de pods)
+MONITOR_EVICT_AFTER = 10
+MONITOR_CACHE = ScrapeCache(ttl=0, stream=True, evict_after=MONITOR_EVICT_AFTER)
+
+# Último valor/timestamp de cada counter para calcular tasas entre refrescos
+RATE_TRACKER = RateTracker()
+
+# Contenedores del último snapshot y sus percentiles acumulados
+CONTAINER_VIEW = ContainerView()
+HISTORY = ContainerHistory()
+# Histórico por niveles: memoria reservada al arrancar, no crece con el tiempo
+# (se reserva en el primer refresco con margen sobre los contenedores vistos)
+RETENTION = None
+RETENTION_MAX_SERIES = 2000     # ≈ 160 MiB con los niveles por defecto
+# Plazos fijos sobre el reloj monotónico (se crea en main con el intervalo)
+SCHEDULER = None
+
 def clear_screen():
-    """Limpia la pantalla"""
-    os.system('clear' if os.name == 'posix' else 'cls')
+    """Limpia la pantalla con la secuencia ANSI (sin lanzar un shell en cada refresco)"""
+    if os.name == 'posix':
+        print(clear_sequence(), end='', flush=True)
+    else:
+        os.system('cls')
 
 def fetch_and_parse_metrics():
-    """Obtiene y parsea las métricas"""
-    response = requests.get(CADVISOR_URL)
-    response.raise_for_status()
-    
-    metrics = defaultdict(list)
-    
-    for line in response.text.split('\n'):
-        line = line.strip()
-        
-        if not line or line.startswith('#'):
-            continue
-        
-        try:
-            # Parsear métrica Prometheus
-            if '{' in line:
-                metric_name = line.split('{')[0]
-                value_str = line.split('} ')[1].split()[0]
-                value = float(value_str)
-                
-                metrics[metric_name].append(value)
-        except (ValueError, IndexError):
-            pass
-    
-    return metrics
+    """Obtiene y parsea las métricas en un snapshot columnar"""
+    return MONITOR_CACHE.snapshot(CADVISOR_URL)
 
 def format_bytes(bytes_val):
     """Formatea bytes a unidades legibles"""
@@ -49,83 +74,174 @@ def format_bytes(bytes_val):
         bytes_val /= 1024
     return f"{bytes_val:.2f} TB"
 
+def print_metric(name, metrics, rates, as_bytes=True):
+    """Imprime una familia: tasa por segundo si es counter, promedio si es gauge"""
+    fmt = format_bytes if as_bytes else (lambda v: f"{v:.2f}")
+    print(f"│   • {name}: {len(metrics[name])} series")
+    if name in rates:
+        stats = rates[name].stats()
+        if stats['count']:
+            print(f"│     Tasa total: {fmt(stats['sum'])}/s, promedio: {fmt(stats['avg'])}/s")
+        else:
+            print("│     Tasa: pendiente (aún no hay dos muestras de esta serie)")
+    else:
+        print(f"│     Promedio: {fmt(metrics[name].stats()['avg'])}")
+
 def display_metrics():
-    """Muestra las métricas en tiempo real"""
+    """Muestra las métricas en tiempo real
+
+    El frame se compone entero (descarga incluida) antes de limpiar la
+    pantalla: el refresco anterior sigue visible mientras se descarga.
+    """
+    frame = io.StringIO()
+    with contextlib.redirect_stdout(frame):
+        ok = _print_metrics()
+    clear_screen()
+    sys.stdout.write(frame.getvalue())
+    sys.stdout.flush()
+    return ok
+
+def _print_metrics():
+    """Escribe un refresco completo en stdout; False si no se pudo contactar con cAdvisor"""
+    global RETENTION
     try:
-        clear_screen()
-        
         print("┌" + "─" * 78 + "┐")
         print("│" + " MONITOREO EN TIEMPO REAL - cADVISOR ".center(78) + "│")
         print("└" + "─" * 78 + "┘")
         
         metrics = fetch_and_parse_metrics()
+        counters = counter_families(MONITOR_CACHE.metadata(CADVISOR_URL), metrics.families)
+        rates = RATE_TRACKER.update(metrics, counters)
         
         print(f"\n⏰ Última actualización: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"📊 Tipos de métricas: {len(metrics)}\n")
         
         # Métricas de CPU
         print("┌─ CPU ─────────────────────────────────────────────────────────────────────────┐")
-        cpu_metrics = [k for k in metrics.keys() if 'cpu' in k]
+        cpu_metrics = [k for k in metrics.families if 'cpu' in k]
         print(f"│ Métricas CPU encontradas: {len(cpu_metrics)}")
         for metric in sorted(cpu_metrics)[:3]:
-            values = metrics[metric]
-            print(f"│   • {metric}: {len(values)} series, valor promedio: {sum(values)/len(values):.2f}")
+            print_metric(metric, metrics, rates, as_bytes=False)
         print("└────────────────────────────────────────────────────────────────────────────────┘\n")
         
         # Métricas de Memoria
         print("┌─ MEMORIA ──────────────────────────────────────────────────────────────────────┐")
-        mem_metrics = [k for k in metrics.keys() if 'memory' in k]
+        mem_metrics = [k for k in metrics.families if 'memory' in k]
         print(f"│ Métricas Memoria encontradas: {len(mem_metrics)}")
         for metric in sorted(mem_metrics)[:3]:
-            values = metrics[metric]
-            avg_bytes = sum(values) / len(values)
-            print(f"│   • {metric}: {len(values)} series")
-            print(f"│     Promedio: {format_bytes(avg_bytes)}")
+            print_metric(metric, metrics, rates)
         print("└────────────────────────────────────────────────────────────────────────────────┘\n")
         
         # Métricas de Red
         print("┌─ RED ──────────────────────────────────────────────────────────────────────────┐")
-        net_metrics = [k for k in metrics.keys() if 'network' in k]
+        net_metrics = [k for k in metrics.families if 'network' in k]
         print(f"│ Métricas Red encontradas: {len(net_metrics)}")
         for metric in sorted(net_metrics)[:3]:
-            values = metrics[metric]
-            avg_bytes = sum(values) / len(values)
-            print(f"│   • {metric}: {len(values)} series")
-            print(f"│     Promedio: {format_bytes(avg_bytes)}")
+            print_metric(metric, metrics, rates)
         print("└────────────────────────────────────────────────────────────────────────────────┘\n")
         
         # Métricas de Filesystem
         print("┌─ FILESYSTEM ───────────────────────────────────────────────────────────────────┐")
-        fs_metrics = [k for k in metrics.keys() if 'fs' in k]
+        # Por categoría: 'fs' in k también contaba container_cpu_cfs_*
+        fs_metrics = [k for k in metrics.families if classify_family(k) == 'filesystem']
         print(f"│ Métricas Filesystem encontradas: {len(fs_metrics)}")
         for metric in sorted(fs_metrics)[:3]:
-            values = metrics[metric]
-            avg_bytes = sum(values) / len(values)
-            print(f"│   • {metric}: {len(values)} series")
-            print(f"│     Promedio: {format_bytes(avg_bytes)}")
+            print_metric(metric, metrics, rates)
+        print("└────────────────────────────────────────────────────────────────────────────────┘\n")
+        
+        # Totales por clase QoS (árbol de cgroups, subtotales de abajo arriba)
+        print("┌─ KUBERNETES POR CLASE QoS ─────────────────────────────────────────────────────┐")
+        tree = CgroupTree.from_snapshot(metrics, rates=rates)
+        print(f"│ Pods: {len(tree.pods())}, contenedores: {len(tree.containers())}")
+        for qos, totals in tree.qos_totals().items():
+            cpu = totals.get(CPU_RATE)
+            cpu = "pendiente" if cpu is None else f"{cpu:.3f} núcleos"
+            memory = totals.get('memory_working_set_bytes')
+            memory = "-" if memory is None else format_bytes(memory)
+            print(f"│   • {qos:11}: CPU {cpu}, working set {memory}")
+        print("└────────────────────────────────────────────────────────────────────────────────┘\n")
+        
+        # Percentiles por contenedor (sketches acumulados entre refrescos)
+        CONTAINER_VIEW.update(metrics, rates)
+        HISTORY.update(CONTAINER_VIEW)
+        print("┌─ PERCENTILES POR CONTENEDOR (núcleos / MiB, top 5 por p95 de memoria) ─────────┐")
+        for line in report(HISTORY, limit=5):
+            print(f"│ {line}")
+        print("└────────────────────────────────────────────────────────────────────────────────┘\n")
+        
+        # Histórico por niveles de los contenedores con más memoria ahora mismo
+        if RETENTION is None:
+            wanted = int(CONTAINER_VIEW.present.sum() * 1.25)
+            RETENTION = TieredHistory(max_series=min(max(wanted, DEFAULT_MAX_SERIES), RETENTION_MAX_SERIES))
+        RETENTION.record_view(time.time(), CONTAINER_VIEW)
+        print("┌─ HISTÓRICO (working set medio / máximo) ───────────────────────────────────────┐")
+        print(f"│ {len(RETENTION)} contenedores, niveles {RETENTION.describe()}, "
+              f"{RETENTION.nbytes / 2**20:.1f} MiB reservados"
+              + (f", {RETENTION.dropped} sin hueco" if RETENTION.dropped else ""))
+        for row in CONTAINER_VIEW.top('memory', 3):
+            path = CONTAINER_VIEW.paths[row]
+            windows = []
+            for label, seconds in (('15 min', 900), ('24 h', 86400), ('30 d', 30 * 86400)):
+                stats = RETENTION.summary(path, 'memory', seconds)
+                if stats:
+                    windows.append(f"{label} {format_bytes(stats['avg'])}/{format_bytes(stats['max'])}")
+            print(f"│   • {CONTAINER_VIEW.name(row)}: " + ", ".join(windows))
         print("└────────────────────────────────────────────────────────────────────────────────┘\n")
         
         # Información del sistema
         print("┌─ INFORMACIÓN DEL SISTEMA ─────────────────────────────────────────────────────┐")
         print(f"│ URL: {CADVISOR_URL}")
-        version_metrics = [k for k in metrics.keys() if 'version' in k]
+        print(f"│ Último scrape: {MONITOR_CACHE.transfer_summary(CADVISOR_URL)}")
+        stages = SELF_METRICS.summary()['stages']
+        print("│ Coste del refresco: " + ", ".join(
+            f"{stage} {stats['last_seconds'] * 1000:.0f} ms" for stage, stats in stages.items()))
+        if SCHEDULER is not None:
+            print(f"│ Planificador: {SCHEDULER.summary()}")
+        version_metrics = [k for k in metrics.families if 'version' in k]
         print(f"│ Métricas de versión: {len(version_metrics)}")
         print("│")
         print("│ Presiona Ctrl+C para salir")
         print("└────────────────────────────────────────────────────────────────────────────────┘")
+        return True
         
     except requests.exceptions.RequestException as e:
         print(f"❌ Error conectando a cAdvisor: {e}")
         print(f"   Verifica que cAdvisor esté corriendo en {CADVISOR_URL}")
+        return False
 
 def main():
     """Bucle principal de monitoreo"""
+    global SCHEDULER
+    parser = argparse.ArgumentParser(description="Monitor de cAdvisor en tiempo real")
+    parser.add_argument('--self-metrics-port', type=int, metavar='PUERTO',
+                        help="publicar el coste del propio monitor en http://127.0.0.1:PUERTO/metrics")
+    parser.add_argument('--tui', action='store_true',
+                        help="top-N de contenedores a pantalla completa (ver monitor_tui.py)")
+    parser.add_argument('--interval', type=float, default=None,
+                        help="segundos entre refrescos (5 por defecto; en --tui admite p.ej. 0.5)")
+    parser.add_argument('--sketches', metavar='FICHERO',
+                        help="histórico de percentiles: se carga al arrancar y se guarda al salir")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="fracción del intervalo para desfasar cada refresco (varios monitores contra el mismo nodo)")
+    args = parser.parse_args()
+    if args.self_metrics_port:
+        SELF_METRICS.serve(args.self_metrics_port)
+    if args.tui:
+        import monitor_tui
+        monitor_tui.run(CADVISOR_URL, args.interval or monitor_tui.DEFAULT_INTERVAL,
+                        sketches=args.sketches, jitter=args.jitter)
+        return
+    if args.sketches and os.path.exists(args.sketches):
+        HISTORY.merge(ContainerHistory.load(args.sketches))
+    
+    # El intervalo es de inicio a inicio: descarga, parseo y pintado no lo alargan
+    SCHEDULER = PollScheduler(args.interval or 5, jitter=args.jitter, phase=args.jitter > 0)
     try:
-        while True:
-            display_metrics()
-            time.sleep(5)
+        SCHEDULER.run(display_metrics)
     except KeyboardInterrupt:
         clear_screen()
+        if args.sketches:
+            print(f"Percentiles guardados en {HISTORY.save(args.sketches)}")
         print("\n👋 Monitoreo finalizado\n")
 
 if __name__ == '__main__':
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Monitor de cAdvisor a pantalla completa: top-N de contenedores
+
+Tabla de los N contenedores con más consumo, ordenable por:
+    c  CPU (núcleos, tasa de container_cpu_usage_seconds_total)
+    m  memoria (container_memory_working_set_bytes)
+    n  red (bytes/s recibidos + enviados)
+    t  throttling (% de periodos CFS con throttling)
+    q  salir
+
+Las columnas p95 salen de un sketch de cuantiles por contenedor
+(quantile_sketch.py) que acumula todos los refrescos; con --sketches se
+cargan al arrancar y se guardan al salir, para seguirlos durante horas.
+
+Los valores por contenedor salen de arrays numpy con un bincount por
+familia y el top-N con np.argpartition (selección parcial, O(n)), sin
+ordenar todos los contenedores; sólo se ordenan las N filas visibles. El
+pintado es diferencial (term_render.DiffRenderer): el coste del refresco
+no crece con el número de contenedores.
+
+Uso:
+    python3 monitor_tui.py [--interval 0.5] [--jitter 0.1] [--top 20] [--sort cpu] [--sketches historico.json]
+    python3 monitor_tui.py --benchmark [--containers 5000]
+"""
+
+import argparse
+import io
+import os
+import select
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from cgroup_tree import classify_segment
+from poll_scheduler import PollScheduler
+from quantile_sketch import ContainerHistory, workload_name
+from rates import RateTracker, counter_families
+
+CPU_FAMILY = 'container_cpu_usage_seconds_total'
+MEMORY_FAMILY = 'container_memory_working_set_bytes'
+NETWORK_FAMILIES = ('container_network_receive_bytes_total', 'container_network_transmit_bytes_total')
+PERIODS_FAMILY = 'container_cpu_cfs_periods_total'
+THROTTLED_FAMILY = 'container_cpu_cfs_throttled_periods_total'
+
+CONTAINER_NAME_LABEL = 'container_label_io_kubernetes_container_name'
+POD_NAME_LABEL = 'container_label_io_kubernetes_pod_name'
+POD_NAMESPACE_LABEL = 'container_label_io_kubernetes_pod_namespace'
+
+# Columna -> (tecla, cabecera)
+SORT_KEYS = {'cpu': ('c', 'CPU'), 'memory': ('m', 'MEM'), 'network': ('n', 'NET/s'),
+             'throttling': ('t', 'THR%')}
+DEFAULT_INTERVAL = 1.0
+DEFAULT_TOP = 20
+
+
+def top_n(values, n):
+    """Índices de los n mayores valores (NaN al final), de mayor a menor
+
+    np.argpartition selecciona los n mayores sin ordenar el resto; sólo se
+    ordenan esos n.
+    """
+    if not len(values) or n <= 0:
+        return np.empty(0, dtype=np.int64)
+    keys = np.where(np.isnan(values), -np.inf, values)
+    if n < len(keys):
+        candidates = np.argpartition(-keys, n - 1)[:n]
+    else:
+        candidates = np.arange(len(keys))
+    return candidates[np.argsort(-keys[candidates], kind='stable')]
+
+
+class ContainerView:
+    """Métricas por contenedor (cgroup de tipo 'container') de un snapshot
+
+    La fila de contenedor de cada sid se calcula una sola vez por serie del
+    SeriesStore (incremental entre refrescos): cada actualización sólo hace
+    un bincount por familia. Si el store se compacta (SeriesStore.compact)
+    las filas se recalculan desde cero, lo que descarta los contenedores
+    que ya no existen.
+    """
+
+    def __init__(self):
+        self._reset(None)
+
+    def _reset(self, store):
+        self._store = store
+        self._epoch = store.epoch if store is not None else 0
+        self._sid_rows = np.empty(0, dtype=np.int64)
+        self._rows = {}             # ruta de cgroup -> fila (-1 si no es contenedor)
+        self.paths = []
+        self.names = []
+        self.groups = []            # namespace/workload/contenedor, para mezclar réplicas
+        self.columns = {}
+        self.present = np.empty(0, dtype=bool)
+
+    def _row(self, series):
+        path = series.labels.get('id')
+        if path is None:
+            return -1
+        row = self._rows.get(path)
+        if row is None:
+            row = -1
+            if classify_segment(path.rstrip('/').rpartition('/')[2])[0] == 'container':
+                row = len(self.paths)
+                self.paths.append(path)
+                self.names.append(_container_name(series.labels, path))
+                self.groups.append(_workload_key(series.labels, path))
+            self._rows[path] = row
+        return row
+
+    def _index(self, store):
+        """Fila por sid, extendida sólo con las series nuevas del store"""
+        if store is not self._store or store.epoch != self._epoch:
+            self._reset(store)
+        known = len(self._sid_rows)
+        if len(store.series) > known:
+            new = store.series[known:]
+            rows = np.fromiter((self._row(s) for s in new), dtype=np.int64, count=len(new))
+            self._sid_rows = np.concatenate((self._sid_rows, rows))
+        return self._sid_rows
+
+    def update(self, snapshot, rates):
+        """Recalcula las columnas con un ColumnarSnapshot y la salida de RateTracker.update"""
+        sid_rows = self._index(snapshot.store)
+        n = len(self.paths)
+
+        def per_container(series_ids, values):
+            """Suma por contenedor (dispositivos, interfaces...); NaN si no hay serie"""
+            row = sid_rows[series_ids]
+            keep = (row >= 0) & ~np.isnan(values)
+            total = np.bincount(row[keep], weights=values[keep], minlength=n)
+            seen = np.bincount(row[keep], minlength=n) > 0
+            return np.where(seen, total, np.nan)
+
+        def rate(family):
+            if family not in rates:
+                return np.full(n, np.nan)
+            columns = rates[family]
+            return per_container(columns.series_ids, columns.rates)
+
+        memory = snapshot.get(MEMORY_FAMILY)
+        network = np.vstack([rate(f) for f in NETWORK_FAMILIES])
+        periods, throttled = rate(PERIODS_FAMILY), rate(THROTTLED_FAMILY)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            throttling = np.where(periods > 0, 100.0 * throttled / periods, np.nan)
+
+        self.columns = {
+            'cpu': rate(CPU_FAMILY),
+            'memory': per_container(memory.series_ids, memory.values),
+            'network': np.where(np.isnan(network).all(axis=0), np.nan, np.nansum(network, axis=0)),
+            'throttling': throttling,
+        }
+        # Contenedores presentes en este scrape (todo cgroup publica su memoria);
+        # los desaparecidos no se muestran
+        self.present = ~np.isnan(self.columns['memory']) | ~np.isnan(self.columns['cpu'])
+
+    def __len__(self):
+        return int(self.present.sum())
+
+    def name(self, row):
+        return self.names[row]
+
+    def top(self, sort='cpu', n=DEFAULT_TOP):
+        """Filas (índices) del top-n por la columna `sort`"""
+        values = self.columns.get(sort)
+        if values is None:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.flatnonzero(self.present)
+        return candidates[top_n(values[candidates], n)]
+
+
+def _container_name(labels, path):
+    """pod/contenedor si cAdvisor tiene las etiquetas de Kubernetes; si no, la ruta abreviada"""
+    names = [labels.get(POD_NAME_LABEL), labels.get(CONTAINER_NAME_LABEL)]
+    names = [name for name in names if name]
+    if names:
+        return '/'.join(names)
+    parent, _, leaf = path.rstrip('/').rpartition('/')
+    return f"{parent.rpartition('/')[2][-24:]}/{leaf[:20]}"
+
+
+def _workload_key(labels, path):
+    """'namespace/workload/contenedor' (réplicas de un mismo deployment juntas); la ruta si no es de Kubernetes"""
+    pod = labels.get(POD_NAME_LABEL)
+    if not pod:
+        return path
+    return '/'.join((labels.get(POD_NAMESPACE_LABEL) or '-', workload_name(pod),
+                     labels.get(CONTAINER_NAME_LABEL) or '-'))
+
+
+def _fmt_bytes(value):
+    if value is None or np.isnan(value):
+        return '-'
+    for unit in ('B', 'K', 'M', 'G'):
+        if abs(value) < 1024:
+            return f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}T"
+
+
+def _fmt(value, spec):
+    return '-' if value is None or np.isnan(value) else format(value, spec)
+
+
+def build_frame(view, sort, n, status, interval, history=None):
+    """Filas de texto del fotograma (sin ANSI: el renderer sólo compara texto)
+
+    Con `history` (quantile_sketch.ContainerHistory) se añaden el p95 de
+    CPU y de memoria de cada contenedor desde que se empezó a monitorizar.
+    """
+    headers = {key: (f"[{title}]" if key == sort else title) for key, (_, title) in SORT_KEYS.items()}
+    lines = [
+        f" cAdvisor top {n} contenedores  {datetime.now().strftime('%H:%M:%S')}  "
+        f"refresco {interval:g}s  contenedores {len(view)}",
+        f" {status}",
+        " orden: c=CPU m=MEM n=NET t=THR  q=salir",
+        "",
+        f" {'#':>3} {headers['cpu']:>8} {headers['memory']:>9} {headers['network']:>10} "
+        f"{headers['throttling']:>7}"
+        + (f" {'CPUp95':>8} {'MEMp95':>9}" if history is not None else "") + "  CONTENEDOR",
+    ]
+    columns = view.columns
+    for rank, row in enumerate(view.top(sort, n), 1):
+        line = (
+            f" {rank:>3} {_fmt(columns['cpu'][row], '.3f'):>8} {_fmt_bytes(columns['memory'][row]):>9} "
+            f"{_fmt_bytes(columns['network'][row]) + '/s' if not np.isnan(columns['network'][row]) else '-':>10} "
+            f"{_fmt(columns['throttling'][row], '.1f'):>7}")
+        if history is not None:
+            path = view.paths[row]
+            line += (f" {_fmt(history.quantile('cpu', path, 0.95), '.3f'):>8} "
+                     f"{_fmt_bytes(history.quantile('memory', path, 0.95)):>9}")
+        lines.append(f"{line}  {view.name(row)}")
+    return lines
+
+
+def _read_key(timeout):
+    """Tecla pulsada antes de `timeout` segundos (None si no hay)"""
+    ready, _, _ = select.select([sys.stdin], [], [], max(timeout, 0))
+    return sys.stdin.read(1) if ready else None
+
+
+def run(url, interval=DEFAULT_INTERVAL, n=DEFAULT_TOP, sort='cpu', sketches=None, jitter=0.0):
+    """Bucle a pantalla completa (POSIX: terminal en modo cbreak para leer teclas)
+
+    sketches: fichero JSON del histórico de percentiles (se carga si existe
+    y se guarda al salir).
+    jitter: fracción del intervalo para desfasar cada refresco (PollScheduler).
+    """
+    import termios
+    import tty
+    from monitor_metrics import MONITOR_CACHE
+    from term_render import DiffRenderer
+
+    tracker, view, renderer = RateTracker(), ContainerView(), DiffRenderer()
+    history = ContainerHistory.load(sketches) if sketches and os.path.exists(sketches) else ContainerHistory()
+    keys = {key: column for column, (key, _) in SORT_KEYS.items()}
+    fd = sys.stdin.fileno()
+    saved = termios.tcgetattr(fd)
+    tty.setcbreak(fd)
+    scheduler = PollScheduler(interval, jitter=jitter, phase=jitter > 0)
+    state = {'sort': sort, 'status': ''}
+
+    def refresh():
+        ok = True
+        try:
+            snapshot = MONITOR_CACHE.snapshot(url)
+            counters = counter_families(MONITOR_CACHE.metadata(url), snapshot.families)
+            view.update(snapshot, tracker.update(snapshot, counters))
+            history.update(view)
+            state['status'] = MONITOR_CACHE.transfer_summary(url)
+        except Exception as e:  # se sigue mostrando el último estado
+            state['status'] = f"error: {e}"
+            ok = False
+        render()
+        return ok
+
+    def render():
+        status = state['status']
+        if scheduler.ticks:
+            status += f" | {scheduler.missed} ticks perdidos, p95 {scheduler.durations.quantile(0.95) * 1000:.0f} ms"
+        renderer.render(build_frame(view, state['sort'], n, status, scheduler.current_interval, history))
+
+    def read_keys(timeout):
+        """Teclas hasta el siguiente refresco"""
+        key = _read_key(timeout)
+        if key == 'q':
+            scheduler.stop()
+        elif key in keys:
+            state['sort'] = keys[key]
+            render()
+
+    try:
+        with renderer:
+            scheduler.run(refresh, wait=read_keys)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+        if sketches:
+            history.save(sketches)
+
+
+def benchmark(containers_list=(100, 1000, 5000), refreshes=10, n=DEFAULT_TOP):
+    """Coste por refresco de la vista (update + top-N + pintado) según nº de contenedores"""
+    from columnar import ColumnarSnapshot, FamilyColumns
+    from series_store import SeriesStore
+    from synthetic_metrics import generate
+    from term_render import DiffRenderer
+
+    results = []
+    for containers in containers_list:
+        # Dos refrescos del mismo nodo; el refresco i interpola/extrapola entre ellos:
+        # counters v0 + i·(v1 - v0) (crecen siempre), gauges alternos
+        buffers = []
+        for i in range(2):
+            out = io.StringIO()
+            generate(out, containers=containers, devices=2, timestamp_ms=1764230077164 + i * 1000, step=i)
+            buffers.append(out.getvalue())
+        store = SeriesStore()
+        snapshots = [ColumnarSnapshot.from_text(text, store) for text in buffers]
+        del buffers
+
+        def refresh(i):
+            families = {}
+            for name, first in snapshots[0].families.items():
+                second = snapshots[1].families[name]
+                if name.endswith('_total'):
+                    values = first.values + i * (second.values - first.values)
+                    timestamps = first.timestamps + i * (second.timestamps - first.timestamps)
+                else:
+                    values, timestamps = snapshots[i % 2][name].values, snapshots[i % 2][name].timestamps
+                families[name] = FamilyColumns(name, values, timestamps, first.series_ids)
+            return ColumnarSnapshot(store, families)
+
+        tracker, view, history = RateTracker(), ContainerView(), ContainerHistory()
+        renderer = DiffRenderer(io.StringIO())
+        counters = [f for f in snapshots[0].families if f.endswith('_total')]
+        # El primer refresco indexa todas las series del store (una vez); se mide aparte
+        start = time.perf_counter()
+        view.update(snapshots[0], tracker.update(snapshots[0], counters, scrape_time_ms=0))
+        index_ms = (time.perf_counter() - start) * 1000
+        update = sketch = top = render = 0.0
+        written = []
+        for i in range(1, refreshes + 1):
+            snapshot = refresh(i)
+            rates = tracker.update(snapshot, counters, scrape_time_ms=i * 1000)
+            t0 = time.perf_counter()
+            view.update(snapshot, rates)
+            t1 = time.perf_counter()
+            history.update(view)
+            t2 = time.perf_counter()
+            frame = build_frame(view, 'cpu', n, 'benchmark', 1.0, history)
+            t3 = time.perf_counter()
+            written.append(renderer.render(frame, size=(140, n + 6)))
+            t4 = time.perf_counter()
+            update, sketch = update + t1 - t0, sketch + t2 - t1
+            top, render = top + t3 - t2, render + t4 - t3
+        results.append({
+            'containers': len(view),
+            'series': len(store.series),
+            'first_update_ms': round(index_ms, 1),
+            'update_ms': round(update / refreshes * 1000, 2),
+            'sketch_ms': round(sketch / refreshes * 1000, 2),
+            'top_n_frame_ms': round(top / refreshes * 1000, 2),
+            'render_ms': round(render / refreshes * 1000, 3),
+            'first_frame_bytes': written[0],
+            'diff_bytes': round(sum(written[1:]) / max(len(written) - 1, 1)),
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Top-N de contenedores de cAdvisor a pantalla completa")
+    parser.add_argument('--url', default='http://localhost:8080/metrics')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help="segundos entre refrescos (admite fracciones, p.ej. 0.5)")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="fracción del intervalo para desfasar cada refresco (varios monitores contra el mismo nodo)")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP)
+    parser.add_argument('--sort', choices=list(SORT_KEYS), default='cpu')
+    parser.add_argument('--sketches', metavar='FICHERO',
+                        help="histórico de percentiles: se carga al arrancar y se guarda al salir")
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--containers', type=int, nargs='+', default=[100, 1000, 5000])
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        for r in benchmark(args.containers, n=args.top):
+            print('  ' + ', '.join(f"{k}={v}" for k, v in r.items()))
+        return 0
+    if os.name != 'posix' or not sys.stdin.isatty():
+        print("El modo a pantalla completa necesita un terminal POSIX")
+        return 1
+    run(args.url, args.interval, args.top, args.sort, args.sketches, args.jitter)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Análisis offline de dumps de /metrics con mmap e índice de familias
+
+Al abrir un dump (cadvisor_metrics.txt, metrics_export/cadvisor_metrics_raw.txt
+o la concatenación de varios nodos) se construye un índice lateral
+`<dump>.idx.json` con los rangos de bytes de cada familia, localizados a
+partir de las cabeceras # HELP / # TYPE sin tokenizar las líneas de
+muestras. Después sólo se leen y parsean los rangos de las familias pedidas.
+
+Uso:
+    python3 offline_index.py cadvisor_metrics.txt container_memory_usage_bytes [...]
+"""
+
+import json
+import mmap
+import os
+import sys
+
+from prom_parser import iter_samples
+
+INDEX_SUFFIX = '.idx.json'
+INDEX_VERSION = 1
+
+
+def _header_family(line):
+    """Nombre de familia de una línea '# HELP x ...' / '# TYPE x ...' (bytes) o None"""
+    parts = line.split(None, 3)
+    if len(parts) >= 3 and parts[1] in (b'HELP', b'TYPE'):
+        return parts[2].decode('utf-8'), parts
+    return None, parts
+
+
+def build_index(mm):
+    """Recorre sólo las cabeceras del dump y devuelve (rangos, tipos)
+
+    rangos: {familia: [[inicio, fin], ...]} (varios bloques si hay varios nodos)
+    """
+    ranges = {}
+    types = {}
+    size = len(mm)
+    current, block_start = None, 0
+
+    pos = 0 if mm[:2] == b'# ' else mm.find(b'\n# ')
+    while pos != -1 and pos < size:
+        line_start = pos if mm[pos:pos + 1] == b'#' else pos + 1
+        line_end = mm.find(b'\n', line_start)
+        if line_end == -1:
+            line_end = size
+        family, parts = _header_family(mm[line_start:line_end])
+
+        if family is not None:
+            if family != current:
+                if current is not None:
+                    ranges.setdefault(current, []).append([block_start, line_start])
+                current, block_start = family, line_start
+            if parts[1] == b'TYPE' and len(parts) > 3:
+                types[family] = parts[3].strip().decode('utf-8')
+
+        pos = mm.find(b'\n# ', line_end)
+
+    if current is not None:
+        ranges.setdefault(current, []).append([block_start, size])
+    return ranges, types
+
+
+class DumpIndex:
+    """Dump mapeado en memoria + índice de rangos por familia"""
+
+    def __init__(self, path, rebuild=False):
+        self.path = path
+        self._file = open(path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        self.index_path = path + INDEX_SUFFIX
+
+        index = None if rebuild else self._load_index(stat)
+        if index is None:
+            ranges, types = build_index(self._mm)
+            index = {'version': INDEX_VERSION, 'size': stat.st_size,
+                     'mtime_ns': stat.st_mtime_ns, 'families': ranges, 'types': types}
+            self._save_index(index)
+        self.ranges = index['families']
+        self.types = index['types']
+
+    def _load_index(self, stat):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (index.get('version') != INDEX_VERSION or index.get('size') != stat.st_size
+                or index.get('mtime_ns') != stat.st_mtime_ns):
+            return None
+        return index
+
+    def _save_index(self, index):
+        try:
+            with open(self.index_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, separators=(',', ':'))
+        except OSError:
+            pass  # directorio de sólo lectura: el índice se reconstruye la próxima vez
+
+    @property
+    def size(self):
+        return len(self._mm)
+
+    @property
+    def families(self):
+        return list(self.ranges)
+
+    def slice_bytes(self, family):
+        """Bytes que ocupa una familia en el dump (suma de sus bloques)"""
+        return sum(end - start for start, end in self.ranges.get(family, ()))
+
+    def iter_lines(self, family):
+        """Líneas (str) de los bloques de una familia, leídas sólo de esos rangos"""
+        for start, end in self.ranges.get(family, ()):
+            block = self._mm[start:end].decode('utf-8')
+            yield from block.splitlines()
+
+    def samples(self, families, metadata=None, parse_filter=None):
+        """prom_parser.Sample de las familias pedidas (el resto del dump no se lee)"""
+        for family in families:
+            yield from iter_samples(self.iter_lines(family), metadata, parse_filter)
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"Uso: {sys.argv[0]} DUMP [familia ...]")
+        return 1
+    path, families = sys.argv[1], sys.argv[2:]
+    with DumpIndex(path) as index:
+        total = os.path.getsize(path)
+        print(f"{path}: {total} bytes, {len(index.ranges)} familias indexadas "
+              f"({index.index_path})\n")
+        if not families:
+            for family in index.families:
+                print(f"  {family:60} {index.types.get(family, 'untyped'):8} "
+                      f"{index.slice_bytes(family):10} bytes")
+            return 0
+        for family in families:
+            samples = list(index.samples([family]))
+            print(f"  {family}: {len(samples)} series, "
+                  f"{index.slice_bytes(family)} de {total} bytes leídos")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
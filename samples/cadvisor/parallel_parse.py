@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Parseo en paralelo de dumps grandes, partidos por límites de familia
+
+Para dumps de varios nodos (de 100 MB a varios GB) el bucle de líneas de
+un solo hilo es el cuello de botella. Aquí el texto se corta en trozos
+que empiezan siempre en la primera cabecera # HELP / # TYPE de una
+familia (ninguna familia queda partida entre un trozo y su cabecera) y
+cada trozo se parsea en un proceso del pool.
+
+El texto no se envía a los procesos: un fichero se abre con mmap en
+cada worker y un cuerpo en memoria se copia una vez a memoria
+compartida. Cada tarea recibe sólo (inicio, fin) y devuelve columnas
+por métrica (etiquetas + arrays de valores y timestamps), que se unen
+en orden en el proceso principal.
+
+Uso:
+    python3 parallel_parse.py DUMP [--jobs N]                 # parsea y resume
+    python3 parallel_parse.py --benchmark [--scale 100] [--jobs 1 2 4]
+"""
+
+import argparse
+import mmap
+import os
+import sys
+import tempfile
+import time
+from array import array
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+from prom_parser import Sample, parse_text
+from series_store import NO_TIMESTAMP, SeriesStore
+
+# Trozos por proceso: más trozos que procesos reparte mejor familias de tamaño desigual
+CHUNKS_PER_JOB = 4
+
+# Estado de cada worker (lo fija _init_worker)
+_BUFFER = None
+_FILTER = None
+_SHM = None
+
+
+def _header_family(buf, start):
+    """(familia, fin de línea) de la cabecera que empieza en `start`; familia None si no es HELP/TYPE"""
+    end = buf.find(b'\n', start)
+    end = len(buf) if end == -1 else end
+    parts = bytes(buf[start:end]).split(None, 3)
+    if len(parts) >= 3 and parts[1] in (b'HELP', b'TYPE'):
+        return parts[2], end
+    return None, end
+
+
+def _family_start(buf, pos):
+    """Primer inicio de familia (cabecera de una familia distinta de la anterior) en o tras `pos`"""
+    size = len(buf)
+    previous = None
+    back = buf.rfind(b'\n# ', 0, pos)
+    if back != -1:
+        previous, _ = _header_family(buf, back + 1)
+    elif buf[:2] == b'# ' and pos > 0:
+        previous, _ = _header_family(buf, 0)
+
+    while True:
+        nl = buf.find(b'\n# ', max(pos - 1, 0))
+        if nl == -1:
+            return size
+        family, end = _header_family(buf, nl + 1)
+        if family is not None and family != previous:
+            return nl + 1
+        if family is not None:
+            previous = family
+        pos = end
+
+
+def split_ranges(buf, parts):
+    """Cortes [(inicio, fin), ...] en ~`parts` trozos, todos en límites de familia"""
+    size = len(buf)
+    cuts = [0]
+    for i in range(1, parts):
+        cut = _family_start(buf, max(size * i // parts, cuts[-1] + 1))
+        if cut >= size:
+            break
+        if cut > cuts[-1]:
+            cuts.append(cut)
+    cuts.append(size)
+    return list(zip(cuts, cuts[1:]))
+
+
+class NameColumns:
+    """Series de una métrica: etiquetas (dicts) y arrays de valores y timestamps"""
+
+    __slots__ = ('family', 'labels', 'values', 'timestamps')
+
+    def __init__(self, family):
+        self.family = family
+        self.labels = []
+        self.values = array('d')
+        self.timestamps = array('q')
+
+    def extend(self, other):
+        self.labels.extend(other.labels)
+        self.values.extend(other.values)
+        self.timestamps.extend(other.timestamps)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getstate__(self):
+        return self.family, self.labels, self.values, self.timestamps
+
+    def __setstate__(self, state):
+        self.family, self.labels, self.values, self.timestamps = state
+
+
+def _parse_chunk(text, parse_filter):
+    """(columnas por nombre, metadatos, segundos de CPU) de un trozo de texto"""
+    start = time.process_time()
+    metadata = {}
+    columns = {}
+    for sample in parse_text(text, metadata, parse_filter):
+        column = columns.get(sample.name)
+        if column is None:
+            column = columns[sample.name] = NameColumns(sample.family)
+        column.labels.append(sample.labels)
+        column.values.append(sample.value)
+        column.timestamps.append(NO_TIMESTAMP if sample.timestamp is None else sample.timestamp)
+    return columns, metadata, time.process_time() - start
+
+
+def _init_worker(source, parse_filter):
+    global _BUFFER, _FILTER, _SHM
+    kind, where = source
+    if kind == 'file':
+        with open(where, 'rb') as f:
+            _BUFFER = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        # Los workers comparten el resource_tracker del proceso principal: sólo éste la libera
+        _SHM = SharedMemory(where)
+        _BUFFER = _SHM.buf
+    _FILTER = parse_filter
+
+
+def _worker(bounds):
+    start, end = bounds
+    return _parse_chunk(str(_BUFFER[start:end], 'utf-8'), _FILTER)
+
+
+class ParsedDump:
+    """Resultado unido: {nombre: NameColumns} en el orden del dump y metadatos"""
+
+    def __init__(self):
+        self.columns = {}
+        self.metadata = {}
+        self.chunk_seconds = []     # CPU de cada trozo en su worker
+        self.serial_seconds = 0.0   # trabajo del proceso principal: cortes, pool y unión
+
+    def merge(self, columns, metadata, seconds):
+        for name, column in columns.items():
+            mine = self.columns.get(name)
+            if mine is None:
+                self.columns[name] = column
+            else:
+                mine.extend(column)         # misma familia en varios nodos
+        for family, entry in metadata.items():
+            self.metadata.setdefault(family, entry)
+        self.chunk_seconds.append(seconds)
+
+    def __len__(self):
+        return sum(len(column) for column in self.columns.values())
+
+    def samples(self):
+        """prom_parser.Sample agrupadas por métrica (en dumps concatenados, nodo a nodo)"""
+        for name, column in self.columns.items():
+            family = column.family
+            for labels, value, ts in zip(column.labels, column.values, column.timestamps):
+                yield Sample(family, name, labels, value, None if ts == NO_TIMESTAMP else ts)
+
+    def grouped(self):
+        """{nombre: [{'value', 'timestamp', 'labels'}]}, como extract_metrics.group_samples"""
+        metrics = {}
+        for name, column in self.columns.items():
+            entries = metrics[name] = []
+            for labels, value, ts in zip(column.labels, column.values, column.timestamps):
+                entry = {'value': value, 'timestamp': None if ts == NO_TIMESTAMP else ts}
+                if labels:
+                    entry['labels'] = labels
+                entries.append(entry)
+        return metrics
+
+    def to_scrape(self, store=None):
+        """series_store.Scrape (para ColumnarSnapshot.from_scrape)"""
+        return (store or SeriesStore()).ingest(self.samples())
+
+
+def _run(buf, source, jobs, parse_filter):
+    """Reparte `buf` (bytes o mmap, sólo para buscar los cortes) entre `jobs` procesos"""
+    parsed = ParsedDump()
+    started = time.perf_counter()
+    ranges = split_ranges(buf, jobs * CHUNKS_PER_JOB)
+    with get_context().Pool(jobs, _init_worker, (source, parse_filter)) as pool:
+        serial = time.perf_counter() - started
+        # imap conserva el orden de los trozos: el resultado no depende del reparto
+        for result in pool.imap(_worker, ranges):
+            merged = time.perf_counter()
+            parsed.merge(*result)
+            serial += time.perf_counter() - merged
+    parsed.serial_seconds = serial
+    return parsed
+
+
+def _serial(metrics_text, parse_filter):
+    parsed = ParsedDump()
+    parsed.merge(*_parse_chunk(metrics_text, parse_filter))
+    return parsed
+
+
+def parse_file(path, jobs=None, parse_filter=None):
+    """Parsea un dump en `jobs` procesos (None = nº de CPUs); devuelve ParsedDump"""
+    jobs = jobs or os.cpu_count() or 1
+    with open(path, 'rb') as f:
+        if jobs == 1 or not os.fstat(f.fileno()).st_size:
+            return _serial(f.read().decode('utf-8'), parse_filter)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _run(mm, ('file', path), jobs, parse_filter)
+
+
+def parse_text_parallel(metrics_text, jobs=None, parse_filter=None):
+    """Igual que parse_file para un cuerpo ya descargado (se comparte, no se envía)"""
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or not metrics_text:
+        return _serial(metrics_text, parse_filter)
+    data = metrics_text.encode('utf-8')
+    shm = SharedMemory(create=True, size=len(data))
+    try:
+        shm.buf[:len(data)] = data
+        return _run(data, ('shm', shm.name), jobs, parse_filter)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _makespan(chunk_seconds, cores):
+    """Tiempo del núcleo más cargado repartiendo los trozos (mayor primero) entre `cores`"""
+    loads = [0.0] * cores
+    for seconds in sorted(chunk_seconds, reverse=True):
+        loads[loads.index(min(loads))] += seconds
+    return max(loads)
+
+
+def benchmark(path, jobs_list, repeat=3):
+    """Tiempo de parse_file por nº de procesos, frente al parseo en un solo proceso
+
+    `ideal_speedup` es el escalado con un núcleo libre por proceso: la CPU
+    medida de todos los trozos más el trabajo del proceso principal
+    (cortes, arranque del pool y unión) frente al trozo más cargado más
+    ese mismo trabajo. Con menos núcleos que procesos es la única forma de
+    ver el escalado; `speedup` es el medido en esta máquina.
+    """
+    size_mb = os.path.getsize(path) / 1e6
+    runs = []
+    base = None
+    for jobs in [1] + [j for j in jobs_list if j != 1]:
+        best, parsed = float('inf'), None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parsed = parse_file(path, jobs)
+            best = min(best, time.perf_counter() - start)
+        base = base or best
+        run = {'jobs': jobs, 'series': len(parsed), 'seconds': round(best, 3),
+               'mb_per_s': round(size_mb / best, 1), 'speedup': round(base / best, 2)}
+        if jobs > 1:
+            work = sum(parsed.chunk_seconds) + parsed.serial_seconds
+            run['chunks'] = len(parsed.chunk_seconds)
+            run['serial_s'] = round(parsed.serial_seconds, 3)
+            run['ideal_speedup'] = round(
+                work / (_makespan(parsed.chunk_seconds, jobs) + parsed.serial_seconds), 2)
+        runs.append(run)
+        del parsed
+    return {'file': path, 'size_mb': round(size_mb, 1), 'cpus': os.cpu_count(), 'runs': runs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parseo en paralelo de dumps de cAdvisor")
+    parser.add_argument('dump', nargs='?', help="dump a parsear")
+    parser.add_argument('--jobs', type=int, nargs='+', default=[os.cpu_count() or 1],
+                        help="procesos (con --benchmark, una lista: 1 2 4 8)")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="medir el escalado (sin DUMP, con un payload sintético)")
+    parser.add_argument('--scale', type=int, default=100, help="escala del payload sintético")
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        if not args.dump:
+            parser.error("falta DUMP (o --benchmark)")
+        start = time.perf_counter()
+        parsed = parse_file(args.dump, args.jobs[0])
+        seconds = time.perf_counter() - start
+        print(f"{args.dump}: {len(parsed)} series, {len(parsed.columns)} métricas, "
+              f"{len(parsed.chunk_seconds)} trozos en {args.jobs[0]} procesos, {seconds:.2f} s")
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.dump
+        if path is None:
+            from synthetic_metrics import generate
+            path = os.path.join(tmp, f"synthetic_{args.scale}x.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                generate(f, scale=args.scale)
+        result = benchmark(path, args.jobs)
+
+    print(f"{result['file']}: {result['size_mb']} MB, {result['cpus']} CPUs\n")
+    print(f"{'procesos':>8} {'series':>8} {'tiempo (s)':>10} {'MB/s':>7} {'speedup':>8} "
+          f"{'trozos':>6} {'serie (s)':>9} {'ideal':>6}")
+    for r in result['runs']:
+        print(f"{r['jobs']:8d} {r['series']:8d} {r['seconds']:10.3f} {r['mb_per_s']:7.1f} "
+              f"{r['speedup']:8.2f} {r.get('chunks', 1):6d} {r.get('serial_s', 0.0):9.3f} "
+              f"{r.get('ideal_speedup', 1.0):6.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Nombres de pod, namespace y contenedor para las rutas de cgroup de cAdvisor
+
+Sin las etiquetas container_label_io_kubernetes_* (vacías en muchos
+dumps), la etiqueta `id` es lo único que identifica a un contenedor:
+
+    /kubepods.slice/.../kubepods-besteffort-pod29159b9f_172c_....slice/crio-fe39bb59...
+
+De la ruta salen el UID del pod y el id del contenedor
+(cgroup_tree.classify_segment); el resto se resuelve con un proveedor de
+metadatos de pods:
+
+- KubectlFileProvider: un fichero `kubectl get pods -A -o json` (se
+  relee si cambia)
+- KubectlProvider: ejecuta kubectl (una llamada por lote de UIDs nuevos)
+- cualquier objeto con lookup(uids) -> {uid: PodInfo}
+
+PodMetadataCache guarda los pods resueltos con LRU (máx. `max_entries`)
+y TTL (pasado el TTL se vuelven a pedir; los UIDs desconocidos también
+se recuerdan durante el TTL). PodEnricher calcula el pod de cada serie
+una sola vez por serie del SeriesStore: en cada scrape sólo se hace una
+consulta a un dict por serie, nunca por muestra.
+
+Uso:
+    kubectl get pods -A -o json > pods.json
+    python3 pod_metadata.py pods.json [cadvisor_metrics.txt]
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import OrderedDict, namedtuple
+
+from cgroup_tree import ID_LABEL, classify_segment
+
+DEFAULT_TTL = 300.0
+DEFAULT_MAX_ENTRIES = 4096
+KUBECTL_COMMAND = ('kubectl', 'get', 'pods', '--all-namespaces', '-o', 'json')
+
+POD_NAME_LABEL = 'container_label_io_kubernetes_pod_name'
+POD_NAMESPACE_LABEL = 'container_label_io_kubernetes_pod_namespace'
+POD_UID_LABEL = 'container_label_io_kubernetes_pod_uid'
+CONTAINER_NAME_LABEL = 'container_label_io_kubernetes_container_name'
+
+# crio-conmon-<id>.scope: el proceso monitor de CRI-O de ese contenedor
+_CONMON_RE = re.compile(r'^crio-conmon-([0-9a-f]{64})\.scope$')
+
+PodInfo = namedtuple('PodInfo', ['uid', 'name', 'namespace', 'node', 'owner_kind', 'owner_name',
+                                 'labels', 'containers'])
+PodInfo.__doc__ = """Metadatos de un pod; containers: {id de contenedor (64 hex): nombre}"""
+
+Identity = namedtuple('Identity', ['namespace', 'pod', 'container', 'pod_uid', 'workload'])
+Identity.__doc__ = """Resultado del enriquecimiento de una ruta de cgroup (None donde no se sabe)"""
+
+
+def pod_info_from_json(item):
+    """PodInfo de un elemento de `kubectl get pods -o json`"""
+    metadata = item.get('metadata', {})
+    status = item.get('status', {})
+    owners = metadata.get('ownerReferences') or [{}]
+    containers = {}
+    for key in ('initContainerStatuses', 'containerStatuses', 'ephemeralContainerStatuses'):
+        for container in status.get(key) or ():
+            # "cri-o://<id>", "containerd://<id>", "docker://<id>"
+            container_id = (container.get('containerID') or '').rpartition('://')[2]
+            if container_id:
+                containers[container_id] = container.get('name')
+    return PodInfo(metadata.get('uid'), metadata.get('name'), metadata.get('namespace'),
+                   item.get('spec', {}).get('nodeName'), owners[0].get('kind'), owners[0].get('name'),
+                   metadata.get('labels') or {}, containers)
+
+
+def workload_of(info):
+    """Nombre del controlador: el Deployment de un ReplicaSet, el propio dueño o el pod"""
+    if info.owner_kind == 'ReplicaSet' and info.owner_name:
+        return info.owner_name.rpartition('-')[0] or info.owner_name
+    return info.owner_name or info.name
+
+
+def _index_pods(document):
+    return {info.uid: info for info in map(pod_info_from_json, document.get('items', ())) if info.uid}
+
+
+class KubectlFileProvider:
+    """Pods de un fichero `kubectl get pods -o json`; se relee sólo si cambia su mtime"""
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._pods = {}
+
+    def lookup(self, uids):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            with open(self.path, encoding='utf-8') as f:
+                self._pods = _index_pods(json.load(f))
+            self._mtime = mtime
+        return {uid: self._pods[uid] for uid in uids if uid in self._pods}
+
+
+class KubectlProvider:
+    """Pods del clúster con kubectl: una sola llamada por lote de UIDs pendientes"""
+
+    def __init__(self, command=KUBECTL_COMMAND, timeout=30):
+        self.command = list(command)
+        self.timeout = timeout
+
+    def lookup(self, uids):
+        output = subprocess.run(self.command, check=True, capture_output=True, text=True,
+                                timeout=self.timeout).stdout
+        pods = _index_pods(json.loads(output))
+        return {uid: pods[uid] for uid in uids if uid in pods}
+
+
+class PodMetadataCache:
+    """UID -> PodInfo con LRU y TTL por entrada delante de un proveedor"""
+
+    def __init__(self, provider, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        self.provider = provider
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()       # uid -> (PodInfo o None, caduca)
+        self.stats = {'hits': 0, 'misses': 0, 'lookups': 0, 'evictions': 0, 'errors': 0}
+
+    def resolve(self, uids):
+        """{uid: PodInfo o None}; los UIDs ausentes o caducados se piden en una sola llamada"""
+        now = self.clock()
+        entries = self._entries
+        result, pending = {}, []
+        for uid in uids:
+            entry = entries.get(uid)
+            if entry is not None and entry[1] > now:
+                entries.move_to_end(uid)
+                result[uid] = entry[0]
+                self.stats['hits'] += 1
+            else:
+                pending.append(uid)
+        if pending:
+            self.stats['misses'] += len(pending)
+            self.stats['lookups'] += 1
+            try:
+                found = self.provider.lookup(pending)
+            except (OSError, ValueError, subprocess.SubprocessError):
+                # Sin proveedor se sigue con lo que hubiera (aunque haya caducado)
+                self.stats['errors'] += 1
+                for uid in pending:
+                    entry = entries.get(uid)
+                    result[uid] = entry[0] if entry is not None else None
+                return result
+            expires = now + self.ttl
+            for uid in pending:
+                info = found.get(uid)
+                entries[uid] = (info, expires)
+                entries.move_to_end(uid)
+                result[uid] = info
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return result
+
+    def get(self, uid):
+        return self.resolve([uid])[uid]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def parse_cgroup_path(path):
+    """(uid del pod, id del contenedor, es conmon) a partir de una ruta de cgroup"""
+    pod_uid = container_id = None
+    conmon = False
+    for segment in path.split('/'):
+        if not segment:
+            continue
+        kind, detail = classify_segment(segment)
+        if kind == 'pod':
+            pod_uid = detail
+        elif kind == 'container':
+            container_id = detail
+        else:
+            m = _CONMON_RE.match(segment)
+            if m:
+                container_id, conmon = m.group(1), True
+    return pod_uid, container_id, conmon
+
+
+class PodEnricher:
+    """Identidad (namespace/pod/contenedor) de cada serie, calculada una vez por serie
+
+    Las etiquetas de Kubernetes del propio cAdvisor tienen prioridad; si
+    están vacías, se usa el UID de la ruta y la PodMetadataCache.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._paths = {}            # ruta -> (uid, id de contenedor, conmon)
+        self._store = None
+        self._epoch = 0
+        self._sid_keys = []         # sid -> ruta o None
+
+    def _parsed(self, path):
+        parsed = self._paths.get(path)
+        if parsed is None:
+            parsed = self._paths[path] = parse_cgroup_path(path)
+        return parsed
+
+    def _path_key(self, series):
+        path = series.labels.get(ID_LABEL)
+        if path:
+            self._parsed(path)
+        return path
+
+    def paths_of(self, store):
+        """Ruta de cgroup por sid (lista), extendida sólo con las series nuevas"""
+        if store is not self._store or store.epoch != self._epoch:
+            self._store, self._epoch, self._sid_keys = store, store.epoch, []
+        known = len(self._sid_keys)
+        if len(store.series) > known:
+            self._sid_keys.extend(self._path_key(s) for s in store.series[known:])
+        return self._sid_keys
+
+    def identities(self, paths, labels_of=None):
+        """{ruta: Identity} de un conjunto de rutas, con una sola resolución de UIDs"""
+        parsed = {path: self._parsed(path) for path in paths}
+        pods = self.cache.resolve({uid for uid, _, _ in parsed.values() if uid})
+        result = {}
+        for path, (uid, container_id, conmon) in parsed.items():
+            labels = labels_of(path) if labels_of else None
+            if labels and labels.get(POD_NAME_LABEL):
+                name = labels.get(CONTAINER_NAME_LABEL)
+                result[path] = Identity(labels.get(POD_NAMESPACE_LABEL), labels[POD_NAME_LABEL],
+                                        name, labels.get(POD_UID_LABEL) or uid, None)
+                continue
+            info = pods.get(uid) if uid else None
+            if info is None:
+                result[path] = Identity(None, None, None, uid, None)
+                continue
+            name = info.containers.get(container_id) if container_id else None
+            if container_id and name is None:
+                # Sandbox (pause) o contenedor reiniciado después de la última consulta
+                name = container_id[:12]
+            if conmon:
+                name = f"{name}(conmon)"
+            result[path] = Identity(info.namespace, info.name, name, uid, workload_of(info))
+        return result
+
+    def enrich_scrape(self, scrape):
+        """{sid: Identity} de las series de un scrape: una consulta de dict por serie"""
+        paths = self.paths_of(scrape.store)
+        series = scrape.store.series
+        sids = set(scrape.sids)
+        wanted = {paths[sid] for sid in sids if paths[sid]}
+        first = {}
+        for sid in sids:
+            first.setdefault(paths[sid], series[sid].labels)
+        identities = self.identities(wanted, first.get)
+        return {sid: identities.get(paths[sid]) for sid in sids}
+
+
+def readable_name(identity, path):
+    """'namespace/pod/contenedor' (o 'namespace/pod' para el cgroup del pod); la ruta si no se conoce"""
+    if identity is None or not identity.pod:
+        return path
+    parts = [identity.namespace or '-', identity.pod]
+    if identity.container:
+        parts.append(identity.container)
+    return '/'.join(parts)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"Uso: {sys.argv[0]} PODS_JSON [cadvisor_metrics.txt]")
+        return 1
+    from series_store import SeriesStore
+
+    dump = sys.argv[2] if len(sys.argv) > 2 else 'cadvisor_metrics.txt'
+    with open(dump, encoding='utf-8') as f:
+        scrape = SeriesStore().ingest_text(f.read())
+    enricher = PodEnricher(PodMetadataCache(KubectlFileProvider(sys.argv[1])))
+
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        identities = enricher.enrich_scrape(scrape)
+        timings.append((time.perf_counter() - start) * 1000)
+    paths = enricher.paths_of(scrape.store)
+    named = {paths[sid]: readable_name(identity, paths[sid])
+             for sid, identity in identities.items() if paths[sid]}
+    resolved = sum(1 for path, name in named.items() if name != path)
+    print(f"{dump}: {len(scrape)} series, {len(named)} cgroups, {resolved} con nombre")
+    print(f"  enriquecimiento: {timings[0]:.1f} ms el primer scrape, {timings[-1]:.1f} ms los siguientes")
+    print(f"  caché: {len(enricher.cache)} pods, {enricher.cache.stats}\n")
+    for path, name in sorted(named.items(), key=lambda item: item[1]):
+        if name != path:
+            print(f"  {name:60} {path[-40:]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Planificador de sondeos sin deriva para los monitores
+
+`display(); time.sleep(5)` tarda en realidad 5 s + descarga + parseo +
+pintado, y cada vez más según crece el payload. Aquí los sondeos se
+anclan a un reloj monotónico: el sondeo k toca en inicio + k·intervalo,
+dure lo que dure cada uno.
+
+- Si un sondeo se pasa de su plazo, los ticks que se han quedado atrás
+  se saltan (y se cuentan) en lugar de encadenarse.
+- Si el endpoint falla o tarda más de `slow_fraction` del intervalo, el
+  intervalo se dobla (hasta `max_backoff` veces) y vuelve a bajar a la
+  mitad con cada sondeo rápido.
+- Con varios objetivos, `phase` desplaza cada uno una fracción aleatoria
+  del intervalo y `jitter` mueve cada tick (sin acumularse), para que no
+  descarguen todos a la vez.
+- Duración de los sondeos (p50/p95/p99, con quantile_sketch.DDSketch),
+  retraso sobre el plazo, ticks perdidos y fallos en stats().
+
+Uso:
+    python3 poll_scheduler.py [--interval 0.2] [--ticks 50]   # simulación con sondeos lentos
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from quantile_sketch import DDSketch
+
+DEFAULT_SLOW_FRACTION = 0.8
+DEFAULT_MAX_BACKOFF = 8
+
+
+class PollScheduler:
+    """Ejecuta una tarea en plazos fijos de un reloj monotónico"""
+
+    def __init__(self, interval, jitter=0.0, phase=False, slow_fraction=DEFAULT_SLOW_FRACTION,
+                 max_backoff=DEFAULT_MAX_BACKOFF, clock=time.monotonic, sleep=time.sleep, seed=None):
+        self.interval = interval
+        self.jitter = jitter
+        self.slow_fraction = slow_fraction
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.sleep = sleep
+        self._random = random.Random(seed)
+        self._phase = self._random.uniform(0, interval) if phase else 0.0
+        self.backoff = 1
+        self._anchor = None         # instante del tick 0 del intervalo actual
+        self._tick = 0
+        self._stopped = False
+        self.ticks = 0
+        self.missed = 0
+        self.failures = 0
+        self.durations = DDSketch()
+        self.lateness = DDSketch()
+        self.last_duration = None
+
+    @property
+    def current_interval(self):
+        return self.interval * self.backoff
+
+    def _deadline(self, tick):
+        jitter = self._random.uniform(-self.jitter, self.jitter) * self.current_interval if self.jitter else 0.0
+        return self._anchor + tick * self.current_interval + jitter
+
+    def stop(self):
+        self._stopped = True
+
+    def _wait_until(self, deadline, wait):
+        while not self._stopped:
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return
+            wait(remaining)
+
+    def _adapt(self, ok, duration):
+        """Dobla o reduce a la mitad el intervalo; reancla los plazos si cambia"""
+        slow = duration > self.slow_fraction * self.current_interval
+        backoff = self.backoff
+        if not ok or slow:
+            backoff = min(backoff * 2, self.max_backoff)
+        elif backoff > 1:
+            backoff = max(backoff // 2, 1)
+        if backoff != self.backoff:
+            # El tick actual es el nuevo origen: sin salto hacia atrás ni deriva acumulada
+            self._anchor += self._tick * self.current_interval
+            self._tick = 0
+            self.backoff = backoff
+
+    def run_once(self, task, wait=None):
+        """Espera al siguiente plazo, ejecuta task() y programa el siguiente; devuelve su resultado
+
+        task() falla si lanza una excepción (se propaga) o devuelve False.
+        """
+        if self._anchor is None:
+            self._anchor = self.clock() + self._phase
+        deadline = self._deadline(self._tick)
+        self._wait_until(deadline, wait or self.sleep)
+        if self._stopped:
+            return None
+
+        start = self.clock()
+        self.lateness.add(max(start - deadline, 0.0))
+        ok, result = False, None
+        try:
+            result = task()
+            ok = result is not False
+        finally:
+            duration = self.clock() - start
+            self.last_duration = duration
+            self.durations.add(duration)
+            self.ticks += 1
+            if not ok:
+                self.failures += 1
+            self._adapt(ok, duration)
+            # Siguiente tick que aún no ha pasado; los que ya pasaron se pierden
+            now = self.clock()
+            following = self._tick + 1
+            late = int((now - self._anchor) // self.current_interval) + 1 - following
+            if late > 0:
+                self.missed += late
+                following += late
+            self._tick = following
+        return result
+
+    def run(self, task, max_ticks=None, wait=None):
+        """Bucle hasta stop(), KeyboardInterrupt o max_ticks sondeos"""
+        self._stopped = False
+        while not self._stopped and (max_ticks is None or self.ticks < max_ticks):
+            self.run_once(task, wait)
+
+    def stats(self):
+        return {
+            'interval_s': self.interval,
+            'current_interval_s': self.current_interval,
+            'ticks': self.ticks,
+            'missed_ticks': self.missed,
+            'failures': self.failures,
+            'duration_s': {f"p{round(q * 100)}": (None if v is None else round(v, 4))
+                           for q, v in self.durations.quantiles().items()},
+            'max_duration_s': round(self.durations.max, 4) if self.ticks else None,
+            'lateness_p99_s': None if not self.ticks else round(self.lateness.quantile(0.99), 4),
+        }
+
+    def summary(self):
+        """Una línea para el pie del monitor"""
+        d = self.stats()['duration_s']
+        text = (f"cada {self.current_interval:g}s, {self.ticks} sondeos, {self.missed} ticks perdidos, "
+                f"{self.failures} fallos")
+        if self.ticks:
+            text += f", duración p50 {d['p50'] * 1000:.0f} ms / p95 {d['p95'] * 1000:.0f} ms / p99 {d['p99'] * 1000:.0f} ms"
+        if self.backoff > 1:
+            text += f" (backoff x{self.backoff})"
+        return text
+
+
+def simulate(interval=0.2, ticks=50, seed=1):
+    """Compara el bucle sleep(interval) con el planificador ante sondeos de duración variable"""
+    rng = random.Random(seed)
+    durations = [rng.uniform(0.05, 0.15) * interval * 5 if i % 10 else interval * 2.5
+                 for i in range(ticks)]
+
+    def task_factory():
+        it = iter(durations)
+        return lambda: time.sleep(next(it))
+
+    task = task_factory()
+    start = time.monotonic()
+    for _ in range(ticks):
+        task()
+        time.sleep(interval)
+    naive = time.monotonic() - start
+
+    scheduler = PollScheduler(interval, jitter=0.05, seed=seed)
+    task = task_factory()
+    start = time.monotonic()
+    scheduler.run(task, max_ticks=ticks)
+    scheduled = time.monotonic() - start
+    return {
+        'expected_s': round(ticks * interval, 2),
+        'sleep_loop_s': round(naive, 2),
+        'scheduler_s': round(scheduled, 2),
+        'scheduler': scheduler.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Planificador de sondeos sin deriva (simulación)")
+    parser.add_argument('--interval', type=float, default=0.2)
+    parser.add_argument('--ticks', type=int, default=50)
+    args = parser.parse_args()
+    for key, value in simulate(args.interval, args.ticks).items():
+        print(f"  {key:14}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
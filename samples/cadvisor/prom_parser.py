@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Parser compartido del formato de exposición de texto de Prometheus
+
+Recorre cada línea una sola vez con un cursor que sólo avanza, respeta
+los escapes de los valores de las etiquetas (\\\\, \\" y \\n) y devuelve
+muestras tipadas. Los bloques de etiquetas en la forma canónica de
+cAdvisor (k="v",k="v" sin espacios ni escapes) se trocean con un split en
+lugar de recorrerlos carácter a carácter; el resto sigue el camino general.
+
+Con un ParseFilter el filtrado se hace durante el parseo (pushdown): las
+familias descartadas se saltan por su bloque # HELP / # TYPE sin
+tokenizar sus líneas, y las etiquetas descartadas (o vacías, que en
+Prometheus equivalen a no tenerlas) no llegan a las muestras.
+
+Uso:
+    python3 prom_parser.py [cadvisor_metrics.txt]              # benchmark de throughput
+    python3 prom_parser.py [cadvisor_metrics.txt] --pushdown   # ahorro de tiempo y memoria con filtros
+"""
+
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from fnmatch import fnmatchcase
+
+# Objetivo de throughput sobre cadvisor_metrics.txt (3.8 MB, 4.7k series)
+TARGET_MB_PER_S = 25.0
+
+# Sufijos que pertenecen a la familia declarada en # TYPE (histogram/summary)
+FAMILY_SUFFIXES = ('_bucket', '_sum', '_count', '_created')
+
+Sample = namedtuple('Sample', ['family', 'name', 'labels', 'value', 'timestamp'])
+Sample.__doc__ = """Muestra parseada: familia, nombre, etiquetas, valor y timestamp (ms o None)"""
+
+_ESCAPES = {'\\': '\\', '"': '"', 'n': '\n'}
+
+# Nombres de etiqueta ya validados por _split_labels (nombre -> instancia internada)
+_LABEL_NAMES = {}
+_NOT_IN_NAME = frozenset(' \t=,{}"')
+
+
+def _matcher(patterns):
+    """Función nombre -> bool para nombres exactos y patrones glob ('container_fs_*')"""
+    patterns = list(patterns)
+    exact = frozenset(p for p in patterns if not any(c in p for c in '*?['))
+    globs = [p for p in patterns if p not in exact]
+    return lambda name: name in exact or any(fnmatchcase(name, g) for g in globs)
+
+
+class ParseFilter:
+    """Qué familias y etiquetas materializa el parser
+
+    include: familias a conservar (None = todas); exclude: familias a
+    descartar. Ambas admiten nombres exactos y patrones glob.
+    drop_labels: etiquetas que se descartan siempre (nombres o globs).
+    drop_empty_labels: descarta las etiquetas con valor "".
+    Las decisiones se cachean por nombre: el coste por línea es un dict.
+    Se puede enviar a otros procesos (pickle guarda sólo los argumentos).
+    """
+
+    def __init__(self, include=None, exclude=(), drop_labels=(), drop_empty_labels=False):
+        include = None if include is None else tuple(include)
+        exclude, drop_labels = tuple(exclude), tuple(drop_labels)
+        self._args = (include, exclude, drop_labels, drop_empty_labels)
+        self._include = None if include is None else _matcher(include)
+        self._exclude = _matcher(exclude)
+        self._drop = _matcher(drop_labels) if drop_labels else None
+        self.drop_empty_labels = drop_empty_labels
+        # Sin reglas de familia no hace falta saltar bloques (parse_text usa splitlines)
+        self.filters_families = include is not None or bool(exclude)
+        self._families = {}
+        self._labels = {}
+
+    def __reduce__(self):
+        return ParseFilter, self._args
+
+    def keeps(self, family):
+        keep = self._families.get(family)
+        if keep is None:
+            keep = self._families[family] = (
+                (self._include is None or self._include(family)) and not self._exclude(family))
+        return keep
+
+    def drops_label(self, name):
+        if self._drop is None:
+            return False
+        drop = self._labels.get(name)
+        if drop is None:
+            drop = self._labels[name] = self._drop(name)
+        return drop
+
+
+# Filtro común de los scripts: en Prometheus una etiqueta vacía equivale a no tenerla
+DEFAULT_PARSE_FILTER = ParseFilter(drop_empty_labels=True)
+
+
+def _unescape_label_value(line, pos):
+    """Lee un valor de etiqueta con escapes a partir de pos (tras la comilla).
+
+    Devuelve (valor, posición tras la comilla de cierre).
+    """
+    chars = []
+    length = len(line)
+    while pos < length:
+        c = line[pos]
+        if c == '\\':
+            nxt = line[pos + 1]
+            chars.append(_ESCAPES.get(nxt, '\\' + nxt))
+            pos += 2
+        elif c == '"':
+            return ''.join(chars), pos + 1
+        else:
+            chars.append(c)
+            pos += 1
+    raise ValueError("valor de etiqueta sin cerrar")
+
+
+def _split_labels(line, pos, parse_filter):
+    """Camino rápido de _parse_labels para la forma canónica k="v",k="v"
+
+    Es la que escribe cAdvisor: sin espacios ni escapes, el bloque se
+    trocea con split/partition en lugar de recorrerlo carácter a carácter.
+    Devuelve None si el bloque no tiene exactamente esa forma.
+    """
+    end = line.rfind('}')
+    block = line[pos:end]
+    if end == -1 or not block.endswith('"') or '\\' in block:
+        return None
+    parts = block[:-1].split('",')
+    # Dos comillas por etiqueta: ningún valor contiene '"' ni '",'
+    if block.count('"') != 2 * len(parts):
+        return None
+    names = _LABEL_NAMES
+    drop_empty = parse_filter is not None and parse_filter.drop_empty_labels
+    drops_label = parse_filter.drops_label if parse_filter is not None else None
+    labels = {}
+    for part in parts:
+        raw, sep, value = part.partition('="')
+        name = names.get(raw)
+        if name is None or not sep:
+            if not sep or not raw or not _NOT_IN_NAME.isdisjoint(raw):
+                return None
+            name = names[raw] = sys.intern(raw)
+        if (drop_empty and not value) or (drops_label is not None and drops_label(name)):
+            continue
+        labels[name] = value
+    return labels, end + 1
+
+
+def _parse_labels(line, pos, parse_filter=None):
+    """Parsea el bloque {k="v",...} empezando justo después de '{'.
+
+    Devuelve (dict de etiquetas, posición tras '}'). Con parse_filter, las
+    etiquetas descartadas (y las vacías, si se piden así) no llegan al dict.
+    """
+    parsed = _split_labels(line, pos, parse_filter)
+    if parsed is not None:
+        return parsed
+
+    # Espacios, escapes o bloque mal formado: etiqueta a etiqueta
+    labels = {}
+    intern = sys.intern
+    drop_empty = parse_filter is not None and parse_filter.drop_empty_labels
+    drops_label = parse_filter.drops_label if parse_filter is not None else None
+    while True:
+        while line[pos] in ' \t':
+            pos += 1
+        if line[pos] == '}':
+            return labels, pos + 1
+
+        start = pos
+        eq = line.index('=', pos)
+        pos = eq + 1
+        while line[pos] in ' \t':
+            pos += 1
+        if line[pos] != '"':
+            raise ValueError(f"se esperaba '\"' en la columna {pos}")
+        pos += 1
+
+        end = line.index('"', pos)
+        if end == pos and drop_empty:
+            pos = end + 1
+        elif line.find('\\', pos, end) == -1:
+            name = line[start:eq].strip()
+            if drops_label is None or not drops_label(name):
+                labels[intern(name)] = line[pos:end]
+            pos = end + 1
+        else:
+            name = line[start:eq].strip()
+            value, pos = _unescape_label_value(line, pos)
+            if drops_label is None or not drops_label(name):
+                labels[intern(name)] = value
+
+        while line[pos] in ' \t':
+            pos += 1
+        if line[pos] == ',':
+            pos += 1
+        elif line[pos] != '}':
+            raise ValueError(f"se esperaba ',' o '}}' en la columna {pos}")
+
+
+def _unescape_help(text):
+    """Deshace los escapes permitidos en las líneas # HELP"""
+    if '\\' not in text:
+        return text
+    return text.replace('\\\\', '\x00').replace('\\n', '\n').replace('\x00', '\\')
+
+
+def _parse_comment(line, metadata):
+    """Procesa '# HELP' y '# TYPE'. Devuelve el nombre de la familia o None."""
+    parts = line.split(None, 3)
+    if len(parts) < 3 or parts[1] not in ('HELP', 'TYPE'):
+        return None
+    family = parts[2]
+    if metadata is not None:
+        entry = metadata.setdefault(family, {'type': 'untyped', 'help': ''})
+        rest = parts[3] if len(parts) > 3 else ''
+        if parts[1] == 'TYPE':
+            entry['type'] = rest.strip()
+        else:
+            entry['help'] = _unescape_help(rest)
+    return family
+
+
+def parse_sample_line(line, family=None, parse_filter=None):
+    """Parsea una línea de muestra. Lanza ValueError/IndexError si está mal formada."""
+    length = len(line)
+    pos = 0
+    while pos < length and line[pos] not in '{ \t':
+        pos += 1
+    name = line[:pos]
+    if not name:
+        raise ValueError("línea sin nombre de métrica")
+
+    if pos < length and line[pos] == '{':
+        labels, pos = _parse_labels(line, pos + 1, parse_filter)
+    else:
+        labels = {}
+
+    rest = line[pos:].split()
+    value = float(rest[0])
+    timestamp = int(rest[1]) if len(rest) > 1 else None
+
+    if family is None or (name != family and not (
+            name.startswith(family) and name[len(family):] in FAMILY_SUFFIXES)):
+        family = name
+    return Sample(family, name, labels, value, timestamp)
+
+
+def iter_samples(lines, metadata=None, parse_filter=None):
+    """Genera Sample a partir de un iterable de líneas (lista, fichero, stream...).
+
+    Si se pasa `metadata` (dict) se rellena con {familia: {'type', 'help'}}.
+    Las líneas mal formadas se ignoran, igual que hacían los scripts.
+    Con `parse_filter`, las líneas de una familia descartada sólo se comparan
+    con su nombre (no se tokenizan) y no se guardan sus metadatos.
+    """
+    if parse_filter is None:
+        family = None
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line[0] == '#':
+                declared = _parse_comment(line, metadata)
+                if declared is not None:
+                    family = declared
+                continue
+            try:
+                yield parse_sample_line(line, family)
+            except (ValueError, IndexError):
+                pass
+        return
+
+    keeps = parse_filter.keeps
+    family, skipping = None, False
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] == '#':
+            declared = _parse_comment(line, None)
+            if declared is not None:
+                family = declared
+                skipping = not keeps(family)
+                if not skipping:
+                    _parse_comment(line, metadata)
+            continue
+        if skipping and line.startswith(family):
+            continue
+        try:
+            sample = parse_sample_line(line, family, parse_filter)
+        except (ValueError, IndexError):
+            continue
+        # Familias sin cabecera: se decide por la propia muestra
+        if sample.family == family or keeps(sample.family):
+            yield sample
+
+
+def _filtered_lines(metrics_text, parse_filter):
+    """Líneas del texto sin los bloques de familias descartadas.
+
+    Cada cabecera # HELP / # TYPE se lee una vez; si su familia no pasa el
+    filtro, el bloque hasta la siguiente cabecera se salta con find() sin
+    partirlo en líneas. Se asume, como hace cAdvisor, que tras cada cabecera
+    sólo vienen muestras de esa familia.
+    """
+    size = len(metrics_text)
+    pos = 0
+    while pos < size:
+        if metrics_text[pos] == '#':
+            end = metrics_text.find('\n', pos)
+            end = size if end == -1 else end
+            declared = _parse_comment(metrics_text[pos:end], None)
+            if declared is not None and not parse_filter.keeps(declared):
+                nxt = metrics_text.find('\n#', end)
+                pos = size if nxt == -1 else nxt + 1
+                continue
+            yield metrics_text[pos:end]
+            pos = end + 1
+        nxt = metrics_text.find('\n#', max(pos - 1, 0))
+        block_end = size if nxt == -1 else nxt
+        if pos < block_end:
+            yield from metrics_text[pos:block_end].splitlines()
+        pos = block_end + 1
+
+
+def parse_text(metrics_text, metadata=None, parse_filter=None):
+    """Genera Sample a partir del texto completo de /metrics"""
+    if parse_filter is None:
+        return iter_samples(metrics_text.splitlines(), metadata)
+    if not parse_filter.filters_families:
+        # Sólo reglas de etiquetas: splitlines es más rápido que buscar bloques
+        return iter_samples(metrics_text.splitlines(), metadata, parse_filter)
+    return iter_samples(_filtered_lines(metrics_text, parse_filter), metadata, parse_filter)
+
+
+def benchmark(filepath, repeat=11):
+    """Mide el throughput del parser sobre un fichero de métricas
+
+    Se compara con el objetivo la mediana de las repeticiones (no la mejor),
+    para que el resultado no dependa de una ejecución con suerte.
+    """
+    with open(filepath, encoding='utf-8') as f:
+        text = f.read()
+    size_mb = len(text.encode('utf-8')) / 1e6
+
+    times = []
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in parse_text(text))
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+
+    return {
+        'file': filepath,
+        'size_mb': round(size_mb, 2),
+        'samples': count,
+        'seconds': round(median, 4),
+        'mb_per_s': round(size_mb / median, 2),
+        'best_mb_per_s': round(size_mb / min(times), 2),
+        'samples_per_s': int(count / median),
+        'target_mb_per_s': TARGET_MB_PER_S,
+    }
+
+
+def pushdown_benchmark(filepath, families, repeat=15):
+    """Tiempo y memoria de parsear (list) el fichero con y sin filtros"""
+    with open(filepath, encoding='utf-8') as f:
+        text = f.read()
+    filters = {
+        'sin filtro': None,
+        'sin etiquetas vacías': ParseFilter(drop_empty_labels=True),
+        f'{len(families)} familias': ParseFilter(include=families),
+        f'{len(families)} familias sin vacías': ParseFilter(include=families, drop_empty_labels=True),
+    }
+    results = {}
+    for name, parse_filter in filters.items():
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            samples = list(parse_text(text, None, parse_filter))
+            best = min(best, time.perf_counter() - start)
+        del samples
+        tracemalloc.start()
+        samples = list(parse_text(text, None, parse_filter))
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {
+            'samples': len(samples),
+            'labels': sum(len(s.labels) for s in samples),
+            'seconds': round(best, 4),
+            'retained_mb': round(retained / 1e6, 2),
+            'peak_mb': round(peak / 1e6, 2),
+        }
+        del samples
+    return results
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    filepath = args[0] if args else 'cadvisor_metrics.txt'
+    if '--pushdown' in sys.argv:
+        # Las familias que usa extract_key_metrics
+        from extract_metrics import KEY_FAMILIES
+        results = pushdown_benchmark(filepath, KEY_FAMILIES)
+        base = results['sin filtro']
+        print(f"{'filtro':>26} {'series':>7} {'etiquetas':>10} {'tiempo (s)':>10} "
+              f"{'retenido (MB)':>14} {'pico (MB)':>10}")
+        for name, r in results.items():
+            print(f"{name:>26} {r['samples']:7d} {r['labels']:10d} {r['seconds']:10.4f} "
+                  f"{r['retained_mb']:14.2f} {r['peak_mb']:10.2f}"
+                  f"  (x{base['seconds'] / r['seconds']:.1f} tiempo, "
+                  f"-{100 * (1 - r['retained_mb'] / base['retained_mb']):.0f}% memoria)")
+        return 0
+    result = benchmark(filepath)
+    for key, value in result.items():
+        print(f"  {key:16}: {value}")
+    ok = result['mb_per_s'] >= TARGET_MB_PER_S
+    print(f"\n{'✓' if ok else '✗'} Objetivo {TARGET_MB_PER_S} MB/s")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,657 @@
+#!/usr/bin/env python3
+"""
+Evaluador local de un subconjunto de PromQL (sin servidor Prometheus)
+
+Ejecuta consultas sobre scrapes en vivo (ScrapeCache / ColumnarSnapshot),
+dumps offline y el histórico de tsdb.py. Subconjunto soportado:
+
+- selectores con matchers: metrica{a="x",b=~"y.*",c!="",d!~"z"} y rangos [5m]
+- rate, irate e increase sobre un selector de rango
+- sum, avg, max, min y count con by (...) o without (...)
+- + - * / % ^ y comparaciones (== != > < >= <=, como filtro) entre vectores
+  y escalares; entre dos vectores el emparejamiento es uno a uno, por todas
+  las etiquetas salvo __name__ o con on (...) / ignoring (...)
+
+Las muestras se guardan en arrays NumPy ordenados por (sid, timestamp) y
+la evaluación es vectorizada: los selectores usan el índice invertido de
+label_index y los emparejamientos por etiquetas usan un código entero por
+sid que se calcula una sola vez y queda cacheado.
+
+rate e increase usan la primera y la última muestra de la ventana (con
+corrección de reinicios de counter) sin extrapolar a los bordes de la
+ventana como hace Prometheus.
+
+Uso:
+    python3 promql.py 'sum by (cpu) (container_cpu_usage_seconds_total)' [--file dump.txt] [--tsdb hist.tsdb]
+    python3 promql.py --benchmark [--file cadvisor_metrics.txt] [--nodes 20]
+"""
+
+import argparse
+import re
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from http_fetch import DEFAULT_FETCHER
+from label_index import NAME_LABEL, LabelIndex, parse_selector
+from prom_parser import parse_text
+from series_store import NO_TIMESTAMP, SeriesStore
+from tsdb import TSDBReader
+
+CADVISOR_URL = "http://localhost:8080/metrics"
+DEFAULT_LOOKBACK_MS = 5 * 60 * 1000
+
+_DURATION_UNITS = {'ms': 1, 's': 1000, 'm': 60000, 'h': 3600000,
+                   'd': 86400000, 'w': 604800000, 'y': 31536000000}
+_DURATION_RE = re.compile(r'(\d+)(ms|s|m|h|d|w|y)')
+
+_TOKEN_RE = re.compile(r'''\s*(?:
+      (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<range>\[[^\]]*\])
+    | (?P<braces>\{(?:[^}"]|"(?:[^"\\]|\\.)*")*\})
+    | (?P<ident>[a-zA-Z_:][a-zA-Z0-9_:]*)
+    | (?P<op>==|!=|>=|<=|[-+*/%^<>(),])
+    )''', re.X)
+
+AGGREGATIONS = ('sum', 'avg', 'max', 'min', 'count')
+RANGE_FUNCTIONS = ('rate', 'irate', 'increase')
+
+ARITHMETIC_OPS = {'+': np.add, '-': np.subtract, '*': np.multiply,
+                  '/': np.divide, '%': np.fmod, '^': np.power}
+COMPARISON_OPS = {'==': np.equal, '!=': np.not_equal, '>': np.greater,
+                  '<': np.less, '>=': np.greater_equal, '<=': np.less_equal}
+
+# Precedencia de menor a mayor (^ es asociativo por la derecha)
+_PRECEDENCE = [tuple(COMPARISON_OPS), ('+', '-'), ('*', '/', '%'), ('^',)]
+
+# Nodos del árbol sintáctico
+Number = namedtuple('Number', ['value'])
+Selector = namedtuple('Selector', ['matchers', 'range_ms'])
+Call = namedtuple('Call', ['func', 'arg'])
+Aggregate = namedtuple('Aggregate', ['op', 'labels', 'without', 'expr'])
+Binary = namedtuple('Binary', ['op', 'lhs', 'rhs', 'on', 'labels'])
+Binary.__doc__ = """on: None (todas las etiquetas), True (on) o False (ignoring)"""
+
+
+def parse_duration(text):
+    """'5m', '1h30m', '500ms' -> milisegundos"""
+    text = text.strip()
+    pos, total = 0, 0
+    while pos < len(text):
+        m = _DURATION_RE.match(text, pos)
+        if m is None:
+            raise ValueError(f"duración inválida: {text}")
+        total += int(m.group(1)) * _DURATION_UNITS[m.group(2)]
+        pos = m.end()
+    if not total:
+        raise ValueError(f"duración inválida: {text}")
+    return total
+
+
+def _tokenize(query):
+    tokens = []
+    pos = 0
+    query = query.rstrip()
+    while pos < len(query):
+        m = _TOKEN_RE.match(query, pos)
+        if m is None or m.end() == pos:
+            raise ValueError(f"token inválido en: {query[pos:]}")
+        tokens.append((m.lastgroup, m.group(m.lastgroup)))
+        pos = m.end()
+    return tokens
+
+
+class _Parser:
+    """Descenso recursivo sobre la lista de tokens"""
+
+    def __init__(self, query):
+        self.tokens = _tokenize(query)
+        self.pos = 0
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise ValueError("fin de consulta inesperado")
+        self.pos += 1
+        return token
+
+    def expect(self, value):
+        text = self.next()[1]
+        if text != value:
+            raise ValueError(f"se esperaba {value!r} y llegó {text!r}")
+
+    def parse(self):
+        node = self.expression(0)
+        if self.pos != len(self.tokens):
+            raise ValueError(f"sobra texto a partir de {self.peek()[1]!r}")
+        return node
+
+    def expression(self, level):
+        if level == len(_PRECEDENCE):
+            return self.unary()
+        lhs = self.expression(level + 1)
+        while self.peek()[0] == 'op' and self.peek()[1] in _PRECEDENCE[level]:
+            op = self.next()[1]
+            on, labels = self.matching()
+            # ^ es asociativo por la derecha: el lado derecho vuelve a este nivel
+            rhs = self.expression(level if op == '^' else level + 1)
+            lhs = Binary(op, lhs, rhs, on, labels)
+            if op == '^':
+                break
+        return lhs
+
+    def matching(self):
+        kind, text = self.peek()
+        if kind != 'ident' or text not in ('on', 'ignoring', 'bool', 'group_left', 'group_right'):
+            return None, ()
+        if text in ('on', 'ignoring'):
+            self.next()
+            labels = self.label_list()
+            if self.peek()[1] in ('group_left', 'group_right'):
+                text = self.peek()[1]
+            else:
+                return text == 'on', labels
+        raise ValueError(f"modificador no soportado: {text}")
+
+    def label_list(self):
+        self.expect('(')
+        labels = []
+        while self.peek()[1] != ')':
+            kind, text = self.next()
+            if kind != 'ident':
+                raise ValueError(f"nombre de etiqueta inválido: {text!r}")
+            labels.append(text)
+            if self.peek()[1] == ',':
+                self.next()
+        self.expect(')')
+        return tuple(labels)
+
+    def unary(self):
+        if self.peek() == ('op', '-'):
+            self.next()
+            return Binary('*', Number(-1.0), self.unary(), None, ())
+        if self.peek() == ('op', '+'):
+            self.next()
+        return self.primary()
+
+    def primary(self):
+        kind, text = self.next()
+        if kind == 'number':
+            return Number(float(text))
+        if text == '(':
+            node = self.expression(0)
+            self.expect(')')
+            return node
+        if kind == 'ident' and text in AGGREGATIONS and self.peek()[1] in ('(', 'by', 'without'):
+            return self.aggregation(text)
+        if kind == 'ident' and text in RANGE_FUNCTIONS and self.peek()[1] == '(':
+            self.expect('(')
+            arg = self.primary()
+            self.expect(')')
+            if not isinstance(arg, Selector) or arg.range_ms is None:
+                raise ValueError(f"{text}() necesita un selector de rango, p.ej. x[5m]")
+            return Call(text, arg)
+        if kind == 'ident' and self.peek()[1] == '(':
+            raise ValueError(f"función no soportada: {text}")
+        if kind == 'braces':
+            self.pos -= 1
+            return self.selector('')
+        if kind == 'ident':
+            return self.selector(text)
+        raise ValueError(f"token inesperado: {text!r}")
+
+    def aggregation(self, op):
+        labels, without = (), False
+        if self.peek()[1] in ('by', 'without'):
+            without = self.next()[1] == 'without'
+            labels = self.label_list()
+        self.expect('(')
+        expr = self.expression(0)
+        self.expect(')')
+        if self.peek()[1] in ('by', 'without'):
+            without = self.next()[1] == 'without'
+            labels = self.label_list()
+        return Aggregate(op, labels, without, expr)
+
+    def selector(self, name):
+        text = name
+        if self.peek()[0] == 'braces':
+            text += self.next()[1]
+        matchers = parse_selector(text)
+        if not matchers:
+            raise ValueError("selector vacío")
+        range_ms = None
+        if self.peek()[0] == 'range':
+            range_ms = parse_duration(self.next()[1][1:-1])
+        return Selector(matchers, range_ms)
+
+
+def parse_query(query):
+    """Texto PromQL -> árbol (Number, Selector, Call, Aggregate, Binary)"""
+    return _Parser(query).parse()
+
+
+class Vector:
+    """Vector instantáneo: values y, por elemento, un sid del store o unas etiquetas.
+
+    Los resultados de selectores y funciones conservan los sids (las etiquetas
+    se leen del store sólo al mostrarlas); las agregaciones y los on/ignoring
+    producen etiquetas explícitas (label_sets).
+    """
+
+    __slots__ = ('store', 'values', 'sids', 'label_sets', 'keep_name')
+
+    def __init__(self, store, values, sids=None, label_sets=None, keep_name=True):
+        self.store = store
+        self.values = values
+        self.sids = sids
+        self.label_sets = label_sets
+        self.keep_name = keep_name
+
+    def __len__(self):
+        return len(self.values)
+
+    def take(self, rows, keep_name=None):
+        keep_name = self.keep_name if keep_name is None else keep_name
+        if self.sids is not None:
+            return Vector(self.store, self.values[rows], self.sids[rows], keep_name=keep_name)
+        return Vector(self.store, self.values[rows],
+                      label_sets=[self.label_sets[i] for i in np.asarray(rows).tolist()],
+                      keep_name=False)
+
+    def labels(self):
+        """Lista de dicts de etiquetas (sin las vacías; __name__ si se conserva)"""
+        if self.sids is None:
+            return list(self.label_sets)
+        result = []
+        for sid in self.sids:
+            series = self.store.series[sid]
+            labels = {k: v for k, v in series.labels.items() if v}
+            if self.keep_name:
+                labels[NAME_LABEL] = series.name
+            result.append(labels)
+        return result
+
+    def items(self):
+        """[(etiquetas, valor)] en el orden del vector"""
+        return list(zip(self.labels(), self.values.tolist()))
+
+
+def format_labels(labels):
+    """{'__name__': 'x', 'a': '1'} -> 'x{a="1"}'"""
+    name = labels.get(NAME_LABEL, '')
+    body = ', '.join(f'{k}="{v}"' for k, v in sorted(labels.items()) if k != NAME_LABEL)
+    return f"{name}{{{body}}}"
+
+
+def _group_key(name, labels, names, include):
+    """Clave de agrupación: valores de `names` (by/on) o el resto de etiquetas (without/ignoring)"""
+    if include:
+        return tuple((name or '') if n == NAME_LABEL else labels.get(n, '') for n in names)
+    return tuple(sorted((k, v) for k, v in labels.items()
+                        if v and k not in names and k != NAME_LABEL))
+
+
+def _key_labels(key, names, include):
+    if include:
+        return {n: v for n, v in zip(names, key) if v}
+    return dict(key)
+
+
+class QueryEngine:
+    """Muestras (sid, timestamp, valor) de uno o varios scrapes + evaluador"""
+
+    def __init__(self, store=None, label_index=None, lookback_ms=DEFAULT_LOOKBACK_MS):
+        self.store = store if store is not None else SeriesStore()
+        self.index = label_index if label_index is not None else LabelIndex(self.store)
+        self.lookback_ms = lookback_ms
+        self._batches = []
+        self._columns = None      # (sids, timestamps, values) ordenados por (sid, ts)
+        self._key_codes = {}      # (names, include) -> código de grupo por sid (-1 = sin calcular)
+        self._vocabularies = {}   # (names, include) -> ({clave: código}, [clave])
+
+    # --- Carga de datos ----------------------------------------------------------
+
+    def _add(self, sids, timestamps, values, scrape_time_ms):
+        sids = np.asarray(sids, dtype=np.int64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        missing = timestamps == NO_TIMESTAMP
+        if missing.any():
+            if scrape_time_ms is None:
+                # Dumps offline: las muestras sin timestamp se alinean con la más reciente
+                known = timestamps[~missing]
+                scrape_time_ms = int(known.max()) if len(known) else int(time.time() * 1000)
+            timestamps = np.where(missing, scrape_time_ms, timestamps)
+        self._batches.append((sids, timestamps, np.asarray(values, dtype=np.float64)))
+        self._columns = None
+
+    def add_scrape(self, scrape, scrape_time_ms=None):
+        """Añade un series_store.Scrape (debe usar el mismo SeriesStore)"""
+        if scrape.store is not self.store:
+            raise ValueError("el scrape pertenece a otro SeriesStore")
+        self._add(scrape.sids, scrape.timestamps, scrape.values, scrape_time_ms)
+
+    def add_snapshot(self, snapshot, scrape_time_ms=None):
+        """Añade un ColumnarSnapshot (debe usar el mismo SeriesStore)"""
+        if snapshot.store is not self.store:
+            raise ValueError("el snapshot pertenece a otro SeriesStore")
+        columns = list(snapshot.families.values())
+        if not columns:
+            return
+        self._add(np.concatenate([c.series_ids for c in columns]),
+                  np.concatenate([c.timestamps for c in columns]),
+                  np.concatenate([c.values for c in columns]), scrape_time_ms)
+
+    def add_text(self, metrics_text, scrape_time_ms=None):
+        self.add_scrape(self.store.ingest_text(metrics_text), scrape_time_ms)
+
+    def load_tsdb(self, source, start_ms=None, end_ms=None):
+        """Carga el histórico de un fichero tsdb.py (ruta o TSDBReader)"""
+        reader = source if isinstance(source, TSDBReader) else TSDBReader(source)
+        mapping = {sid: self.store.get_series(name, labels, family).sid
+                   for sid, (family, name, labels) in reader.series.items()}
+        rows = [(mapping[sid], ts, value) for sid, ts, value in reader.read_range(start_ms, end_ms)]
+        if rows:
+            sids, timestamps, values = zip(*rows)
+            self._add(sids, timestamps, values, None)
+        return len(rows)
+
+    def _samples(self):
+        """Todas las muestras ordenadas por (sid, timestamp), sin duplicados"""
+        if self._columns is None:
+            if not self._batches:
+                empty = np.empty(0, dtype=np.int64)
+                self._columns = (empty, empty, np.empty(0))
+                return self._columns
+            sids = np.concatenate([b[0] for b in self._batches])
+            timestamps = np.concatenate([b[1] for b in self._batches])
+            values = np.concatenate([b[2] for b in self._batches])
+            order = np.lexsort((timestamps, sids))
+            sids, timestamps, values = sids[order], timestamps[order], values[order]
+            # El mismo scrape añadido dos veces (p.ej. desde la caché) no duplica muestras
+            keep = np.ones(len(sids), dtype=bool)
+            keep[1:] = (sids[1:] != sids[:-1]) | (timestamps[1:] != timestamps[:-1])
+            self._columns = (sids[keep], timestamps[keep], values[keep])
+            self._batches = [self._columns]
+        return self._columns
+
+    @property
+    def latest_ms(self):
+        """Timestamp de la muestra más reciente (instante por defecto de las consultas)"""
+        timestamps = self._samples()[1]
+        return int(timestamps.max()) if len(timestamps) else None
+
+    # --- Evaluación --------------------------------------------------------------
+
+    def query(self, query, at_ms=None):
+        """Evalúa una consulta en el instante at_ms (por defecto, el último dato).
+
+        Devuelve un Vector o un float si el resultado es escalar.
+        """
+        node = parse_query(query) if isinstance(query, str) else query
+        at_ms = self.latest_ms if at_ms is None else at_ms
+        self.index.refresh()
+        return self._eval(node, at_ms)
+
+    def _eval(self, node, at_ms):
+        if isinstance(node, Number):
+            return node.value
+        if isinstance(node, Selector):
+            if node.range_ms is not None:
+                raise ValueError("un selector de rango sólo puede usarse dentro de rate/irate/increase")
+            return self._instant(node.matchers, at_ms)
+        if isinstance(node, Call):
+            return self._range_function(node.func, node.arg, at_ms)
+        if isinstance(node, Aggregate):
+            vector = self._eval(node.expr, at_ms)
+            if not isinstance(vector, Vector):
+                raise ValueError(f"{node.op}() necesita un vector")
+            return self._aggregate(node.op, node.labels, node.without, vector)
+        return self._binary(node, self._eval(node.lhs, at_ms), self._eval(node.rhs, at_ms))
+
+    def _window(self, matchers, range_ms, at_ms):
+        """Muestras de las series seleccionadas con at_ms - range_ms < ts <= at_ms"""
+        sids, timestamps, values = self._samples()
+        if at_ms is None:
+            return sids[:0], timestamps[:0], values[:0]
+        selected = np.zeros(len(self.store.series), dtype=bool)
+        selected[self.index.select(matchers)] = True
+        mask = selected[sids] & (timestamps > at_ms - range_ms) & (timestamps <= at_ms)
+        return sids[mask], timestamps[mask], values[mask]
+
+    def _instant(self, matchers, at_ms):
+        """Última muestra de cada serie dentro del lookback"""
+        sids, _, values = self._window(matchers, self.lookback_ms, at_ms)
+        last = np.ones(len(sids), dtype=bool)
+        last[:-1] = sids[1:] != sids[:-1]
+        return Vector(self.store, values[last], sids[last])
+
+    def _range_function(self, func, selector, at_ms):
+        sids, timestamps, values = self._window(selector.matchers, selector.range_ms, at_ms)
+        if not len(sids):
+            return Vector(self.store, np.empty(0), sids, keep_name=False)
+        starts = np.flatnonzero(np.concatenate(([True], sids[1:] != sids[:-1])))
+        ends = np.concatenate((starts[1:], [len(sids)])) - 1
+        enough = ends > starts
+        starts, ends = starts[enough], ends[enough]
+
+        if func == 'irate':
+            prev = ends - 1
+            delta = values[ends] - values[prev]
+            delta = np.where(delta < 0, values[ends], delta)
+            result = delta / ((timestamps[ends] - timestamps[prev]) / 1000.0)
+        else:
+            # Un descenso dentro de la ventana es un reinicio: se suma el valor previo
+            group = np.cumsum(np.concatenate(([0], sids[1:] != sids[:-1])))
+            drops = np.flatnonzero((sids[1:] == sids[:-1]) & (values[1:] < values[:-1]))
+            corrections = np.bincount(group[drops], weights=values[drops],
+                                      minlength=group[-1] + 1)[group[starts]]
+            result = values[ends] - values[starts] + corrections
+            if func == 'rate':
+                result = result / ((timestamps[ends] - timestamps[starts]) / 1000.0)
+        return Vector(self.store, result, sids[ends], keep_name=False)
+
+    def _keys(self, vector, names, include):
+        """Código entero de grupo por elemento (vocabulario compartido por firma)"""
+        signature = (names, include)
+        vocabulary, keys = self._vocabularies.setdefault(signature, ({}, []))
+
+        def code(key):
+            value = vocabulary.get(key)
+            if value is None:
+                value = vocabulary[key] = len(keys)
+                keys.append(key)
+            return value
+
+        if vector.sids is None:
+            return np.fromiter((code(_group_key(None, labels, names, include))
+                                for labels in vector.label_sets), dtype=np.int64,
+                               count=len(vector.label_sets))
+
+        codes = self._key_codes.get(signature)
+        n_series = len(self.store.series)
+        if codes is None or len(codes) < n_series:
+            grown = np.full(n_series, -1, dtype=np.int64)
+            if codes is not None:
+                grown[:len(codes)] = codes
+            codes = self._key_codes[signature] = grown
+        for sid in np.unique(vector.sids[codes[vector.sids] < 0]).tolist():
+            series = self.store.series[sid]
+            codes[sid] = code(_group_key(series.name, series.labels, names, include))
+        return codes[vector.sids]
+
+    def _aggregate(self, op, names, without, vector):
+        include = not without
+        if not len(vector):
+            return Vector(self.store, np.empty(0), label_sets=[], keep_name=False)
+        codes = self._keys(vector, names, include)
+        groups, inverse = np.unique(codes, return_inverse=True)
+        values = vector.values
+        if op in ('sum', 'avg'):
+            result = np.bincount(inverse, weights=values, minlength=len(groups))
+            if op == 'avg':
+                result = result / np.bincount(inverse, minlength=len(groups))
+        elif op == 'count':
+            result = np.bincount(inverse, minlength=len(groups)).astype(np.float64)
+        else:
+            result = np.full(len(groups), -np.inf if op == 'max' else np.inf)
+            (np.maximum if op == 'max' else np.minimum).at(result, inverse, values)
+        keys = self._vocabularies[(names, include)][1]
+        return Vector(self.store, result,
+                      label_sets=[_key_labels(keys[g], names, include) for g in groups.tolist()],
+                      keep_name=False)
+
+    def _binary(self, node, lhs, rhs):
+        op = node.op
+        comparison = op in COMPARISON_OPS
+        func = COMPARISON_OPS[op] if comparison else ARITHMETIC_OPS[op]
+        lhs_vector, rhs_vector = isinstance(lhs, Vector), isinstance(rhs, Vector)
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            if not lhs_vector and not rhs_vector:
+                if comparison:
+                    raise ValueError("las comparaciones entre escalares necesitan 'bool' (no soportado)")
+                return float(func(lhs, rhs))
+
+            if not rhs_vector or not lhs_vector:
+                vector = lhs if lhs_vector else rhs
+                result = func(vector.values, rhs) if lhs_vector else func(lhs, vector.values)
+                if comparison:
+                    return vector.take(np.flatnonzero(result))
+                return Vector(self.store, result, vector.sids, vector.label_sets, keep_name=False)
+
+            li, ri = self._match(node, lhs, rhs)
+            result = func(lhs.values[li], rhs.values[ri])
+        if comparison:
+            out = lhs.take(li[result])
+        else:
+            out = lhs.take(li, keep_name=False)
+            out.values = result
+        if node.labels:
+            # on (...) conserva sólo esas etiquetas; ignoring (...) las quita
+            out = Vector(self.store, out.values, label_sets=[
+                {k: v for k, v in labels.items() if k != NAME_LABEL
+                 and (k in node.labels) == bool(node.on)}
+                for labels in out.labels()], keep_name=False)
+        return out
+
+    def _match(self, node, lhs, rhs):
+        """Índices (izquierda, derecha) de los pares emparejados uno a uno"""
+        include = bool(node.on)
+        names = node.labels if node.on is not None else ()
+        lcodes = self._keys(lhs, names, include)
+        rcodes = self._keys(rhs, names, include)
+        for codes, side in ((lcodes, 'izquierdo'), (rcodes, 'derecho')):
+            if len(np.unique(codes)) != len(codes):
+                raise ValueError(f"series duplicadas en el lado {side} para el emparejamiento "
+                                 f"(muchos a uno no soportado); use on/ignoring o agregue antes")
+        order = np.argsort(rcodes)
+        sorted_codes = rcodes[order]
+        pos = np.searchsorted(sorted_codes, lcodes)
+        pos[pos == len(sorted_codes)] = 0
+        matched = (sorted_codes[pos] == lcodes) if len(sorted_codes) else np.zeros(len(lcodes), bool)
+        return np.flatnonzero(matched), order[pos[matched]]
+
+
+def _synthetic_fleet(metrics_text, n_nodes, interval_ms=15000):
+    """Dos scrapes de n_nodes nodos (etiqueta node) con los counters avanzando"""
+    samples = list(parse_text(metrics_text))
+    engine = QueryEngine()
+    rng = np.random.default_rng(1)
+    for step in range(2):
+        sids, timestamps, values = [], [], []
+        for node in range(n_nodes):
+            for s in samples:
+                labels = dict(s.labels)
+                labels['node'] = f"node-{node}"
+                sids.append(engine.store.get_series(s.name, labels, s.family).sid)
+                timestamps.append(NO_TIMESTAMP if s.timestamp is None else s.timestamp + step * interval_ms)
+                values.append(s.value)
+        values = np.asarray(values)
+        if step:
+            counters = np.fromiter((engine.store.series[sid].name.endswith('_total') for sid in sids),
+                                   dtype=bool, count=len(sids))
+            values[counters] += rng.random(int(counters.sum())) * 10
+        engine._add(sids, timestamps, values, 1764230000000 + step * interval_ms)
+    return engine
+
+
+def benchmark(filepath, n_nodes=20, repeat=20):
+    """Latencia de consultas típicas sobre una flota sintética de n_nodes nodos"""
+    with open(filepath, encoding='utf-8') as f:
+        metrics_text = f.read()
+    engine = _synthetic_fleet(metrics_text, n_nodes)
+    queries = [
+        'container_memory_usage_bytes / (container_spec_memory_limit_bytes > 0) * 100',
+        'sum by (node) (rate(container_cpu_usage_seconds_total{cpu="total"}[5m]))',
+        'max by (node) (container_memory_working_set_bytes{id=~"/kubepods.*"})',
+        'sum by (node) (container_memory_usage_bytes) / on (node) sum by (node) (machine_memory_bytes)',
+    ]
+    results = {}
+    for query in queries:
+        start = time.perf_counter()
+        vector = engine.query(query)
+        cold_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for _ in range(repeat):
+            engine.query(query)
+        warm_ms = (time.perf_counter() - start) * 1000 / repeat
+        results[query] = (len(vector), round(cold_ms, 1), round(warm_ms, 2))
+    return len(engine.store), len(engine._samples()[0]), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluador local de un subconjunto de PromQL")
+    parser.add_argument('query', nargs='?', help="consulta PromQL")
+    parser.add_argument('--file', action='append', default=[],
+                        help="dump de /metrics (se puede repetir: un scrape por fichero)")
+    parser.add_argument('--tsdb', help="histórico generado por tsdb.py / export_metrics.py")
+    parser.add_argument('--url', help=f"scrape en vivo (por defecto {CADVISOR_URL} si no hay ficheros)")
+    parser.add_argument('--limit', type=int, default=20, help="máximo de filas a mostrar")
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--nodes', type=int, default=20, help="nodos sintéticos del benchmark")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        n_series, n_samples, results = benchmark(args.file[0] if args.file else 'cadvisor_metrics.txt',
+                                                 args.nodes)
+        print(f"Series: {n_series}, muestras: {n_samples}\n")
+        for query, (count, cold_ms, warm_ms) in results.items():
+            print(f"  {query}\n    {count} resultados | primera {cold_ms} ms | siguientes {warm_ms} ms")
+        return 0
+    if not args.query:
+        parser.error("falta la consulta")
+
+    engine = QueryEngine()
+    if args.tsdb:
+        engine.load_tsdb(args.tsdb)
+    for path in args.file:
+        with open(path, encoding='utf-8') as f:
+            engine.add_text(f.read())
+    if args.url or not (args.file or args.tsdb):
+        engine.add_text(DEFAULT_FETCHER.fetch(args.url or CADVISOR_URL).text)
+
+    start = time.perf_counter()
+    result = engine.query(args.query)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if not isinstance(result, Vector):
+        print(f"escalar: {result}")
+    else:
+        rows = sorted(result.items(), key=lambda item: -item[1] if item[1] == item[1] else 0)
+        for labels, value in rows[:args.limit]:
+            print(f"  {value:>16.6g}  {format_labels(labels)}")
+        if len(rows) > args.limit:
+            print(f"  ... ({len(rows) - args.limit} más)")
+        print(f"\n{len(result)} resultados")
+    print(f"Evaluada en {elapsed_ms:.2f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Percentiles por contenedor con sketches de cuantiles (estilo DDSketch)
+
+Para dimensionar requests/limits hacen falta p50, p95 y p99 del working
+set y de la CPU de cada contenedor durante horas, sin guardar todas las
+muestras. Un DDSketch reparte los valores en cubos logarítmicos: con
+precisión relativa α, cualquier cuantil sale con error ≤ α·valor.
+
+- Memoria acotada por serie: como mucho `max_buckets` contadores; si el
+  rango crece más, se funden los cubos más bajos (los percentiles altos,
+  los que importan para dimensionar, no pierden precisión).
+- Mezclables: sumar los contadores de dos sketches da el sketch de la
+  unión, así que se pueden juntar los contenedores de un deployment o
+  los ficheros guardados en varios nodos.
+
+Uso:
+    python3 quantile_sketch.py nodo1.json [nodo2.json ...] [--by workload]
+    python3 quantile_sketch.py --benchmark
+"""
+
+import argparse
+import json
+import math
+import re
+import sys
+import time
+from array import array
+
+import numpy as np
+
+DEFAULT_ACCURACY = 0.01
+DEFAULT_MAX_BUCKETS = 512
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Valores por debajo de esto (y negativos) cuentan como cero
+MIN_VALUE = 1e-9
+
+
+class DDSketch:
+    """Sketch de cuantiles con error relativo acotado para valores no negativos"""
+
+    __slots__ = ('accuracy', 'max_buckets', '_log_gamma', 'offset', 'counts',
+                 'zero_count', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, accuracy=DEFAULT_ACCURACY, max_buckets=DEFAULT_MAX_BUCKETS):
+        self.accuracy = accuracy
+        self.max_buckets = max_buckets
+        self._log_gamma = math.log((1 + accuracy) / (1 - accuracy))
+        self.offset = 0             # índice de cubo de counts[0]
+        self.counts = array('q')
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def index(self, value):
+        """Cubo de un valor > MIN_VALUE: el i tal que γ^(i-1) < valor ≤ γ^i"""
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _bucket_value(self, i):
+        # Punto del cubo con error relativo ≤ α respecto a cualquier valor del cubo
+        return 2 * math.exp(i * self._log_gamma) / (1 + math.exp(self._log_gamma))
+
+    def add(self, value, count=1):
+        self._add_stats(value, count)
+        if value > MIN_VALUE:
+            self._add_index(self.index(value), count)
+        else:
+            self.zero_count += count
+
+    def _add_stats(self, value, count):
+        self.count += count
+        self.sum += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def _add_index(self, i, count=1):
+        counts = self.counts
+        if not counts:
+            self.offset = i
+            counts.append(count)
+            return
+        j = i - self.offset
+        if 0 <= j < len(counts):
+            counts[j] += count
+        elif j >= len(counts):
+            counts.frombytes(bytes(8 * (j - len(counts) + 1)))
+            counts[j] += count
+            self._collapse()
+        else:
+            top = self.offset + len(counts) - 1
+            low = max(i, top - self.max_buckets + 1)
+            self.counts = array('q', bytes(8 * (self.offset - low))) + counts
+            self.offset = low
+            self.counts[i - low if i >= low else 0] += count
+
+    def _collapse(self):
+        """Funde los cubos más bajos hasta que queden max_buckets"""
+        excess = len(self.counts) - self.max_buckets
+        if excess > 0:
+            folded = sum(self.counts[:excess + 1])
+            del self.counts[:excess]
+            self.counts[0] = folded
+            self.offset += excess
+
+    def merge(self, other):
+        """Añade las muestras de `other` (mismo accuracy); devuelve self"""
+        if other.accuracy != self.accuracy:
+            raise ValueError("sólo se pueden mezclar sketches con la misma precisión")
+        if not other.count:
+            return self
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.zero_count += other.zero_count
+        if other.counts:
+            if not self.counts:
+                self.offset, self.counts = other.offset, array('q', other.counts)
+            else:
+                low = min(self.offset, other.offset)
+                high = max(self.offset + len(self.counts), other.offset + len(other.counts))
+                merged = np.zeros(high - low, dtype=np.int64)
+                merged[self.offset - low:self.offset - low + len(self.counts)] += self.counts
+                merged[other.offset - low:other.offset - low + len(other.counts)] += other.counts
+                self.offset, self.counts = low, array('q', merged.tobytes())
+            self._collapse()
+        return self
+
+    def quantile(self, q):
+        """Valor del cuantil q (0..1); None si está vacío"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return max(self.min, 0.0)
+        for j, n in enumerate(self.counts):
+            seen += n
+            if rank < seen:
+                return min(max(self._bucket_value(self.offset + j), self.min), self.max)
+        return self.max
+
+    def quantiles(self, qs=QUANTILES):
+        return {q: self.quantile(q) for q in qs}
+
+    @property
+    def buckets(self):
+        return len(self.counts)
+
+    def to_dict(self):
+        return {'accuracy': self.accuracy, 'max_buckets': self.max_buckets,
+                'offset': self.offset, 'counts': list(self.counts), 'zero_count': self.zero_count,
+                'count': self.count, 'sum': self.sum,
+                'min': self.min if self.count else None, 'max': self.max if self.count else None}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['accuracy'], data['max_buckets'])
+        sketch.offset = data['offset']
+        sketch.counts = array('q', data['counts'])
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.sum = data['sum']
+        if sketch.count:
+            sketch.min, sketch.max = data['min'], data['max']
+        return sketch
+
+
+class SketchSet:
+    """Un DDSketch por clave (ruta de cgroup, contenedor, workload...)"""
+
+    def __init__(self, accuracy=DEFAULT_ACCURACY, max_buckets=DEFAULT_MAX_BUCKETS):
+        self.accuracy = accuracy
+        self.max_buckets = max_buckets
+        self.sketches = {}
+
+    def get(self, key):
+        sketch = self.sketches.get(key)
+        if sketch is None:
+            sketch = self.sketches[key] = DDSketch(self.accuracy, self.max_buckets)
+        return sketch
+
+    def add_many(self, keys, values):
+        """Un valor por clave (un scrape); el logaritmo se calcula vectorizado con numpy"""
+        values = np.asarray(values, dtype=np.float64)
+        positive = values > MIN_VALUE
+        indexes = np.zeros(len(values), dtype=np.int64)
+        log_gamma = math.log((1 + self.accuracy) / (1 - self.accuracy))
+        indexes[positive] = np.ceil(np.log(values[positive]) / log_gamma)
+        get = self.get
+        for key, value, i, pos in zip(keys, values.tolist(), indexes.tolist(), positive.tolist()):
+            sketch = get(key)
+            sketch._add_stats(value, 1)
+            if pos:
+                sketch._add_index(i)
+            else:
+                sketch.zero_count += 1
+
+    def merge(self, other):
+        """Mezcla clave a clave (p.ej. el fichero de otro nodo); devuelve self"""
+        for key, sketch in other.sketches.items():
+            self.get(key).merge(sketch)
+        return self
+
+    def merged(self, group_of):
+        """Nuevo SketchSet con las claves agrupadas por group_of(clave)"""
+        groups = SketchSet(self.accuracy, self.max_buckets)
+        for key, sketch in self.sketches.items():
+            groups.get(group_of(key)).merge(sketch)
+        return groups
+
+    def __len__(self):
+        return len(self.sketches)
+
+    def buckets(self):
+        return sum(sketch.buckets for sketch in self.sketches.values())
+
+    def to_dict(self):
+        return {key: sketch.to_dict() for key, sketch in self.sketches.items()}
+
+    @classmethod
+    def from_dict(cls, data, accuracy=DEFAULT_ACCURACY, max_buckets=DEFAULT_MAX_BUCKETS):
+        sketches = cls(accuracy, max_buckets)
+        for key, entry in data.items():
+            sketches.sketches[key] = DDSketch.from_dict(entry)
+            sketches.accuracy, sketches.max_buckets = entry['accuracy'], entry['max_buckets']
+        return sketches
+
+
+# Sufijos de nombres de pod generados por los controladores de Kubernetes
+# (alfabeto de rand.SafeEncodeString: sin vocales ni caracteres ambiguos)
+_SAFE = '[bcdfghjklmnpqrstvwxz2456789]'
+_WORKLOAD_PATTERNS = (
+    re.compile(rf'^(.+)-{_SAFE}{{6,10}}-{_SAFE}{{5}}$'),     # Deployment (ReplicaSet + pod)
+    re.compile(r'^(.+)-\d+$'),                                # StatefulSet
+    re.compile(rf'^(.+)-{_SAFE}{{5}}$'),                      # DaemonSet / Job
+)
+
+
+def workload_name(pod):
+    """Nombre del workload a partir del nombre del pod (web-7d4b9c8f6-x2k4p -> web)"""
+    for pattern in _WORKLOAD_PATTERNS:
+        match = pattern.match(pod)
+        if match:
+            return match.group(1)
+    return pod
+
+
+class ContainerHistory:
+    """Sketches de CPU y working set por contenedor, alimentados con una monitor_tui.ContainerView
+
+    Las claves son las rutas de cgroup; `groups` guarda para cada una
+    'namespace/workload/contenedor' para mezclar por deployment.
+    """
+
+    METRICS = ('cpu', 'memory')
+
+    def __init__(self, accuracy=DEFAULT_ACCURACY, max_buckets=DEFAULT_MAX_BUCKETS):
+        self.sketches = {metric: SketchSet(accuracy, max_buckets) for metric in self.METRICS}
+        self.names = {}
+        self.groups = {}
+        self._paths, self._seen = None, 0       # filas de la vista ya registradas
+
+    def update(self, view):
+        """Añade el valor actual de cada contenedor presente (las tasas aún sin calcular no cuentan)"""
+        paths = view.paths
+        if paths is not self._paths:
+            self._paths, self._seen = paths, 0
+        for row in range(self._seen, len(paths)):
+            self.names.setdefault(paths[row], view.names[row])
+            self.groups.setdefault(paths[row], view.groups[row])
+        self._seen = len(paths)
+        for metric in self.METRICS:
+            values = view.columns.get(metric)
+            if values is None:
+                continue
+            rows = np.flatnonzero(view.present & ~np.isnan(values))
+            self.sketches[metric].add_many([paths[row] for row in rows], values[rows])
+
+    def quantile(self, metric, path, q):
+        sketch = self.sketches[metric].sketches.get(path)
+        return None if sketch is None else sketch.quantile(q)
+
+    def by_workload(self, metric):
+        """SketchSet por 'namespace/workload/contenedor' (todas las réplicas juntas)"""
+        return self.sketches[metric].merged(lambda path: self.groups.get(path, path))
+
+    def merge(self, other):
+        for metric in self.METRICS:
+            self.sketches[metric].merge(other.sketches[metric])
+        for path, name in other.names.items():
+            self.names.setdefault(path, name)
+        for path, group in other.groups.items():
+            self.groups.setdefault(path, group)
+        return self
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'names': self.names, 'groups': self.groups,
+                       'sketches': {m: s.to_dict() for m, s in self.sketches.items()}}, f)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        history = cls()
+        history.names = data['names']
+        history.groups = data['groups']
+        for metric, entries in data['sketches'].items():
+            history.sketches[metric] = SketchSet.from_dict(entries)
+        return history
+
+
+def _fmt_quantiles(sketch, scale=1.0, spec='.3f'):
+    return ' '.join(f"{'-' if v is None else format(v * scale, spec):>9}"
+                    for v in sketch.quantiles().values())
+
+
+def report(history, by='container', limit=30):
+    """Tabla p50/p95/p99 de CPU (núcleos) y working set (MiB), ordenada por p95 de memoria"""
+    if by == 'workload':
+        memory, cpu = history.by_workload('memory'), history.by_workload('cpu')
+        label = lambda key: key
+    else:
+        memory, cpu = history.sketches['memory'], history.sketches['cpu']
+        label = lambda key: history.names.get(key, key)
+    empty = DDSketch()
+    keys = sorted(memory.sketches, key=lambda k: memory.sketches[k].quantile(0.95) or 0, reverse=True)
+    lines = [f"{'CPU p50':>9} {'p95':>9} {'p99':>9}  {'MEM p50':>9} {'p95':>9} {'p99':>9}  "
+             f"{'muestras':>8}  {'WORKLOAD' if by == 'workload' else 'CONTENEDOR'}"]
+    for key in keys[:limit]:
+        mem = memory.sketches[key]
+        lines.append(f"{_fmt_quantiles(cpu.sketches.get(key, empty))}  "
+                     f"{_fmt_quantiles(mem, 1 / 2**20, '.1f')}  {mem.count:8d}  {label(key)}")
+    return lines
+
+
+def benchmark(series=10000, scrapes=720, accuracy=DEFAULT_ACCURACY, seed=1):
+    """Error de p50/p95/p99 frente a los cuantiles exactos y coste por scrape y por serie"""
+    rng = np.random.default_rng(seed)
+    # Working sets lognormales con deriva lenta: ~1 hora de scrapes cada 5 s
+    base = rng.lognormal(np.log(200 * 2**20), 1.0, series)
+    sketches = SketchSet(accuracy)
+    keys = [f"/kubepods/pod{i}/c{i}" for i in range(series)]
+    exact = np.empty((scrapes, series))
+    start = time.perf_counter()
+    for t in range(scrapes):
+        values = base * rng.lognormal(0.0, 0.2, series) * (1 + 0.3 * np.sin(t / 60))
+        exact[t] = values
+        sketches.add_many(keys, values)
+    add_ms = (time.perf_counter() - start) * 1000 / scrapes
+
+    errors = {q: 0.0 for q in QUANTILES}
+    sample = range(0, series, max(series // 200, 1))
+    for i in sample:
+        sketch = sketches.sketches[keys[i]]
+        for q in QUANTILES:
+            truth = np.quantile(exact[:, i], q, method='lower')
+            errors[q] = max(errors[q], float(abs(sketch.quantile(q) - truth) / truth))
+
+    start = time.perf_counter()
+    merged = sketches.merged(lambda key: key.rsplit('/', 2)[1][:4])
+    merge_ms = (time.perf_counter() - start) * 1000
+    return {
+        'series': series, 'scrapes': scrapes, 'accuracy': accuracy,
+        'add_ms_per_scrape': round(add_ms, 2),
+        'max_rel_error': {f"p{round(q * 100)}": round(e, 4) for q, e in errors.items()},
+        'buckets_per_series': round(sketches.buckets() / series, 1),
+        'bytes_per_series_counts': round(8 * sketches.buckets() / series),
+        'raw_bytes_per_series': 8 * scrapes,
+        'merge_ms': round(merge_ms, 1), 'merged_groups': len(merged),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Percentiles de CPU y memoria por contenedor")
+    parser.add_argument('files', nargs='*', help="históricos guardados (monitor --sketches); se mezclan")
+    parser.add_argument('--by', choices=['container', 'workload'], default='container')
+    parser.add_argument('--limit', type=int, default=30)
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for key, value in benchmark().items():
+            print(f"  {key:24}: {value}")
+        return 0
+    if not args.files:
+        parser.error("faltan ficheros de histórico (o --benchmark)")
+    history = ContainerHistory.load(args.files[0])
+    for path in args.files[1:]:
+        history.merge(ContainerHistory.load(path))
+    print('\n'.join(report(history, args.by, args.limit)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
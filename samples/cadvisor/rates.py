@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Cálculo incremental de tasas por segundo para counters (como rate() de PromQL)
+
+Se guarda sólo el último valor, su timestamp y la última tasa de cada serie
+(estado O(1) por serie, en arrays indexados por sid). Cada scrape se
+compara con el anterior:
+
+- se usan los timestamps de cAdvisor (ms); si faltan, la hora del scrape
+- si el counter baja se considera un reinicio y el incremento es el valor nuevo
+- si cAdvisor no ha actualizado la muestra (mismo timestamp) se mantiene
+  la tasa anterior
+- si el SeriesStore se compacta (SeriesStore.compact) los arrays se
+  traducen a los sids nuevos y encogen con él
+"""
+
+import time
+
+import numpy as np
+
+from series_store import NO_TIMESTAMP
+
+
+def counter_families(metadata, families):
+    """Familias que son counters según # TYPE (o por el sufijo _total si no hay metadatos)"""
+    if metadata:
+        return [f for f in families if metadata.get(f, {}).get('type') == 'counter']
+    return [f for f in families if f.endswith('_total')]
+
+
+class RateColumns:
+    """Tasas por segundo de una familia: series_ids y rates (NaN = aún sin tasa)"""
+
+    __slots__ = ('family', 'series_ids', 'rates')
+
+    def __init__(self, family, series_ids, rates):
+        self.family = family
+        self.series_ids = series_ids
+        self.rates = rates
+
+    def known(self):
+        """Sólo las series que ya tienen tasa"""
+        mask = ~np.isnan(self.rates)
+        return RateColumns(self.family, self.series_ids[mask], self.rates[mask])
+
+    def __len__(self):
+        return len(self.rates)
+
+    def stats(self):
+        rates = self.rates[~np.isnan(self.rates)]
+        if not len(rates):
+            return {'count': 0, 'sum': 0.0, 'avg': None, 'max': None}
+        total = float(rates.sum())
+        return {'count': len(rates), 'sum': total, 'avg': total / len(rates),
+                'max': float(rates.max())}
+
+
+class RateTracker:
+    """Estado entre scrapes para calcular tasas de counters"""
+
+    def __init__(self):
+        self._allocate(0)
+        self._store = None
+        self._epoch = 0
+        self.resets = 0
+
+    def _follow(self, store):
+        """Traduce el estado a los sids actuales del store (o lo descarta)"""
+        remap = store.remap_from(self._epoch) if store is self._store else None
+        self._store, self._epoch = store, store.epoch
+        old = (self._values, self._timestamps, self._rates)
+        self._allocate(len(store.series))
+        if remap is None:
+            return
+        remap = np.asarray(remap, dtype=np.int64)[:len(old[0])]
+        kept = remap >= 0
+        new_sids = remap[kept]
+        for new, prev in zip((self._values, self._timestamps, self._rates), old):
+            new[new_sids] = prev[:len(remap)][kept]
+
+    def _allocate(self, n_series):
+        self._values = np.zeros(n_series)
+        self._timestamps = np.full(n_series, NO_TIMESTAMP, dtype=np.int64)
+        self._rates = np.full(n_series, np.nan)
+
+    def _ensure_capacity(self, n_series):
+        current = len(self._values)
+        if n_series <= current:
+            return
+        size = max(n_series, current * 2, 1024)
+        grow = size - current
+        self._values = np.concatenate((self._values, np.zeros(grow)))
+        self._timestamps = np.concatenate((self._timestamps, np.full(grow, NO_TIMESTAMP, dtype=np.int64)))
+        self._rates = np.concatenate((self._rates, np.full(grow, np.nan)))
+
+    def update_family(self, columns, scrape_time_ms):
+        """Actualiza el estado con las columnas de una familia y devuelve RateColumns"""
+        sids = columns.series_ids
+        values = columns.values
+        timestamps = np.where(columns.timestamps == NO_TIMESTAMP, scrape_time_ms, columns.timestamps)
+
+        prev_values = self._values[sids]
+        prev_ts = self._timestamps[sids]
+        advanced = (prev_ts != NO_TIMESTAMP) & (timestamps > prev_ts)
+
+        delta = values - prev_values
+        reset = advanced & (delta < 0)
+        delta = np.where(reset, values, delta)
+        self.resets += int(reset.sum())
+
+        elapsed = (timestamps - prev_ts) / 1000.0
+        rates = self._rates[sids]
+        rates[advanced] = delta[advanced] / elapsed[advanced]
+        self._rates[sids] = rates
+
+        # Sólo se avanza el estado si la muestra es nueva (o la serie no se conocía)
+        fresh = advanced | (prev_ts == NO_TIMESTAMP)
+        self._values[sids[fresh]] = values[fresh]
+        self._timestamps[sids[fresh]] = timestamps[fresh]
+
+        return RateColumns(columns.family, sids, rates)
+
+    def update(self, snapshot, families, scrape_time_ms=None):
+        """Actualiza con un ColumnarSnapshot; devuelve {familia: RateColumns}"""
+        if scrape_time_ms is None:
+            scrape_time_ms = int(time.time() * 1000)
+        store = snapshot.store
+        if store is not self._store or store.epoch != self._epoch:
+            self._follow(store)
+        self._ensure_capacity(len(store.series))
+        return {family: self.update_family(snapshot[family], scrape_time_ms)
+                for family in families if family in snapshot}
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Histórico en memoria con buffers circulares por resolución (estilo RRD)
+
+Cada nivel guarda, para cada serie y métrica, un número fijo de cubos de
+`step` segundos con min, max, sum, count y last. Por defecto:
+
+    5 s durante 15 min (180 cubos), 1 min durante 24 h (1440), 1 h durante 30 días (720)
+
+Todo se reserva al crear el TieredHistory (`max_series` filas): la
+memoria no crece con el tiempo y se conoce de antemano (nbytes). Con los
+niveles por defecto y float32 son 2340 cubos x 18 bytes ≈ 41 KiB por
+serie y métrica (500 contenedores x CPU y memoria ≈ 40 MiB). Cada
+muestra se acumula a la vez en el cubo actual de todos los niveles (los
+rollups se calculan incrementalmente, sin releer muestras); cuando un
+cubo vuelve a usarse tras una vuelta completa, se reinicia. Cuando no
+quedan filas libres, la serie ausente que lleva más tiempo sin datos
+deja la suya a la nueva; las series del scrape actual nunca se
+desalojan (si no caben todas, las nuevas se descartan).
+
+Una consulta de rango elige el nivel más fino que aún cubre el inicio
+del rango y sólo lee los cubos de esa fila (como mucho `slots`).
+
+Uso:
+    python3 ring_history.py [--containers 1000] [--hours 2]   # memoria, coste y consultas
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+# (segundos por cubo, segundos de retención)
+DEFAULT_TIERS = ((5, 15 * 60), (60, 24 * 3600), (3600, 30 * 86400))
+DEFAULT_METRICS = ('cpu', 'memory')
+DEFAULT_MAX_SERIES = 500
+
+
+class Tier:
+    """Un nivel: cubos de `step` segundos en un buffer circular de `slots` posiciones"""
+
+    def __init__(self, step, retention, metrics, rows, dtype):
+        self.step = step
+        self.slots = max(int(retention // step), 1)
+        self.retention = self.slots * step
+        shape = (metrics, rows, self.slots)
+        self.epochs = np.full(self.slots, -1, dtype=np.int64)      # nº de cubo de cada posición
+        self.min = np.full(shape, np.inf, dtype=dtype)
+        self.max = np.full(shape, -np.inf, dtype=dtype)
+        self.sum = np.zeros(shape, dtype=dtype)
+        self.last = np.full(shape, np.nan, dtype=dtype)
+        self.count = np.zeros(shape, dtype=np.uint16)    # ≤ 7200 muestras/cubo de 1 h cada 0.5 s
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.epochs, self.min, self.max, self.sum, self.last, self.count))
+
+    def _clear(self, index):
+        self.min[index] = np.inf
+        self.max[index] = -np.inf
+        self.sum[index] = 0
+        self.last[index] = np.nan
+        self.count[index] = 0
+
+    def slot(self, t):
+        """Posición del cubo de t, reiniciándola si aún tiene un cubo de la vuelta anterior"""
+        epoch = int(t // self.step)
+        slot = epoch % self.slots
+        if self.epochs[slot] != epoch:
+            self._clear((slice(None), slice(None), slot))
+            self.epochs[slot] = epoch
+        return slot
+
+    def add(self, metric, slot, rows, values):
+        index = (metric, rows, slot)
+        self.min[index] = np.fmin(self.min[index], values)
+        self.max[index] = np.fmax(self.max[index], values)
+        self.sum[index] += values
+        self.count[index] += 1
+        self.last[index] = values
+
+    def window(self, metric, row, start, end):
+        """Cubos de [start, end) de una fila, en orden temporal"""
+        first, last = int(start // self.step), int((end - 1e-9) // self.step)
+        epochs = self.epochs
+        slots = np.flatnonzero((epochs >= first) & (epochs <= last) & (self.count[metric, row] > 0))
+        slots = slots[np.argsort(epochs[slots], kind='stable')]
+        count = self.count[metric, row, slots]
+        return {
+            'time': epochs[slots] * self.step,
+            'min': self.min[metric, row, slots].astype(np.float64),
+            'max': self.max[metric, row, slots].astype(np.float64),
+            'avg': self.sum[metric, row, slots] / count,
+            'count': count,
+            'last': self.last[metric, row, slots].astype(np.float64),
+        }
+
+
+class TieredHistory:
+    """Histórico de varias métricas por clave (p.ej. ruta de cgroup) con memoria fija"""
+
+    def __init__(self, tiers=DEFAULT_TIERS, metrics=DEFAULT_METRICS, max_series=DEFAULT_MAX_SERIES,
+                 dtype=np.float32):
+        self.metrics = {name: i for i, name in enumerate(metrics)}
+        self.max_series = max_series
+        self.tiers = [Tier(step, retention, len(metrics), max_series, dtype)
+                      for step, retention in sorted(tiers)]
+        self._rows = {}                     # clave -> fila
+        self._keys = [None] * max_series
+        self._free = list(range(max_series - 1, -1, -1))
+        self.last_seen = np.full(max_series, -np.inf)
+        self.last_time = None
+        self.evictions = 0
+        self.dropped = 0        # claves nuevas sin fila libre ni desalojable
+
+    @property
+    def nbytes(self):
+        """Memoria reservada (no cambia mientras existe el histórico)"""
+        return sum(tier.nbytes for tier in self.tiers) + self.last_seen.nbytes
+
+    def rows(self, keys, t=None):
+        """Fila de cada clave (asignándolas si son nuevas; -1 = sin fila)
+
+        Las claves de esta llamada nunca se desalojan entre sí: primero se
+        marcan las que ya tienen fila y sólo se reutilizan filas de claves
+        ausentes, empezando por la que lleva más tiempo sin datos. Si ni
+        así hay fila para una clave nueva, se descarta (dropped) en lugar
+        de borrar el histórico de un contenedor que sigue vivo.
+        """
+        rows = np.fromiter((self._rows.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+        new = np.flatnonzero(rows < 0)
+        if not len(new):
+            return rows
+        in_use = np.zeros(self.max_series, dtype=bool)
+        in_use[rows[rows >= 0]] = True
+        victims = None
+        stamp = self.last_time if t is None else t
+        for i in new.tolist():
+            key = keys[i]
+            row = self._rows.get(key)        # clave repetida en la misma llamada
+            if row is None:
+                if self._free:
+                    row = self._free.pop()
+                else:
+                    if victims is None:
+                        # Filas de claves que no están en esta llamada, de la más antigua a la más reciente
+                        candidates = np.flatnonzero(~in_use)
+                        victims = iter(candidates[np.argsort(self.last_seen[candidates], kind='stable')].tolist())
+                    row = next(victims, None)
+                    if row is None:
+                        self.dropped += 1
+                        continue
+                    del self._rows[self._keys[row]]
+                    for tier in self.tiers:
+                        tier._clear((slice(None), row))
+                    self.evictions += 1
+                self._rows[key] = row
+                self._keys[row] = key
+                self.last_seen[row] = stamp if stamp is not None else 0.0
+            in_use[row] = True
+            rows[i] = row
+        return rows
+
+    def record(self, t, keys, columns, rows=None):
+        """Añade un scrape: `columns` = {métrica: valores alineados con keys} (NaN = sin dato)"""
+        if rows is None:
+            rows = self.rows(keys, t)
+        if (rows < 0).any():
+            keep = rows >= 0
+            rows = rows[keep]
+            columns = {name: np.asarray(values)[keep] for name, values in columns.items()}
+        self.last_seen[rows] = t
+        self.last_time = t if self.last_time is None else max(self.last_time, t)
+        slots = [tier.slot(t) for tier in self.tiers]
+        for name, values in columns.items():
+            metric = self.metrics[name]
+            values = np.asarray(values, dtype=np.float64)
+            keep = ~np.isnan(values)
+            if not keep.all():
+                rows_kept, values = rows[keep], values[keep]
+            else:
+                rows_kept = rows
+            for tier, slot in zip(self.tiers, slots):
+                tier.add(metric, slot, rows_kept, values)
+
+    def tier_for(self, start, now=None):
+        """El nivel más fino cuya retención cubre `start`"""
+        now = self.last_time if now is None else now
+        for tier in self.tiers:
+            if now - start <= tier.retention - tier.step:
+                return tier
+        return self.tiers[-1]
+
+    def range(self, key, metric, start, end=None, tier=None):
+        """Cubos (time, min, max, avg, count, last) de una clave entre start y end"""
+        end = (self.last_time or 0) + 1 if end is None else end
+        row = self._rows.get(key)
+        tier = tier or self.tier_for(start)
+        if row is None:
+            return tier.window(self.metrics[metric], 0, 0, 0)
+        return tier.window(self.metrics[metric], row, start, end)
+
+    def summary(self, key, metric, seconds):
+        """min, max, media y último valor de los últimos `seconds` segundos (None si no hay datos)"""
+        if self.last_time is None:
+            return None
+        buckets = self.range(key, metric, self.last_time - seconds + 1e-9)
+        count = buckets['count']
+        if not len(count):
+            return None
+        return {
+            'min': float(buckets['min'].min()),
+            'max': float(buckets['max'].max()),
+            'avg': float((buckets['avg'] * count).sum() / count.sum()),
+            'last': float(buckets['last'][-1]),
+            'samples': int(count.sum()),
+        }
+
+    def __len__(self):
+        return len(self._rows)
+
+    def record_view(self, t, view):
+        """Añade las columnas de una monitor_tui.ContainerView (contenedores presentes)"""
+        present = np.flatnonzero(view.present)
+        keys = [view.paths[row] for row in present]
+        self.record(t, keys, {name: view.columns[name][present]
+                              for name in self.metrics if name in view.columns})
+
+    def describe(self):
+        return ', '.join(f"{tier.step}s x {tier.slots}" for tier in self.tiers)
+
+
+def benchmark(containers=1000, hours=2, scrape_interval=5.0, seed=1):
+    """Memoria reservada, coste por scrape y coste de consultas en un histórico simulado"""
+    rng = np.random.default_rng(seed)
+    history = TieredHistory(max_series=containers)
+    keys = [f"/kubepods/pod{i}/c{i}" for i in range(containers)]
+    base = rng.lognormal(np.log(200 * 2**20), 1.0, containers)
+    scrapes = int(hours * 3600 / scrape_interval)
+    rows = history.rows(keys)
+    start_time = 1_764_230_077.0
+    start = time.perf_counter()
+    for i in range(scrapes):
+        t = start_time + i * scrape_interval
+        noise = rng.normal(1.0, 0.05, containers)
+        history.record(t, keys, {'memory': base * noise, 'cpu': noise - 0.9}, rows)
+    record_ms = (time.perf_counter() - start) * 1000 / scrapes
+
+    queries = {}
+    for label, seconds in (('15min', 900), ('1h', 3600), ('24h', 86400)):
+        start = time.perf_counter()
+        for key in keys[:100]:
+            history.summary(key, 'memory', seconds)
+        queries[label] = round((time.perf_counter() - start) * 1000 / 100, 3)
+    return {
+        'containers': containers, 'scrapes': scrapes, 'tiers': history.describe(),
+        'reserved_mb': round(history.nbytes / 2**20, 1),
+        'bytes_per_series_metric': history.nbytes // (containers * len(history.metrics)),
+        'record_ms_per_scrape': round(record_ms, 3),
+        'summary_ms': queries,
+        'example_24h': history.summary(keys[0], 'memory', 86400),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Histórico por niveles con buffers circulares")
+    parser.add_argument('--containers', type=int, default=1000)
+    parser.add_argument('--hours', type=float, default=2)
+    args = parser.parse_args()
+    for key, value in benchmark(args.containers, args.hours).items():
+        print(f"  {key:24}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
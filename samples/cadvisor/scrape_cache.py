@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Caché de scrapes de /metrics por URL
+
+- TTL configurable: dentro del TTL no se vuelve a descargar nada.
+- Peticiones condicionales (If-None-Match / If-Modified-Since): si el
+  servidor responde 304 se reutiliza el último cuerpo.
+- "Reutilizar el último cuerpo": si la descarga falla y hay un cuerpo
+  previo, se devuelve ese (marcado como stale) en lugar de fallar.
+- Los resultados derivados (muestras parseadas, snapshot columnar...) se
+  calculan una vez por cuerpo y los comparten todos los consumidores.
+- Las etiquetas vacías (container_label_*="") se descartan al parsear:
+  en Prometheus una etiqueta vacía equivale a no tenerla.
+- Cada etapa (fetch, decode, parse, ingest, snapshot, categories) se mide
+  en self_metrics (duración, series y pico de memoria).
+- Con stream=True el cuerpo no se guarda: las líneas van del socket al
+  parser y al SeriesStore según llegan (http_fetch.StreamedBody), así que
+  fetch, decode, parse e ingest forman una sola etapa 'stream' y la
+  memoria de la descarga no depende del tamaño del payload. text()
+  devuelve None y samples() se reconstruye desde el Scrape (con las
+  etiquetas como dict, igual que en el parseo con buffer).
+- Con evict_after=N las series que llevan N scrapes sin aparecer se
+  eliminan del SeriesStore (SeriesStore.compact), para que un proceso de
+  larga duración no crezca con la rotación de contenedores. Los snapshots
+  derivados se recalculan con los sids nuevos.
+"""
+
+import time
+
+import requests
+
+from columnar import ColumnarSnapshot
+from http_fetch import DEFAULT_FETCHER
+from label_index import LabelIndex
+from metric_categories import summarize
+from prom_parser import DEFAULT_PARSE_FILTER, Sample, iter_samples, parse_text
+from self_metrics import SELF_METRICS
+from series_store import SeriesStore
+
+DEFAULT_TTL = 10.0
+
+# Sólo se compacta el store cuando las series a eliminar son al menos esta fracción
+EVICT_MIN_FRACTION = 0.1
+
+# Nombre de etapa en self_metrics de cada derivado (por defecto, el del derivado)
+_STAGES = {'samples': 'parse', 'scrape': 'ingest'}
+
+
+class ScrapeEntry:
+    """Último cuerpo descargado de una URL y sus resultados derivados"""
+
+    __slots__ = ('url', 'text', 'fetched_at', 'etag', 'last_modified', 'stale', 'derived',
+                 'last_fetch')
+
+    def __init__(self, url, text, etag=None, last_modified=None):
+        self.url = url
+        self.text = text
+        self.last_fetch = None
+        self.fetched_at = time.monotonic()
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stale = False
+        self.derived = {}
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+
+class ScrapeCache:
+    """Caché de cuerpos de /metrics con TTL, indexada por URL
+
+    `fetch(url, headers)` debe devolver un http_fetch.FetchResult.
+    `parse_filter` (prom_parser.ParseFilter) se aplica al parsear cada cuerpo.
+    Con `stream=True` se usa `open_stream(url, headers)`, que debe devolver
+    un http_fetch.StreamedBody.
+    Con `evict_after` se eliminan del store las series ausentes en los
+    últimos evict_after scrapes (ver SeriesStore.compact).
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, fetch=DEFAULT_FETCHER.fetch, reuse_last_body=True,
+                 instrumentation=SELF_METRICS, parse_filter=DEFAULT_PARSE_FILTER,
+                 stream=False, open_stream=DEFAULT_FETCHER.stream, evict_after=None):
+        self.ttl = ttl
+        self.fetch = fetch
+        self.stream = stream
+        self.open_stream = open_stream
+        self.parse_filter = parse_filter
+        self.instrumentation = instrumentation
+        self.reuse_last_body = reuse_last_body
+        self.evict_after = evict_after
+        self.store = SeriesStore()
+        self._label_index = None
+        self._entries = {}
+        self.stats = {'hits': 0, 'fetches': 0, 'not_modified': 0, 'stale': 0}
+
+    def entry(self, url, force=False):
+        """Devuelve la ScrapeEntry de url, descargando sólo si hace falta"""
+        entry = self._entries.get(url)
+        if entry is not None and not force and entry.age() < self.ttl:
+            self.stats['hits'] += 1
+            return entry
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        try:
+            self.stats['fetches'] += 1
+            if self.stream:
+                result = self._stream_entry(url, headers)
+            else:
+                with self.instrumentation.stage('fetch'):
+                    result = self.fetch(url, headers)
+        except requests.exceptions.RequestException:
+            if entry is None or not self.reuse_last_body:
+                raise
+            self.stats['stale'] += 1
+            entry.stale = True
+            return entry
+        if isinstance(result, ScrapeEntry):
+            self._entries[url] = result
+            self._evict()
+            return result
+        self.instrumentation.record_fetch(result)
+
+        if result.status == 304 and entry is not None:
+            self.stats['not_modified'] += 1
+            entry.fetched_at = time.monotonic()
+            entry.stale = False
+            entry.last_fetch = result
+            return entry
+
+        entry = ScrapeEntry(url, result.text, result.headers.get('ETag'),
+                            result.headers.get('Last-Modified'))
+        entry.last_fetch = result
+        self._entries[url] = entry
+        self._evict()
+        return entry
+
+    def _evict(self):
+        """Compacta el store conservando las series de los cuerpos en caché"""
+        if self.evict_after is None:
+            return
+        keep = [e.derived['scrape'] for e in self._entries.values() if 'scrape' in e.derived]
+        if self.store.compact(self.evict_after, keep, EVICT_MIN_FRACTION) is not None:
+            for e in self._entries.values():
+                e.derived.pop('snapshot', None)
+
+    def _stream_entry(self, url, headers):
+        """Descarga y parsea a la vez; devuelve la ScrapeEntry nueva o el FetchResult de un 304"""
+        with self.instrumentation.stage('stream'):
+            body = self.open_stream(url, headers)
+            if body.status == 304:
+                body.close()
+                return body.result()
+            entry = ScrapeEntry(url, None, body.headers.get('ETag'), body.headers.get('Last-Modified'))
+            metadata = entry.derived['metadata'] = {}
+            scrape = self.store.ingest(iter_samples(body.lines(), metadata, self.parse_filter))
+            entry.derived['scrape'] = scrape
+            self.instrumentation.set_series('stream', len(scrape))
+        entry.last_fetch = body.result()
+        self.instrumentation.record_fetch(entry.last_fetch)
+        return entry
+
+    def derive(self, url, name, build):
+        """Resultado derivado `name` del cuerpo actual, calculado una sola vez.
+
+        `build` recibe la ScrapeEntry (no el texto) para poder encadenar
+        otros derivados del mismo cuerpo sin volver a consultar la caché.
+        """
+        return self._derived(self.entry(url), name, build)
+
+    def _derived(self, entry, name, build):
+        if name not in entry.derived:
+            with self.instrumentation.stage(_STAGES.get(name, name)):
+                entry.derived[name] = build(entry)
+        return entry.derived[name]
+
+    def _samples(self, entry):
+        if entry.text is None and 'scrape' in entry.derived:
+            # Cuerpo en streaming: las muestras salen del Scrape ya ingerido
+            return self._derived(entry, 'samples', lambda e: [
+                Sample(p.series.family, p.series.name, p.labels.to_dict(), p.value, p.timestamp)
+                for p in e.derived['scrape']])
+
+        def build(e):
+            metadata = e.derived['metadata'] = {}
+            samples = list(parse_text(e.text, metadata, self.parse_filter))
+            self.instrumentation.set_series('parse', len(samples))
+            return samples
+        return self._derived(entry, 'samples', build)
+
+    def _scrape(self, entry):
+        # Las dependencias se resuelven fuera de la etapa para no medirlas dos veces
+        samples = self._samples(entry)
+        return self._derived(entry, 'scrape', lambda e: self.store.ingest(samples))
+
+    def text(self, url):
+        return self.entry(url).text
+
+    def samples(self, url):
+        """Lista de prom_parser.Sample del cuerpo actual"""
+        return self._samples(self.entry(url))
+
+    def metadata(self, url):
+        """{familia: {'type', 'help'}} de las líneas # TYPE / # HELP del cuerpo actual"""
+        entry = self.entry(url)
+        self._samples(entry)
+        return entry.derived['metadata']
+
+    def scrape(self, url):
+        """series_store.Scrape del cuerpo actual (series compartidas en self.store)"""
+        return self._scrape(self.entry(url))
+
+    def snapshot(self, url):
+        """ColumnarSnapshot del cuerpo actual"""
+        entry = self.entry(url)
+        scrape = self._scrape(entry)
+        return self._derived(entry, 'snapshot', lambda e: ColumnarSnapshot.from_scrape(scrape))
+
+    def categories(self, url):
+        """metric_categories.CategorySummary del cuerpo actual"""
+        entry = self.entry(url)
+        samples = self._samples(entry)
+        return self._derived(entry, 'categories', lambda e: summarize(samples, e.derived['metadata']))
+
+    def label_index(self):
+        """Índice invertido de etiquetas sobre las series de la caché (incremental)"""
+        if self._label_index is None:
+            self._label_index = LabelIndex(self.store)
+        self._label_index.refresh()
+        return self._label_index
+
+    def transfer_summary(self, url):
+        """Resumen del último scrape real de url (sin provocar otra descarga)"""
+        entry = self._entries.get(url)
+        if entry is None or entry.last_fetch is None:
+            return None
+        summary = entry.last_fetch.summary()
+        return f"{summary} (stale)" if entry.stale else summary
+
+    def invalidate(self, url=None):
+        if url is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(url, None)
+
+
+# Caché compartida por los scripts de este directorio
+SCRAPE_CACHE = ScrapeCache()
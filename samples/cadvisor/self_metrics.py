@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Auto-instrumentación de los scripts: cuánto cuesta scrapear y parsear cAdvisor
+
+Cada etapa del camino caliente (fetch, decode, parse, ingest, snapshot,
+extract_container_metrics...) registra su duración, el nº de series y el
+pico de memoria. Se expone:
+
+- en formato de exposición de Prometheus en un puerto local (/metrics)
+- como resumen JSON (/metrics.json, summary() o save_json())
+
+Pico de memoria por etapa:
+- con tracemalloc activo (start_tracing / --trace-allocations) es el pico
+  de bytes asignados por Python durante la etapa (exacto pero con coste)
+- si no, cuánto crece el máximo de RSS del proceso (ru_maxrss) durante la
+  etapa: gratis, pero sólo ve las etapas que marcan un pico nuevo
+
+Uso:
+    python3 self_metrics.py [--file dump.txt | --url URL] [--port 9101] [--trace-allocations]
+"""
+
+import argparse
+import functools
+import json
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = 'cadvisor_tools'
+DEFAULT_PORT = 9101
+
+
+class StageStats:
+    """Acumulados de una etapa"""
+
+    __slots__ = ('count', 'seconds', 'last_seconds', 'max_seconds', 'alloc_peak', 'max_alloc_peak')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.last_seconds = 0.0
+        self.max_seconds = 0.0
+        self.alloc_peak = 0
+        self.max_alloc_peak = 0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'seconds_total': round(self.seconds, 6),
+            'last_seconds': round(self.last_seconds, 6),
+            'avg_seconds': round(self.seconds / self.count, 6) if self.count else 0.0,
+            'max_seconds': round(self.max_seconds, 6),
+            'alloc_peak_bytes': self.alloc_peak,
+            'max_alloc_peak_bytes': self.max_alloc_peak,
+        }
+
+
+class SelfMetrics:
+    """Registro de duraciones, series y picos de memoria por etapa"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._frames = threading.local()
+        self.series = {}            # etapa -> nº de series de la última ejecución
+        self.fetches = {}           # status -> nº de descargas
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self.started = time.time()
+
+    # --- Registro -------------------------------------------------------------------
+
+    @staticmethod
+    def start_tracing():
+        """Activa tracemalloc: picos exactos de bytes asignados por etapa"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @staticmethod
+    def _max_rss():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def observe(self, stage, seconds, alloc_peak=None):
+        """Añade una ejecución de `stage` ya medida"""
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats()
+            stats.count += 1
+            stats.seconds += seconds
+            stats.last_seconds = seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            if alloc_peak is not None:
+                stats.alloc_peak = alloc_peak
+                stats.max_alloc_peak = max(stats.max_alloc_peak, alloc_peak)
+
+    @contextmanager
+    def stage(self, name):
+        """Mide el bloque como la etapa `name`; admite etapas anidadas
+
+        Con tracemalloc, el pico de una etapa exterior incluye el de las
+        interiores y el suyo de antes de entrar en ellas, aunque cada
+        interior reinicie el pico al empezar y al terminar.
+        """
+        stack = getattr(self._frames, 'stack', None)
+        if stack is None:
+            stack = self._frames.stack = []
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # El pico de la exterior hasta aquí se perdería con reset_peak()
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            frame = [current, current]          # [inicio, mayor pico de etapas interiores]
+        else:
+            frame = [self._max_rss(), 0]
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            if tracing:
+                _, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, frame[1])
+                tracemalloc.reset_peak()
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], peak)
+                alloc_peak = peak - frame[0]
+            else:
+                alloc_peak = self._max_rss() - frame[0]
+            self.observe(name, seconds, alloc_peak)
+
+    def timed(self, name):
+        """Decorador: cada llamada a la función es una ejecución de la etapa `name`"""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def set_series(self, stage, count):
+        with self._lock:
+            self.series[stage] = count
+
+    def record_fetch(self, result):
+        """Contadores de una descarga (http_fetch.FetchResult) y su etapa decode"""
+        with self._lock:
+            self.fetches[result.status] = self.fetches.get(result.status, 0) + 1
+            self.wire_bytes += result.wire_bytes or 0
+            self.decoded_bytes += result.decoded_bytes or 0
+        if result.status != 304:
+            self.observe('decode', result.decode_seconds)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self.series.clear()
+            self.fetches.clear()
+            self.wire_bytes = self.decoded_bytes = 0
+
+    # --- Salida ---------------------------------------------------------------------
+
+    def summary(self):
+        """Resumen JSON-serializable"""
+        with self._lock:
+            return {
+                'uptime_seconds': round(time.time() - self.started, 3),
+                'alloc_mode': 'tracemalloc' if tracemalloc.is_tracing() else 'max_rss',
+                'stages': {name: stats.to_dict() for name, stats in self._stages.items()},
+                'series': dict(self.series),
+                'fetches': {str(status): n for status, n in self.fetches.items()},
+                'wire_bytes_total': self.wire_bytes,
+                'decoded_bytes_total': self.decoded_bytes,
+                'max_rss_bytes': self._max_rss(),
+            }
+
+    def save_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        return path
+
+    def exposition(self):
+        """Texto en formato de exposición de Prometheus"""
+        summary = self.summary()
+        stages = summary['stages']
+        lines = []
+
+        def family(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {metric_type}")
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{PREFIX}_{name}{suffix}{{{label_text}}} {value}" if label_text
+                             else f"{PREFIX}_{name}{suffix} {value}")
+
+        family('stage_duration_seconds', 'summary', 'Duration of each instrumented stage.',
+               [s for stage, st in stages.items() for s in (
+                   ('_sum', {'stage': stage}, st['seconds_total']),
+                   ('_count', {'stage': stage}, st['count']))])
+        family('stage_last_duration_seconds', 'gauge', 'Duration of the last run of each stage.',
+               [('', {'stage': stage}, st['last_seconds']) for stage, st in stages.items()])
+        family('stage_max_duration_seconds', 'gauge', 'Slowest run of each stage.',
+               [('', {'stage': stage}, st['max_seconds']) for stage, st in stages.items()])
+        family('stage_alloc_peak_bytes', 'gauge',
+               f"Memory peak of the last run of each stage ({summary['alloc_mode']}).",
+               [('', {'stage': stage, 'mode': summary['alloc_mode']}, st['alloc_peak_bytes'])
+                for stage, st in stages.items()])
+        family('series', 'gauge', 'Series produced by the last run of each stage.',
+               [('', {'stage': stage}, n) for stage, n in summary['series'].items()])
+        family('fetches_total', 'counter', 'Scrapes of the cAdvisor endpoint by HTTP status.',
+               [('', {'status': status}, n) for status, n in summary['fetches'].items()])
+        family('fetch_wire_bytes_total', 'counter', 'Bytes received on the wire.',
+               [('', {}, summary['wire_bytes_total'])])
+        family('fetch_decoded_bytes_total', 'counter', 'Bytes after decompression.',
+               [('', {}, summary['decoded_bytes_total'])])
+        family('max_rss_bytes', 'gauge', 'Peak resident set size of the process.',
+               [('', {}, summary['max_rss_bytes'])])
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=DEFAULT_PORT, host='127.0.0.1'):
+        """Publica /metrics y /metrics.json en un hilo aparte; devuelve el servidor"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = registry.exposition().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(registry.summary(), indent=2).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# Registro compartido por los scripts de este directorio
+SELF_METRICS = SelfMetrics()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coste de scrapear y parsear cAdvisor, medido por etapas")
+    parser.add_argument('--file', help="dump a procesar (por defecto se descarga de --url)")
+    parser.add_argument('--url', default='http://localhost:8080/metrics')
+    parser.add_argument('--port', type=int, help="servir /metrics y /metrics.json hasta Ctrl+C")
+    parser.add_argument('--trace-allocations', action='store_true', help="picos con tracemalloc")
+    args = parser.parse_args()
+
+    if args.trace_allocations:
+        SelfMetrics.start_tracing()
+
+    # Como script este módulo es __main__: el registro que usan los demás es el de self_metrics
+    from self_metrics import SELF_METRICS as registry
+    from scrape_cache import ScrapeCache
+    from export_metrics import extract_container_metrics
+
+    if args.file:
+        from http_fetch import FetchResult
+        with open(args.file, encoding='utf-8') as f:
+            text = f.read()
+        size = len(text.encode('utf-8'))
+        cache = ScrapeCache(fetch=lambda url, headers: FetchResult(url, 200, text, {}, size, size, 0.0))
+    else:
+        cache = ScrapeCache()
+    url = args.file or args.url
+    cache.snapshot(url)
+    cache.categories(url)
+    extract_container_metrics(cache.scrape(url))
+
+    print(json.dumps(registry.summary(), indent=2))
+    if args.port:
+        registry.serve(args.port)
+        print(f"Sirviendo http://127.0.0.1:{args.port}/metrics (Ctrl+C para salir)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Almacén compacto de series para las métricas de cAdvisor
+
+- Los conjuntos de etiquetas se internan: cada combinación distinta existe
+  una sola vez en memoria y su hash se calcula una única vez.
+- Los nombres de etiqueta (≈20 container_label_* por línea) se comparten
+  como un único "esquema" entre todas las series que los usan.
+- Las muestras de cada scrape se guardan en arrays (valor, timestamp,
+  id de serie), no en diccionarios.
+- Las series que dejan de aparecer (contenedores que se van) pueden
+  eliminarse con compact(): los sids se renumeran de forma compacta y
+  epoch/remap_from() permiten a los consumidores con estado por sid
+  traducir sus arrays en lugar de crecer sin límite.
+
+Uso:
+    python3 series_store.py [cadvisor_metrics.txt] [n_scrapes]   # comparativa de memoria
+"""
+
+import sys
+import tracemalloc
+from array import array
+
+from prom_parser import parse_text
+
+# Valor centinela para muestras sin timestamp en los arrays
+NO_TIMESTAMP = -1
+
+
+class LabelSet:
+    """Conjunto de etiquetas inmutable e internado (usar LabelInterner.intern)"""
+
+    __slots__ = ('_keys', '_index', '_values', '_hash')
+
+    def __init__(self, keys, index, values):
+        self._keys = keys
+        self._index = index
+        self._values = values
+        self._hash = hash((keys, values))
+
+    def get(self, name, default=None):
+        i = self._index.get(name)
+        return default if i is None else self._values[i]
+
+    def __getitem__(self, name):
+        return self._values[self._index[name]]
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __bool__(self):
+        return bool(self._keys)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, LabelSet):
+            return NotImplemented
+        return (self._hash == other._hash and self._keys == other._keys
+                and self._values == other._values)
+
+    def keys(self):
+        return self._keys
+
+    def values(self):
+        return self._values
+
+    def items(self):
+        return zip(self._keys, self._values)
+
+    def to_dict(self):
+        return dict(zip(self._keys, self._values))
+
+    def __repr__(self):
+        return f"LabelSet({self.to_dict()!r})"
+
+
+class LabelInterner:
+    """Tabla de internado de esquemas de etiquetas, valores y LabelSet"""
+
+    def __init__(self):
+        self._schemas = {}   # claves en orden de llegada -> (claves ordenadas, índice, orden)
+        self._sets = {}      # (claves, valores) -> LabelSet
+        self._strings = {}   # valor -> misma instancia str
+
+    def _schema(self, raw_keys):
+        schema = self._schemas.get(raw_keys)
+        if schema is None:
+            keys = tuple(sorted(raw_keys))
+            order = tuple(raw_keys.index(k) for k in keys)
+            if order == tuple(range(len(keys))):
+                order = None
+            index = {k: i for i, k in enumerate(keys)}
+            schema = self._schemas[raw_keys] = (keys, index, order)
+        return schema
+
+    def intern(self, labels):
+        """Devuelve el LabelSet compartido para un dict de etiquetas"""
+        if isinstance(labels, LabelSet):
+            return labels
+        keys, index, order = self._schema(tuple(labels))
+        strings = self._strings
+        raw = [strings.setdefault(v, v) for v in labels.values()]
+        values = tuple(raw) if order is None else tuple(raw[i] for i in order)
+
+        key = (keys, values)
+        label_set = self._sets.get(key)
+        if label_set is None:
+            label_set = self._sets[key] = LabelSet(keys, index, values)
+        return label_set
+
+    def retain(self, label_sets):
+        """Olvida los LabelSet y valores que no estén en label_sets"""
+        self._sets = {(ls._keys, ls._values): ls for ls in label_sets}
+        self._strings = {v: v for ls in self._sets.values() for v in ls._values}
+
+    def __len__(self):
+        return len(self._sets)
+
+
+class Series:
+    """Serie única (nombre + etiquetas), compartida entre muestras y scrapes"""
+
+    __slots__ = ('sid', 'family', 'name', 'labels')
+
+    def __init__(self, sid, family, name, labels):
+        self.sid = sid
+        self.family = family
+        self.name = name
+        self.labels = labels
+
+    def __repr__(self):
+        return f"Series({self.sid}, {self.name!r}, {self.labels!r})"
+
+
+class Point:
+    """Muestra de una serie: referencia a la serie + valor + timestamp"""
+
+    __slots__ = ('series', 'value', 'timestamp')
+
+    def __init__(self, series, value, timestamp):
+        self.series = series
+        self.value = value
+        self.timestamp = timestamp
+
+    @property
+    def labels(self):
+        return self.series.labels
+
+    def __repr__(self):
+        return f"Point({self.series.name!r}, {self.value}, {self.timestamp})"
+
+
+class Scrape:
+    """Muestras de un scrape guardadas en arrays paralelos"""
+
+    __slots__ = ('store', 'sids', 'values', 'timestamps')
+
+    def __init__(self, store):
+        self.store = store
+        self.sids = array('l')
+        self.values = array('d')
+        self.timestamps = array('q')
+
+    def append(self, series, value, timestamp):
+        self.sids.append(series.sid)
+        self.values.append(value)
+        self.timestamps.append(NO_TIMESTAMP if timestamp is None else timestamp)
+
+    def remap(self, remap):
+        """Traduce los sids tras SeriesStore.compact (las series eliminadas se descartan)"""
+        keep = [i for i, sid in enumerate(self.sids) if remap[sid] >= 0]
+        if len(keep) != len(self.sids):
+            self.values = array('d', (self.values[i] for i in keep))
+            self.timestamps = array('q', (self.timestamps[i] for i in keep))
+        self.sids = array('l', (remap[self.sids[i]] for i in keep))
+
+    def __len__(self):
+        return len(self.sids)
+
+    def __iter__(self):
+        series = self.store.series
+        for sid, value, ts in zip(self.sids, self.values, self.timestamps):
+            yield Point(series[sid], value, None if ts == NO_TIMESTAMP else ts)
+
+
+class SeriesStore:
+    """Registro de series internadas, compartido entre scrapes sucesivos"""
+
+    def __init__(self, interner=None):
+        self.interner = interner or LabelInterner()
+        self.series = []
+        self._by_key = {}
+        # Código de familia por serie (índice = sid) para agrupar sin recorrer objetos
+        self.families = {}
+        self.family_ids = array('l')
+        # Nº de ingest() y el último en que apareció cada sid, para compact()
+        self.generation = 0
+        self._last_seen = array('q')
+        # Cada compact() que elimina series incrementa epoch; _remap traduce
+        # los sids de la época anterior a la actual
+        self.epoch = 0
+        self._remap = None
+
+    def get_series(self, name, labels, family=None):
+        """Devuelve (creándola si hace falta) la serie para nombre + etiquetas"""
+        label_set = self.interner.intern(labels)
+        key = (name, label_set)
+        series = self._by_key.get(key)
+        if series is None:
+            series = Series(len(self.series), sys.intern(family or name),
+                            sys.intern(name), label_set)
+            self.series.append(series)
+            self._by_key[key] = series
+            self.family_ids.append(self.families.setdefault(series.family, len(self.families)))
+            self._last_seen.append(self.generation)
+        return series
+
+    def ingest(self, samples):
+        """Convierte un iterable de prom_parser.Sample en un Scrape"""
+        self.generation += 1
+        generation, last_seen = self.generation, self._last_seen
+        scrape = Scrape(self)
+        for sample in samples:
+            series = self.get_series(sample.name, sample.labels, sample.family)
+            scrape.append(series, sample.value, sample.timestamp)
+            last_seen[series.sid] = generation
+        return scrape
+
+    def compact(self, max_idle, keep=(), min_fraction=0.0):
+        """Elimina las series que no aparecen en los últimos max_idle ingest().
+
+        Las series de los Scrape de `keep` se conservan y esos Scrape se
+        traducen a los sids nuevos. Sólo se compacta si las series a
+        eliminar son al menos min_fraction del total (para no renumerar en
+        cada scrape). Devuelve el array viejo -> nuevo sid (-1 si se
+        eliminó) o None si no se eliminó nada.
+        """
+        alive = bytearray(1 if self.generation - seen < max_idle else 0 for seen in self._last_seen)
+        for scrape in keep:
+            for sid in scrape.sids:
+                alive[sid] = 1
+        dead = len(alive) - sum(alive)
+        if dead == 0 or dead < len(alive) * min_fraction:
+            return None
+
+        remap = array('l', [-1]) * len(alive)
+        series, last_seen, family_ids = [], array('q'), array('l')
+        for old, s in enumerate(self.series):
+            if alive[old]:
+                remap[old] = s.sid = len(series)
+                series.append(s)
+                last_seen.append(self._last_seen[old])
+                family_ids.append(self.family_ids[old])
+            else:
+                s.sid = -1
+        self.series, self._last_seen, self.family_ids = series, last_seen, family_ids
+        self._by_key = {(s.name, s.labels): s for s in series}
+        self.interner.retain({s.labels for s in series})
+        for scrape in keep:
+            scrape.remap(remap)
+        self.epoch += 1
+        self._remap = remap
+        return remap
+
+    def remap_from(self, epoch):
+        """Traducción de sids desde la época anterior a la actual; None si
+        hay más de una compactación de por medio (hay que reconstruir el estado)"""
+        return self._remap if epoch == self.epoch - 1 else None
+
+    def ingest_text(self, metrics_text):
+        return self.ingest(parse_text(metrics_text))
+
+    def __len__(self):
+        return len(self.series)
+
+
+def _legacy_container_data(metrics_text):
+    """Estructura de export_metrics antes del store: un dict por línea"""
+    container_data = {}
+    for sample in parse_text(metrics_text):
+        container_id = sample.labels.get('id', '')
+        if 'kubepods' in container_id or 'container' in container_id:
+            container_data.setdefault(container_id, {}).setdefault(sample.name, []).append({
+                'labels': sample.labels,
+                'value': sample.value,
+                'timestamp': sample.timestamp
+            })
+    return container_data
+
+
+def _traced(build):
+    """Ejecuta build() y devuelve (resultado, bytes retenidos)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, retained
+
+
+def compare_memory(metrics_text, n_scrapes=5):
+    """Compara la memoria retenida de container_data frente al SeriesStore"""
+    legacy, legacy_bytes = _traced(
+        lambda: [_legacy_container_data(metrics_text) for _ in range(n_scrapes)])
+
+    def build_store():
+        store = SeriesStore()
+        return store, [store.ingest_text(metrics_text) for _ in range(n_scrapes)]
+
+    (store, scrapes), store_bytes = _traced(build_store)
+
+    return {
+        'scrapes': n_scrapes,
+        'samples_per_scrape': len(scrapes[0]),
+        'unique_series': len(store),
+        'unique_label_sets': len(store.interner),
+        'container_data_bytes': legacy_bytes,
+        'series_store_bytes': store_bytes,
+        'ratio': round(legacy_bytes / store_bytes, 1) if store_bytes else None,
+    }
+
+
+def main():
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'cadvisor_metrics.txt'
+    n_scrapes = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with open(filepath, encoding='utf-8') as f:
+        metrics_text = f.read()
+
+    result = compare_memory(metrics_text, n_scrapes)
+    print(f"Comparativa de memoria ({filepath}, {n_scrapes} scrapes):\n")
+    for key, value in result.items():
+        print(f"  {key:22}: {value}")
+
+
+if __name__ == '__main__':
+    main()
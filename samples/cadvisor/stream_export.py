@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Exportadores en streaming: NDJSON, CSV por familia y Parquet (si hay pyarrow)
+
+Cada serie se escribe en cuanto sale del parser (prom_parser.iter_samples),
+sin construir el resultado completo en memoria: la memoria es plana sea
+cual sea el tamaño del payload. A diferencia de container_metrics.json no
+se descarta nada: cada línea/fila lleva nombre, etiquetas, valor y
+timestamp.
+
+- NDJSON: una línea JSON por serie.
+- CSV: un fichero por familia; columnas name, value, timestamp y una por
+  etiqueta (las de la primera serie de la familia; el resto va en _extra).
+- Parquet: un fichero por familia, escrito por lotes (pyarrow opcional).
+
+Uso:
+    python3 stream_export.py cadvisor_metrics.txt salida/            # exporta en todos los formatos
+    python3 stream_export.py --benchmark cadvisor_metrics.txt [1 10 50]
+"""
+
+import csv
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from prom_parser import DEFAULT_PARSE_FILTER, iter_samples
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet es opcional
+    pa = pq = None
+
+EXTRA_COLUMN = '_extra'
+PARQUET_BATCH_ROWS = 8192
+
+
+def _family_filename(directory, family, extension):
+    return os.path.join(directory, f"{family}.{extension}")
+
+
+class NDJSONWriter:
+    """Una línea JSON por serie: {"name", "labels", "value", "timestamp"}"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self.rows = 0
+
+    def write(self, sample):
+        self._file.write(json.dumps(
+            {'name': sample.name, 'labels': sample.labels,
+             'value': sample.value, 'timestamp': sample.timestamp},
+            ensure_ascii=False, allow_nan=True))
+        self._file.write('\n')
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CSVFamilyWriter:
+    """Un CSV por familia en `directory`.
+
+    En el formato de texto las familias llegan en bloques contiguos, así que
+    sólo hay un fichero abierto; si una familia reaparece (dumps de varios
+    nodos concatenados) se reabre en modo append.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.rows = 0
+        self.columns = {}       # familia -> etiquetas de la cabecera
+        self._header = frozenset()  # las de la familia actual, para buscar las que faltan
+        self._family = None
+        self._file = None
+        self._writer = None
+
+    def _open(self, sample):
+        if self._file is not None:
+            self._file.close()
+        family = sample.family
+        path = _family_filename(self.directory, family, 'csv')
+        new = family not in self.columns
+        self._file = open(path, 'w' if new else 'a', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        if new:
+            self.columns[family] = sorted(sample.labels)
+            self._writer.writerow(['name', 'value', 'timestamp'] + self.columns[family] + [EXTRA_COLUMN])
+        self._header = frozenset(self.columns[family])
+        self._family = family
+
+    def write(self, sample):
+        if sample.family != self._family:
+            self._open(sample)
+        labels = sample.labels
+        columns = self.columns[self._family]
+        # Cualquier etiqueta fuera de la cabecera va a _extra, tenga la serie las que tenga
+        header = self._header
+        extra = None if labels.keys() <= header else {k: v for k, v in labels.items() if k not in header}
+        timestamp = '' if sample.timestamp is None else sample.timestamp
+        self._writer.writerow([sample.name, repr(sample.value), timestamp]
+                              + [labels.get(c, '') for c in columns]
+                              + [json.dumps(extra, ensure_ascii=False) if extra else ''])
+        self.rows += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetFamilyWriter:
+    """Un Parquet por familia en `directory`, escrito en lotes de batch_rows filas"""
+
+    def __init__(self, directory, batch_rows=PARQUET_BATCH_ROWS):
+        if pq is None:
+            raise RuntimeError("pyarrow no está instalado (pip install pyarrow)")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self._writers = {}      # familia -> (ParquetWriter, etiquetas del esquema, su frozenset)
+        self._family = None
+        self._buffer = []
+
+    def _schema(self, labels):
+        fields = [('name', pa.string()), ('value', pa.float64()), ('timestamp', pa.int64())]
+        fields += [(label, pa.string()) for label in labels]
+        fields.append((EXTRA_COLUMN, pa.string()))
+        return pa.schema(fields)
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        family = self._family
+        if family not in self._writers:
+            labels = sorted(self._buffer[0].labels)
+            path = _family_filename(self.directory, family, 'parquet')
+            self._writers[family] = (pq.ParquetWriter(path, self._schema(labels)), labels,
+                                     frozenset(labels))
+        writer, labels, header = self._writers[family]
+        rows = self._buffer
+        columns = {
+            'name': [s.name for s in rows],
+            'value': [s.value for s in rows],
+            'timestamp': [s.timestamp for s in rows],
+        }
+        for label in labels:
+            columns[label] = [s.labels.get(label, '') for s in rows]
+        columns[EXTRA_COLUMN] = [
+            None if s.labels.keys() <= header
+            else json.dumps({k: v for k, v in s.labels.items() if k not in header}, ensure_ascii=False)
+            for s in rows]
+        writer.write_table(pa.Table.from_pydict(columns, schema=writer.schema))
+        self._buffer = []
+
+    def write(self, sample):
+        if sample.family != self._family or len(self._buffer) >= self.batch_rows:
+            self._flush()
+            self._family = sample.family
+        self._buffer.append(sample)
+        self.rows += 1
+
+    def close(self):
+        self._flush()
+        for writer, _, _ in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_samples(samples, writers):
+    """Pasa cada prom_parser.Sample a todos los writers; devuelve cuántas series se exportan"""
+    count = 0
+    for sample in samples:
+        for writer in writers:
+            writer.write(sample)
+        count += 1
+    return count
+
+
+def export_lines(lines, writers, metadata=None, parse_filter=DEFAULT_PARSE_FILTER):
+    """Parsea `lines` (fichero, stream...) y pasa cada serie a todos los writers.
+
+    Las etiquetas vacías se descartan como en el resto de scripts.
+    Devuelve el número de series exportadas.
+    """
+    return export_samples(iter_samples(lines, metadata, parse_filter), writers)
+
+
+def export_text(metrics_text, writers, metadata=None):
+    """Igual que export_lines pero desde el texto ya descargado (sin splitlines)"""
+    return export_lines(io.StringIO(metrics_text), writers, metadata)
+
+
+def default_writers(directory, prefix='cadvisor_metrics'):
+    """NDJSON + CSV por familia (+ Parquet si hay pyarrow) dentro de `directory`"""
+    writers = [NDJSONWriter(os.path.join(directory, f"{prefix}.ndjson")),
+               CSVFamilyWriter(os.path.join(directory, 'csv'))]
+    if pq is not None:
+        writers.append(ParquetFamilyWriter(os.path.join(directory, 'parquet')))
+    return writers
+
+
+# --- Benchmark ----------------------------------------------------------------------
+
+def _measure(method, source, out_dir):
+    """Ejecuta un método de exportación (en un proceso aparte) y devuelve tiempo y pico de RSS"""
+    start = time.perf_counter()
+    if method == 'json':
+        # Camino actual de export_metrics: Scrape completo -> dict -> json.dump(indent=2)
+        import export_metrics
+        from series_store import SeriesStore
+        export_metrics.OUTPUT_DIR = out_dir
+        with open(source, encoding='utf-8') as f:
+            scrape = SeriesStore().ingest_text(f.read())
+        export_metrics.save_container_metrics(export_metrics.extract_container_metrics(scrape))
+    else:
+        writers = {
+            'ndjson': lambda: [NDJSONWriter(os.path.join(out_dir, 'out.ndjson'))],
+            'csv': lambda: [CSVFamilyWriter(os.path.join(out_dir, 'csv'))],
+            'parquet': lambda: [ParquetFamilyWriter(os.path.join(out_dir, 'parquet'))],
+        }[method]()
+        with open(source, encoding='utf-8') as f:
+            export_lines(f, writers)
+        for writer in writers:
+            writer.close()
+    seconds = time.perf_counter() - start
+    return {'seconds': round(seconds, 3),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+
+def benchmark(filepath, multipliers=(1, 10, 50)):
+    """Tiempo y pico de RSS de cada exportador con payloads de 1x, 10x... el dump"""
+    with open(filepath, encoding='utf-8') as f:
+        metrics_text = f.read()
+    methods = ['json', 'ndjson', 'csv'] + (['parquet'] if pq is not None else [])
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in multipliers:
+            source = os.path.join(tmp, f"payload_{n}x.txt")
+            with open(source, 'w', encoding='utf-8') as f:
+                for _ in range(n):
+                    f.write(metrics_text)
+            for method in methods:
+                out_dir = os.path.join(tmp, f"{method}_{n}")
+                os.makedirs(out_dir)
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--measure', method, source, out_dir],
+                    check=True, capture_output=True, text=True,
+                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+                results[(n, method)] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+
+def main():
+    args = sys.argv[1:]
+    if args[:1] == ['--measure']:
+        print(json.dumps(_measure(*args[1:4])))
+        return 0
+    if args[:1] == ['--benchmark']:
+        filepath = args[1] if len(args) > 1 else 'cadvisor_metrics.txt'
+        multipliers = [int(n) for n in args[2:]] or [1, 10, 50]
+        size_mb = os.path.getsize(filepath) / 1e6
+        print(f"{'payload':>10} {'método':>8} {'tiempo (s)':>11} {'pico RSS (MB)':>14}")
+        for (n, method), r in benchmark(filepath, multipliers).items():
+            print(f"{size_mb * n:8.0f}MB {method:>8} {r['seconds']:11.3f} {r['peak_rss_mb']:14.1f}")
+        return 0
+    if len(args) < 2:
+        print(f"Uso: {sys.argv[0]} DUMP DIRECTORIO | --benchmark [DUMP] [N ...]")
+        return 1
+    filepath, directory = args[0], args[1]
+    os.makedirs(directory, exist_ok=True)
+    writers = default_writers(directory)
+    start = time.perf_counter()
+    with open(filepath, encoding='utf-8') as f:
+        count = export_lines(f, writers)
+    for writer in writers:
+        writer.close()
+    print(f"{count} series exportadas a {directory} en {time.perf_counter() - start:.2f} s "
+          f"({', '.join(type(w).__name__ for w in writers)})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Ingesta en streaming: del socket al parser sin el cuerpo completo en memoria
+
+El camino con buffer (MetricsFetcher.fetch) lee la respuesta entera,
+la descomprime, la decodifica a un str y la parte en una lista de líneas:
+el payload llega a estar dos o tres veces en memoria y el parseo no
+empieza hasta que termina la descarga. Con MetricsFetcher.stream cada
+trozo de 64 KiB se descomprime, se decodifica y se parte en líneas en
+cuanto llega, y prom_parser.iter_samples las consume según salen.
+
+Este script sirve un payload sintético (gzip, opcionalmente con ancho de
+banda limitado) desde un servidor HTTP local y mide, en un proceso
+aparte por caso, con los dos caminos:
+
+- tiempo total y tiempo hasta la primera muestra
+- pico de RSS sobre el del proceso ya arrancado; con `count` sólo se
+  cuentan las muestras (la memoria de la descarga), con `store` además
+  se ingieren en un SeriesStore (esa parte crece con el nº de series)
+
+Uso:
+    python3 stream_ingest.py [--containers 1000 5000] [--rate 50]   # rate en MB/s en la red, 0 = sin límite
+    python3 stream_ingest.py --url http://localhost:8080/metrics       # contra un cAdvisor real
+"""
+
+import argparse
+import gzip
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from http_fetch import DEFAULT_CHUNK_SIZE, MetricsFetcher
+from prom_parser import iter_samples, parse_text
+from series_store import SeriesStore
+
+MODES = ('buffered', 'stream')
+SINKS = ('count', 'store')
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _first_sample(samples, timings, start):
+    """Deja pasar las muestras anotando cuándo sale la primera"""
+    for sample in samples:
+        if 'first_sample' not in timings:
+            timings['first_sample'] = time.perf_counter() - start
+        yield sample
+
+
+def _measure(mode, sink, url):
+    """Descarga y parsea url con un camino (en un proceso aparte); tiempos y pico de RSS"""
+    fetcher = MetricsFetcher()
+    baseline = _peak_rss_mb()
+    timings = {}
+    start = time.perf_counter()
+    if mode == 'buffered':
+        result = fetcher.fetch(url)
+        samples = parse_text(result.text, {})
+    else:
+        body = fetcher.stream(url)
+        samples = iter_samples(body.lines(), {})
+    samples = _first_sample(samples, timings, start)
+    if sink == 'store':
+        count = len(SeriesStore().ingest(samples))
+    else:
+        count = sum(1 for _ in samples)
+    seconds = time.perf_counter() - start
+    if mode == 'stream':
+        result = body.result()
+    fetcher.close()
+    return {
+        'samples': count,
+        'wire_mb': round(result.wire_bytes / 1e6, 1),
+        'decoded_mb': round(result.decoded_bytes / 1e6, 1),
+        'seconds': round(seconds, 3),
+        'first_sample_ms': round(timings.get('first_sample', seconds) * 1000, 1),
+        'baseline_rss_mb': round(baseline, 1),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'extra_rss_mb': round(_peak_rss_mb() - baseline, 1),
+    }
+
+
+class _PayloadHandler(BaseHTTPRequestHandler):
+    """Sirve server.payload (gzip si se acepta) a server.rate bytes/s como mucho"""
+
+    def do_GET(self):
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+        path = self.server.payload + ('.gz' if gzipped else '')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        rate = self.server.rate
+        start, sent = time.perf_counter(), 0
+        with open(path, 'rb') as f:
+            while chunk := f.read(DEFAULT_CHUNK_SIZE):
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if rate:
+                    ahead = sent / rate - (time.perf_counter() - start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(payload, rate=0):
+    """Servidor HTTP local en un hilo para el fichero `payload` (y payload.gz); devuelve (url, servidor)"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _PayloadHandler)
+    server.payload, server.rate = payload, rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/metrics", server
+
+
+def _run_case(mode, sink, url):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--measure', mode, sink, url],
+        check=True, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark(containers_list=(1000, 5000), rate_mb=0):
+    """{(contenedores, modo, destino): medidas} con payloads sintéticos servidos en local"""
+    from synthetic_metrics import generate
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for containers in containers_list:
+            payload = os.path.join(tmp, f"payload_{containers}.txt")
+            with open(payload, 'w', encoding='utf-8') as f:
+                generate(f, containers=containers, devices=2)
+            with open(payload, 'rb') as src, gzip.open(payload + '.gz', 'wb', compresslevel=6) as dst:
+                while chunk := src.read(1 << 20):
+                    dst.write(chunk)
+            url, server = serve(payload, rate_mb * 1e6)
+            try:
+                for sink in SINKS:
+                    for mode in MODES:
+                        results[(containers, mode, sink)] = _run_case(mode, sink, url)
+            finally:
+                server.shutdown()
+    return results
+
+
+def main():
+    if sys.argv[1:2] == ['--measure']:
+        print(json.dumps(_measure(*sys.argv[2:5])))
+        return 0
+    parser = argparse.ArgumentParser(description="Ingesta con buffer frente a streaming")
+    parser.add_argument('--containers', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--rate', type=float, default=0, help="MB/s en la red (0 = sin límite)")
+    parser.add_argument('--url', help="medir contra un endpoint real en lugar del payload sintético")
+    args = parser.parse_args()
+
+    if args.url:
+        results = {('-', mode, sink): _run_case(mode, sink, args.url) for sink in SINKS for mode in MODES}
+    else:
+        results = benchmark(args.containers, args.rate)
+    print(f"{'contenedores':>12} {'modo':>9} {'destino':>8} {'MB (red/texto)':>15} {'muestras':>9} "
+          f"{'total (s)':>10} {'1ª muestra (ms)':>16} {'RSS extra (MB)':>15}")
+    for (containers, mode, sink), r in results.items():
+        print(f"{containers:>12} {mode:>9} {sink:>8} {r['wire_mb']:>7}/{r['decoded_mb']:<7} {r['samples']:9d} "
+              f"{r['seconds']:10.2f} {r['first_sample_ms']:16.1f} {r['extra_rss_mb']:15.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Generador de payloads sintéticos de cAdvisor (formato de exposición de texto)
+
+Reproduce la forma de cadvisor_metrics.txt (familias, # HELP / # TYPE,
+etiquetas container_label_* casi siempre vacías, jerarquía de cgroups
+kubepods -> QoS -> pod -> contenedor, timestamps por serie) pero con un
+número configurable de contenedores, etiquetas y dispositivos, para probar
+los scripts con nodos de producción mucho más grandes que minikube.
+
+Escala 1 se parece al dump de minikube (~100 cgroups, ~3k series y 2.6 MB);
+las escalas 10 y 100 multiplican los pods, contenedores y servicios.
+
+Uso:
+    python3 synthetic_metrics.py salida.txt [--scale 10] [--containers N] [--labels 16] [--families cpu,memory]
+"""
+
+import argparse
+import random
+import sys
+import uuid
+
+# Contenedores y servicios de systemd a escala 1 (parecido al dump de minikube)
+BASE_CONTAINERS = 20
+BASE_SYSTEM_SERVICES = 12
+CONTAINERS_PER_POD = 1
+
+# Etiquetas container_label_* de cAdvisor (en el dump casi todas vacías)
+K8S_LABELS = (
+    'container_label_io_kubernetes_container_name',
+    'container_label_io_kubernetes_pod_name',
+    'container_label_io_kubernetes_pod_namespace',
+    'container_label_io_kubernetes_pod_uid',
+)
+BASE_LABELS = K8S_LABELS + (
+    'container_label_actual_registry', 'container_label_addonmanager_kubernetes_io_mode',
+    'container_label_app', 'container_label_component',
+    'container_label_controller_revision_hash', 'container_label_integration_test',
+    'container_label_k8s_app', 'container_label_kubernetes_io_minikube_addons',
+    'container_label_pod_template_generation', 'container_label_pod_template_hash',
+    'container_label_registry_proxy', 'container_label_tier',
+)
+NAMESPACES = ('default', 'kube-system', 'monitoring', 'ingress-nginx', 'payments', 'search')
+QOS_CLASSES = ('guaranteed', 'burstable', 'besteffort')
+
+# (familia, tipo, help, ámbito, dimensiones extra, con timestamp)
+# ámbito: 'cgroup' todos los cgroups, 'quota' sólo con cuota de CPU,
+# 'network' raíz y sandboxes de pods, 'fs' raíz por dispositivo, 'machine' y 'exporter'
+FAMILIES = (
+    ('cadvisor_version_info', 'gauge', "A metric with a constant '1' value labeled by kernel version, OS version, docker version, cadvisor version & cadvisor revision.", 'exporter', {}, False),
+    ('container_cpu_cfs_periods_total', 'counter', 'Number of elapsed enforcement period intervals.', 'quota', {}, True),
+    ('container_cpu_cfs_throttled_periods_total', 'counter', 'Number of throttled period intervals.', 'quota', {}, True),
+    ('container_cpu_cfs_throttled_seconds_total', 'counter', 'Total time duration the container has been throttled.', 'quota', {}, True),
+    ('container_cpu_load_average_10s', 'gauge', 'Value of container cpu load average over the last 10 seconds.', 'cgroup', {}, True),
+    ('container_cpu_system_seconds_total', 'counter', 'Cumulative system cpu time consumed in seconds.', 'cgroup', {}, True),
+    ('container_cpu_usage_seconds_total', 'counter', 'Cumulative cpu time consumed in seconds.', 'cgroup', {'cpu': ('total',)}, True),
+    ('container_cpu_user_seconds_total', 'counter', 'Cumulative user cpu time consumed in seconds.', 'cgroup', {}, True),
+    ('container_fs_inodes_free', 'gauge', 'Number of available Inodes', 'fs', {}, True),
+    ('container_fs_inodes_total', 'gauge', 'Number of Inodes', 'fs', {}, True),
+    ('container_fs_io_current', 'gauge', 'Number of I/Os currently in progress', 'fs', {}, True),
+    ('container_fs_io_time_seconds_total', 'counter', 'Cumulative count of seconds spent doing I/Os', 'fs', {}, True),
+    ('container_fs_limit_bytes', 'gauge', 'Number of bytes that can be consumed by the container on this filesystem.', 'fs', {}, True),
+    ('container_fs_reads_total', 'counter', 'Cumulative count of reads completed', 'fs', {}, True),
+    ('container_fs_usage_bytes', 'gauge', 'Number of bytes that are consumed by the container on this filesystem.', 'fs', {}, True),
+    ('container_fs_writes_total', 'counter', 'Cumulative count of writes completed', 'fs', {}, True),
+    ('container_last_seen', 'gauge', 'Last time a container was seen by the exporter', 'cgroup', {}, True),
+    ('container_memory_cache', 'gauge', 'Number of bytes of page cache memory.', 'cgroup', {}, True),
+    ('container_memory_failcnt', 'counter', 'Number of memory usage hits limits', 'cgroup', {}, True),
+    ('container_memory_failures_total', 'counter', 'Cumulative count of memory allocation failures.', 'cgroup',
+     {'failure_type': ('pgfault', 'pgmajfault'), 'scope': ('container', 'hierarchy')}, True),
+    ('container_memory_mapped_file', 'gauge', 'Size of memory mapped files in bytes.', 'cgroup', {}, True),
+    ('container_memory_max_usage_bytes', 'gauge', 'Maximum memory usage recorded in bytes', 'cgroup', {}, True),
+    ('container_memory_rss', 'gauge', 'Size of RSS in bytes.', 'cgroup', {}, True),
+    ('container_memory_swap', 'gauge', 'Container swap usage in bytes.', 'cgroup', {}, True),
+    ('container_memory_usage_bytes', 'gauge', 'Current memory usage in bytes, including all memory regardless of when it was accessed', 'cgroup', {}, True),
+    ('container_memory_working_set_bytes', 'gauge', 'Current working set in bytes.', 'cgroup', {}, True),
+    ('container_network_receive_bytes_total', 'counter', 'Cumulative count of bytes received', 'network', {}, True),
+    ('container_network_receive_errors_total', 'counter', 'Cumulative count of errors encountered while receiving', 'network', {}, True),
+    ('container_network_receive_packets_total', 'counter', 'Cumulative count of packets received', 'network', {}, True),
+    ('container_network_transmit_bytes_total', 'counter', 'Cumulative count of bytes transmitted', 'network', {}, True),
+    ('container_network_transmit_errors_total', 'counter', 'Cumulative count of errors encountered while transmitting', 'network', {}, True),
+    ('container_network_transmit_packets_total', 'counter', 'Cumulative count of packets transmitted', 'network', {}, True),
+    ('container_oom_events_total', 'counter', 'Count of out of memory events observed for the container', 'cgroup', {}, True),
+    ('container_spec_cpu_period', 'gauge', 'CPU period of the container.', 'cgroup', {}, False),
+    ('container_spec_cpu_quota', 'gauge', 'CPU quota of the container.', 'quota', {}, False),
+    ('container_spec_cpu_shares', 'gauge', 'CPU share of the container.', 'cgroup', {}, False),
+    ('container_spec_memory_limit_bytes', 'gauge', 'Memory limit for the container.', 'cgroup', {}, False),
+    ('container_spec_memory_reservation_limit_bytes', 'gauge', 'Memory reservation limit for the container.', 'cgroup', {}, False),
+    ('container_spec_memory_swap_limit_bytes', 'gauge', 'Memory swap limit for the container.', 'cgroup', {}, False),
+    ('container_start_time_seconds', 'gauge', 'Start time of the container since unix epoch in seconds.', 'cgroup', {}, False),
+    ('container_tasks_state', 'gauge', 'Number of tasks in given state', 'cgroup',
+     {'state': ('iowaiting', 'running', 'sleeping', 'stopped', 'uninterruptible')}, True),
+    ('go_goroutines', 'gauge', 'Number of goroutines that currently exist.', 'exporter', {}, False),
+    ('go_memstats_alloc_bytes', 'gauge', 'Number of bytes allocated and still in use.', 'exporter', {}, False),
+    ('machine_cpu_cores', 'gauge', 'Number of logical CPU cores.', 'machine', {}, False),
+    ('machine_memory_bytes', 'gauge', 'Amount of memory installed on the machine.', 'machine', {}, False),
+    ('process_cpu_seconds_total', 'counter', 'Total user and system CPU time spent in seconds.', 'exporter', {}, False),
+    ('process_resident_memory_bytes', 'gauge', 'Resident memory size in bytes.', 'exporter', {}, False),
+)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Cgroup:
+    __slots__ = ('id', 'labels', 'quota', 'network')
+
+    def __init__(self, cgroup_id, labels, quota=False, network=False):
+        self.id = cgroup_id
+        self.labels = labels
+        self.quota = quota
+        self.network = network
+
+
+def _build_cgroups(rng, containers, services, label_names, label_values):
+    """Jerarquía de cgroups: raíz, system.slice, kubepods -> QoS -> pod -> contenedor"""
+    empty = dict.fromkeys(label_names, '')
+
+    def labels(**values):
+        result = dict(empty)
+        result.update(values)
+        return result
+
+    cgroups = [_Cgroup('/', labels(), network=True),
+               _Cgroup('/system.slice', labels()),
+               _Cgroup('/kubepods.slice', labels())]
+    for i in range(services):
+        cgroups.append(_Cgroup(f"/system.slice/service-{i}.service", labels()))
+    for qos in QOS_CLASSES[1:]:
+        cgroups.append(_Cgroup(f"/kubepods.slice/kubepods-{qos}.slice", labels()))
+
+    custom = [n for n in label_names if n not in BASE_LABELS]
+    n_pods = max(1, containers // CONTAINERS_PER_POD)
+    for p in range(n_pods):
+        qos = QOS_CLASSES[p % len(QOS_CLASSES)]
+        uid = str(uuid.UUID(int=rng.getrandbits(128)))
+        slug = uid.replace('-', '_')
+        if qos == 'guaranteed':
+            pod_path = f"/kubepods.slice/kubepods-pod{slug}.slice"
+        else:
+            pod_path = f"/kubepods.slice/kubepods-{qos}.slice/kubepods-{qos}-pod{slug}.slice"
+        namespace = NAMESPACES[p % len(NAMESPACES)]
+        pod_name = f"app-{p}-{uid[:5]}"
+        cgroups.append(_Cgroup(pod_path, labels()))
+
+        sandbox = f"{rng.getrandbits(256):064x}"
+        cgroups.append(_Cgroup(f"{pod_path}/crio-{sandbox}", labels(**{
+            'container_label_io_kubernetes_pod_name': pod_name,
+            'container_label_io_kubernetes_pod_namespace': namespace,
+            'container_label_io_kubernetes_pod_uid': uid,
+        }), network=True))
+        for c in range(CONTAINERS_PER_POD):
+            container_id = f"{rng.getrandbits(256):064x}"
+            extra = {name: f"v{rng.randrange(label_values)}" for name in custom}
+            cgroups.append(_Cgroup(f"{pod_path}/crio-{container_id}", labels(**{
+                'container_label_io_kubernetes_container_name': f"app-{c}",
+                'container_label_io_kubernetes_pod_name': pod_name,
+                'container_label_io_kubernetes_pod_namespace': namespace,
+                'container_label_io_kubernetes_pod_uid': uid,
+                **extra,
+            }), quota=qos != 'besteffort'))
+            cgroups.append(_Cgroup(f"{pod_path}/crio-conmon-{container_id}.scope", labels()))
+    return cgroups
+
+
+def _value(rng, family, metric_type):
+    if family.endswith('_bytes') or 'memory' in family:
+        return float(rng.randrange(1 << 20, 1 << 31))
+    if metric_type == 'counter':
+        return round(rng.random() * 1e5, 6)
+    return float(rng.randrange(0, 100))
+
+
+def _step_value(value, family, metric_type, step, drift, noise):
+    """Valor en el refresco `step`: los counters crecen a un ritmo fijo por serie, los gauges varían ±10%
+
+    Por refresco: hasta 1 unidad (≤ 1 núcleo de CPU), 1 MB en los de bytes,
+    0.2 en los de throttling y 1 periodo CFS (≤ 20 % de periodos throttled).
+    """
+    rate = drift.random()
+    if metric_type == 'counter':
+        if 'bytes' in family:
+            rate *= 1e6
+        elif 'throttled' in family:
+            rate *= 0.2
+        elif family.endswith('_periods_total'):
+            rate = 1.0
+        return round(value + step * rate, 6)
+    return float(round(value * (0.9 + 0.2 * noise.random())))
+
+
+def generate(out, scale=1, containers=None, labels=len(BASE_LABELS), label_values=50,
+             devices=8, families=None, seed=1, timestamp_ms=1764230077164, step=0):
+    """Escribe un payload sintético en el fichero `out` (abierto en modo texto).
+
+    containers: nº de contenedores (por defecto BASE_CONTAINERS * scale)
+    labels: nº de etiquetas container_label_* (las que sobren de las 16 base
+            se rellenan con label_values valores distintos)
+    families: prefijos/categorías a incluir ('cpu', 'memory', 'container_fs'...)
+    step: refresco simulado; mismas series que step=0, con los counters
+          incrementados y los gauges movidos (para tasas y diffs realistas)
+    Devuelve el número de series escritas.
+    """
+    rng = random.Random(seed)
+    drift, noise = random.Random(seed + 1), random.Random(seed * 1000003 + step)
+    containers = containers if containers is not None else BASE_CONTAINERS * scale
+    services = BASE_SYSTEM_SERVICES * scale
+    label_names = list(BASE_LABELS[:labels]) + [
+        f"container_label_custom_{i}" for i in range(max(0, labels - len(BASE_LABELS)))]
+    cgroups = _build_cgroups(rng, containers, services, label_names, label_values)
+    device_names = [f"/dev/nvme0n1p{i}" for i in range(devices)]
+
+    selected = [f for f in FAMILIES
+                if not families or any(sel in f[0] for sel in families)]
+    count = 0
+    write = out.write
+    for family, metric_type, help_text, scope, dims, with_ts in selected:
+        write(f"# HELP {family} {help_text}\n# TYPE {family} {metric_type}\n")
+        if scope in ('exporter', 'machine'):
+            if family == 'cadvisor_version_info':
+                label_text = ('{cadvisorRevision="c7714a77",cadvisorVersion="v0.47.0",dockerVersion="",'
+                              'kernelVersion="6.17.8-arch1-1",osVersion="Alpine Linux v3.16"}')
+            elif scope == 'machine':
+                label_text = '{boot_id="912ac0db",machine_id="881d8700",system_uuid="f2e93db7"}'
+            else:
+                label_text = ''
+            write(f"{family}{label_text} {_value(rng, family, metric_type)}\n")
+            count += 1
+            continue
+
+        if scope == 'fs':
+            members = [(cgroups[0], {'device': d}) for d in device_names]
+        else:
+            members = [(c, {}) for c in cgroups
+                       if scope == 'cgroup' or (scope == 'quota' and c.quota)
+                       or (scope == 'network' and c.network)]
+            if scope == 'network':
+                members = [(c, {'interface': 'eth0'}) for c, _ in members]
+
+        combos = [{}]
+        for name, values in dims.items():
+            combos = [dict(combo, **{name: v}) for combo in combos for v in values]
+
+        for cgroup, member_dims in members:
+            base = dict(cgroup.labels, id=cgroup.id, image='', name='', **member_dims)
+            for combo in combos:
+                all_labels = dict(base, **combo)
+                label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(all_labels.items()))
+                value = _value(rng, family, metric_type)
+                if step:
+                    value = _step_value(value, family, metric_type, step, drift, noise)
+                line = f"{family}{{{label_text}}} {value}"
+                if with_ts:
+                    line += f" {timestamp_ms - rng.randrange(0, 10000)}"
+                write(line + '\n')
+                count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un payload sintético de cAdvisor")
+    parser.add_argument('output', help="fichero de salida ('-' para stdout)")
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--containers', type=int, help="nº de contenedores (anula --scale)")
+    parser.add_argument('--labels', type=int, default=len(BASE_LABELS),
+                        help="nº de etiquetas container_label_* por serie")
+    parser.add_argument('--label-values', type=int, default=50,
+                        help="valores distintos de cada etiqueta extra")
+    parser.add_argument('--devices', type=int, default=8)
+    parser.add_argument('--families', help="lista separada por comas de subcadenas de familia")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    families = args.families.split(',') if args.families else None
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        count = generate(out, args.scale, args.containers, args.labels, args.label_values,
+                         args.devices, families, args.seed)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{count} series generadas", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Renderizado diferencial en terminal con secuencias ANSI
+
+En lugar de borrar la pantalla (os.system('clear') lanza un shell en cada
+refresco) y volver a imprimirlo todo, se guarda el último fotograma y sólo
+se reescriben los tramos de cada fila que han cambiado, situando el
+cursor con CSI fila;columna H. Sin parpadeo y con un coste por refresco
+proporcional a lo que cambia.
+
+Se usa la pantalla alternativa (como top/less): al salir, el terminal
+queda como estaba. Las filas se tratan como texto de ancho 1 por carácter
+(ASCII y caracteres de caja; sin emojis ni caracteres anchos).
+"""
+
+import shutil
+import sys
+
+CSI = '\x1b['
+ALT_SCREEN_ON = CSI + '?1049h'
+ALT_SCREEN_OFF = CSI + '?1049l'
+HIDE_CURSOR = CSI + '?25l'
+SHOW_CURSOR = CSI + '?25h'
+CLEAR = CSI + 'H' + CSI + '2J'
+RESET = CSI + '0m'
+
+
+def _goto(row, column):
+    """Mueve el cursor (fila y columna empiezan en 0)"""
+    return f"{CSI}{row + 1};{column + 1}H"
+
+
+def clear_sequence():
+    """Borrado de pantalla sin lanzar un proceso (sustituto de os.system('clear'))"""
+    return CLEAR
+
+
+class DiffRenderer:
+    """Pinta fotogramas (listas de filas) reescribiendo sólo lo que cambia"""
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self._frame = []
+        self._size = None
+        self.bytes_written = 0
+
+    def start(self):
+        self._write(ALT_SCREEN_ON + HIDE_CURSOR + CLEAR)
+        self._frame = []
+
+    def stop(self):
+        self._write(RESET + SHOW_CURSOR + ALT_SCREEN_OFF)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _write(self, text):
+        self.out.write(text)
+        self.out.flush()
+        self.bytes_written += len(text)
+
+    def diff(self, lines, width, height):
+        """Secuencia ANSI que lleva de lo pintado a `lines` (ajustadas a width x height)"""
+        lines = [line[:width].ljust(width) for line in lines[:height]]
+        lines += [' ' * width] * (height - len(lines))
+        if (width, height) != self._size or len(self._frame) != height:
+            # Primer fotograma o terminal redimensionado: se pinta entero
+            self._size = (width, height)
+            self._frame = lines
+            return CLEAR + ''.join(_goto(row, 0) + line for row, line in enumerate(lines))
+
+        parts = []
+        for row, (old, new) in enumerate(zip(self._frame, lines)):
+            if old == new:
+                continue
+            first = 0
+            while old[first] == new[first]:
+                first += 1
+            last = width - 1
+            while old[last] == new[last]:
+                last -= 1
+            parts.append(_goto(row, first) + new[first:last + 1])
+        self._frame = lines
+        return ''.join(parts)
+
+    def render(self, lines, size=None):
+        """Pinta el fotograma; devuelve los bytes escritos en el terminal"""
+        width, height = size or shutil.get_terminal_size()
+        text = self.diff(lines, width, height)
+        if text:
+            self._write(text)
+        return len(text)
@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+"""
+Almacén local append-only de series temporales comprimidas (estilo Gorilla)
+
+Formato del fichero: cabecera MAGIC y una secuencia de registros
+    tipo (1 byte) | longitud (varint) | payload
+- 'L' esquema: id + lista JSON de nombres de etiqueta. Los ≈25 nombres
+  container_label_* se escriben una vez para todas las series.
+- 'S' serie: sid + id de esquema + [familia, nombre, valores] en JSON. Se
+  escribe una sola vez por serie, las etiquetas no se repiten por muestra.
+- 'C' chunk: sid, nº de muestras, t0, t_fin - t0 y los bits comprimidos:
+  timestamps con delta-of-delta y valores con XOR del valor anterior.
+- 'O' chunk abierto: un chunk con menos de CHUNK_SIZE muestras que quedó
+  al cerrar el escritor, con el estado del codificador delante de los bits.
+
+El escritor codifica cada muestra al llegar en el chunk abierto de su
+serie y lo cierra ('C') al llegar a CHUNK_SIZE muestras. close() escribe
+los abiertos como 'O' al final del fichero; al reabrir se retoman desde
+su estado (sin decodificar), se trunca el fichero donde empiezan y se
+siguen llenando. Así un script que abre, añade un scrape y cierra en cada
+ejecución (export_metrics.py) tiene chunks de CHUNK_SIZE muestras y no de
+una. El lector indexa los chunks y sólo decodifica los que solapan con el
+rango pedido.
+
+Uso:
+    python3 tsdb.py [cadvisor_metrics.txt] [n_snapshots]   # compresión y throughput, con el escritor
+                                                          # abierto y reabierto en cada scrape
+"""
+
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+
+from series_store import NO_TIMESTAMP, SeriesStore
+
+MAGIC = b'CATSDB1\n'
+CHUNK_SIZE = 120
+
+SCHEMA_RECORD = b'L'
+SERIES_RECORD = b'S'
+CHUNK_RECORD = b'C'
+OPEN_CHUNK_RECORD = b'O'
+
+
+# --- Enteros de longitud variable -------------------------------------------------
+
+def _write_varint(out, n):
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def _unzigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+# --- Flujo de bits ----------------------------------------------------------------
+
+class BitWriter:
+    """Acumula bits en un entero de Python y los vuelca a bytes al final"""
+
+    __slots__ = ('_acc', 'nbits')
+
+    def __init__(self, data=b'', nbits=0):
+        # Con data/nbits se retoma un flujo ya volcado (to_bytes rellena con ceros)
+        self._acc = int.from_bytes(data, 'big') >> (len(data) * 8 - nbits)
+        self.nbits = nbits
+
+    def write(self, value, nbits):
+        self._acc = (self._acc << nbits) | (value & ((1 << nbits) - 1))
+        self.nbits += nbits
+
+    def to_bytes(self):
+        pad = -self.nbits % 8
+        return (self._acc << pad).to_bytes((self.nbits + pad) // 8, 'big')
+
+
+class BitReader:
+    __slots__ = ('_acc', '_total', '_pos')
+
+    def __init__(self, data):
+        self._acc = int.from_bytes(data, 'big')
+        self._total = len(data) * 8
+        self._pos = 0
+
+    def read(self, nbits):
+        self._pos += nbits
+        return (self._acc >> (self._total - self._pos)) & ((1 << nbits) - 1)
+
+
+def _float_bits(value):
+    return struct.unpack('>Q', struct.pack('>d', value))[0]
+
+
+def _bits_float(bits):
+    return struct.unpack('>d', struct.pack('>Q', bits))[0]
+
+
+# Rangos de delta-of-delta: (prefijo, bits del prefijo, bits del valor)
+_DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+
+class ChunkEncoder:
+    """Chunk abierto de una serie: cada muestra se codifica al llegar
+
+    state() y resume() guardan y retoman el codificador sin decodificar
+    las muestras ya escritas.
+    """
+
+    __slots__ = ('bits', 'count', 't0', 'prev_ts', 'prev_delta', 'prev_bits',
+                 'prev_leading', 'prev_trailing')
+
+    def __init__(self):
+        self.bits = BitWriter()
+        self.count = 0
+        self.t0 = self.prev_ts = None
+        self.prev_delta = 0
+        self.prev_bits = 0
+        self.prev_leading, self.prev_trailing = -1, 0
+
+    def append(self, ts, value):
+        bits = self.bits
+        current = _float_bits(value)
+        self.count += 1
+        if self.count == 1:
+            self.t0 = self.prev_ts = ts
+            self.prev_bits = current
+            bits.write(current, 64)
+            return
+
+        # Timestamp: delta-of-delta
+        delta = ts - self.prev_ts
+        dod = delta - self.prev_delta
+        self.prev_ts, self.prev_delta = ts, delta
+        if dod == 0:
+            bits.write(0, 1)
+        else:
+            for prefix, prefix_bits, value_bits in _DOD_BUCKETS:
+                limit = 1 << (value_bits - 1)
+                if -limit <= dod < limit:
+                    bits.write(prefix, prefix_bits)
+                    bits.write(dod, value_bits)
+                    break
+            else:
+                bits.write(0b1111, 4)
+                bits.write(dod, 64)
+
+        # Valor: XOR con el anterior
+        xor = current ^ self.prev_bits
+        self.prev_bits = current
+        if xor == 0:
+            bits.write(0, 1)
+            return
+        leading = min(64 - xor.bit_length(), 31)
+        trailing = (xor & -xor).bit_length() - 1
+        prev_leading, prev_trailing = self.prev_leading, self.prev_trailing
+        if prev_leading >= 0 and leading >= prev_leading and trailing >= prev_trailing:
+            bits.write(0b10, 2)
+            bits.write(xor >> prev_trailing, 64 - prev_leading - prev_trailing)
+        else:
+            meaningful = 64 - leading - trailing
+            bits.write(0b11, 2)
+            bits.write(leading, 5)
+            bits.write(meaningful & 63, 6)
+            bits.write(xor >> trailing, meaningful)
+            self.prev_leading, self.prev_trailing = leading, trailing
+
+    def to_bytes(self):
+        return self.bits.to_bytes()
+
+    def state(self):
+        """Lo que no se deduce de la cabecera del chunk ni de sus bits"""
+        out = bytearray()
+        _write_varint(out, _zigzag(self.prev_delta))
+        _write_varint(out, self.prev_leading + 1)
+        _write_varint(out, self.prev_trailing)
+        _write_varint(out, self.bits.nbits)
+        out += struct.pack('>Q', self.prev_bits)
+        return out
+
+    @classmethod
+    def resume(cls, data, pos, end, count, t0, t_end):
+        """Codificador de un registro 'O': estado en data[pos:] y después los bits hasta end"""
+        encoder = cls()
+        prev_delta, pos = _read_varint(data, pos)
+        prev_leading, pos = _read_varint(data, pos)
+        encoder.prev_trailing, pos = _read_varint(data, pos)
+        nbits, pos = _read_varint(data, pos)
+        encoder.prev_bits = struct.unpack('>Q', data[pos:pos + 8])[0]
+        encoder.bits = BitWriter(bytes(data[pos + 8:end]), nbits)
+        encoder.prev_delta = _unzigzag(prev_delta)
+        encoder.prev_leading = prev_leading - 1
+        encoder.count, encoder.t0, encoder.prev_ts = count, t0, t_end
+        return encoder
+
+
+def _skip_state(data, pos):
+    """Posición de los bits de un registro 'O' (tras el estado del codificador)"""
+    for _ in range(4):
+        _, pos = _read_varint(data, pos)
+    return pos + 8
+
+
+def encode_chunk(timestamps, values):
+    """Codifica timestamps (ms) y valores de una serie. Devuelve bytes."""
+    encoder = ChunkEncoder()
+    for ts, value in zip(timestamps, values):
+        encoder.append(ts, value)
+    return encoder.to_bytes()
+
+
+def _signed(value, nbits):
+    return value - (1 << nbits) if value & (1 << (nbits - 1)) else value
+
+
+def decode_chunk(data, count, t0):
+    """Genera (timestamp, valor) de un chunk codificado con encode_chunk"""
+    bits = BitReader(data)
+    prev_ts, prev_delta = t0, 0
+    prev_bits = bits.read(64)
+    prev_leading, prev_trailing = 0, 0
+    yield prev_ts, _bits_float(prev_bits)
+
+    for _ in range(count - 1):
+        if bits.read(1) == 0:
+            dod = 0
+        elif bits.read(1) == 0:
+            dod = _signed(bits.read(7), 7)
+        elif bits.read(1) == 0:
+            dod = _signed(bits.read(9), 9)
+        elif bits.read(1) == 0:
+            dod = _signed(bits.read(12), 12)
+        else:
+            dod = _signed(bits.read(64), 64)
+        prev_delta += dod
+        prev_ts += prev_delta
+
+        if bits.read(1) == 1:
+            if bits.read(1) == 1:
+                prev_leading = bits.read(5)
+                meaningful = bits.read(6) or 64
+                prev_trailing = 64 - prev_leading - meaningful
+            meaningful = 64 - prev_leading - prev_trailing
+            prev_bits ^= bits.read(meaningful) << prev_trailing
+        yield prev_ts, _bits_float(prev_bits)
+
+
+# --- Escritura ---------------------------------------------------------------------
+
+def _write_record(f, kind, payload):
+    header = bytearray(kind)
+    _write_varint(header, len(payload))
+    f.write(header)
+    f.write(payload)
+
+
+def _iter_records(data, pos=len(MAGIC)):
+    """Genera (tipo, inicio del payload, fin del payload) de cada registro
+
+    Se para en el primer registro incompleto (cabecera o payload cortados
+    por una escritura interrumpida): el `fin` del último registro generado
+    es el final de la parte válida del fichero.
+    """
+    size = len(data)
+    while pos < size:
+        kind = data[pos:pos + 1]
+        try:
+            length, start = _read_varint(data, pos + 1)
+        except IndexError:
+            break  # cabecera truncada
+        end = start + length
+        if end > size:
+            break  # payload truncado
+        yield kind, start, end
+        pos = end
+
+
+def _open_append(path, magic, valid_size):
+    """Fichero en modo 'ab' para añadir registros tras los `valid_size` bytes válidos
+
+    Lo que haya detrás (un registro a medias) se trunca: si no, su varint de
+    longitud se tragaría los registros nuevos. valid_size 0 = fichero nuevo.
+    """
+    f = open(path, 'ab')
+    if f.tell() > valid_size:
+        f.truncate(valid_size)
+    if not valid_size:
+        f.write(magic)
+    return f
+
+
+def _series_key(name, labels):
+    """Clave de una serie independiente del orden de sus etiquetas"""
+    return name, tuple(sorted(labels.items()))
+
+
+def _write_series(f, schemas, sid, series):
+    """Registro 'S' de una serie (y 'L' de su esquema si es nuevo en `schemas`)"""
+    names = tuple(series.labels.keys())
+    schema = schemas.get(names)
+    if schema is None:
+        schema = schemas[names] = len(schemas)
+        payload = bytearray()
+        _write_varint(payload, schema)
+        payload += json.dumps(names, separators=(',', ':')).encode('utf-8')
+        _write_record(f, SCHEMA_RECORD, payload)
+
+    payload = bytearray()
+    _write_varint(payload, sid)
+    _write_varint(payload, schema)
+    payload += json.dumps([series.family, series.name, list(series.labels.values())],
+                          separators=(',', ':')).encode('utf-8')
+    _write_record(f, SERIES_RECORD, payload)
+
+
+def _read_schema_or_series(kind, data, start, end, schemas, series):
+    """Procesa un registro 'L' o 'S'; devuelve False si es de otro tipo"""
+    if kind == SCHEMA_RECORD:
+        _, pos = _read_varint(data, start)
+        schemas.append(tuple(json.loads(data[pos:end])))
+    elif kind == SERIES_RECORD:
+        sid, pos = _read_varint(data, start)
+        schema, pos = _read_varint(data, pos)
+        family, name, values = json.loads(data[pos:end])
+        series[sid] = (family, name, dict(zip(schemas[schema], values)))
+    else:
+        return False
+    return True
+
+
+class TSDBWriter:
+    """Escritor append-only. Reabrir un fichero existente continúa sus series."""
+
+    def __init__(self, path, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._sids = {}      # (nombre, tupla de etiquetas) -> sid del fichero
+        self._schemas = {}   # tupla de nombres de etiqueta -> id de esquema
+        self._pending = {}   # sid -> ChunkEncoder del chunk abierto
+        self._last_ts = {}   # sid -> último timestamp aceptado
+        self.samples_written = 0
+
+        valid_size = 0
+        if os.path.exists(path) and os.path.getsize(path) >= len(MAGIC):
+            with TSDBReader(path) as reader:
+                self._schemas = {names: i for i, names in enumerate(reader.schemas)}
+                for sid, (family, name, labels) in reader.series.items():
+                    self._sids[_series_key(name, labels)] = sid
+                for sid, t_min, t_max, *_ in reader.chunks:
+                    self._last_ts[sid] = max(t_max, self._last_ts.get(sid, NO_TIMESTAMP))
+                valid_size = reader.valid_size
+                if reader.open_chunks:
+                    # Se retoman los chunks abiertos y se truncan sus registros 'O'
+                    valid_size = reader.open_offset
+                    data = reader._data
+                    for sid, (count, t0, t_end, begin, end) in reader.open_chunks.items():
+                        self._pending[sid] = ChunkEncoder.resume(data, begin, end, count, t0, t_end)
+        self._next_sid = len(self._sids)
+        self._file = _open_append(path, MAGIC, valid_size)
+
+    def _sid_for(self, series):
+        key = _series_key(series.name, series.labels)
+        sid = self._sids.get(key)
+        if sid is None:
+            sid = self._sids[key] = self._next_sid
+            self._next_sid += 1
+            _write_series(self._file, self._schemas, sid, series)
+        return sid
+
+    def append_scrape(self, scrape, scrape_time_ms=None):
+        """Añade todas las muestras de un series_store.Scrape"""
+        if scrape_time_ms is None:
+            scrape_time_ms = int(time.time() * 1000)
+        by_store_sid = {}
+        series = scrape.store.series
+        for store_sid, value, ts in zip(scrape.sids, scrape.values, scrape.timestamps):
+            sid = by_store_sid.get(store_sid)
+            if sid is None:
+                sid = by_store_sid[store_sid] = self._sid_for(series[store_sid])
+            self.append(sid, scrape_time_ms if ts == NO_TIMESTAMP else ts, value)
+
+    def append(self, sid, timestamp, value):
+        if timestamp <= self._last_ts.get(sid, NO_TIMESTAMP):
+            return  # cAdvisor no ha refrescado esta muestra
+        self._last_ts[sid] = timestamp
+        encoder = self._pending.get(sid)
+        if encoder is None:
+            encoder = self._pending[sid] = ChunkEncoder()
+        encoder.append(timestamp, value)
+        self.samples_written += 1
+        if encoder.count >= self.chunk_size:
+            self._flush_series(sid)
+
+    def _flush_series(self, sid, kind=CHUNK_RECORD):
+        encoder = self._pending.pop(sid)
+        payload = bytearray()
+        _write_varint(payload, sid)
+        _write_varint(payload, encoder.count)
+        _write_varint(payload, _zigzag(encoder.t0))
+        _write_varint(payload, encoder.prev_ts - encoder.t0)
+        if kind == OPEN_CHUNK_RECORD:
+            payload += encoder.state()
+        payload += encoder.to_bytes()
+        _write_record(self._file, kind, payload)
+
+    def flush(self):
+        """Cierra y escribe todos los chunks abiertos (parciales incluidos)"""
+        for sid in list(self._pending):
+            self._flush_series(sid)
+        self._file.flush()
+
+    def close(self):
+        """Escribe los chunks abiertos como 'O' (se retoman al reabrir) y cierra el fichero
+
+        Como con el escritor abierto, si el proceso muere antes de close()
+        se pierden las muestras de los chunks abiertos.
+        """
+        for sid in list(self._pending):
+            self._flush_series(sid, OPEN_CHUNK_RECORD)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- Lectura ------------------------------------------------------------------------
+
+class TSDBReader:
+    """Lector: tabla de series + índice de chunks (sin decodificar nada al abrir)
+
+    El fichero se mapea en memoria: sólo se leen las páginas de los
+    registros que se recorren y de los chunks que se decodifican.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        if self._data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} no es un fichero {MAGIC!r}")
+
+        self.schemas = []   # id -> tupla de nombres de etiqueta
+        self.series = {}    # sid -> (familia, nombre, etiquetas)
+        self.chunks = []    # (sid, t_min, t_max, count, inicio, fin)
+        self.valid_size = len(MAGIC)    # fin del último registro completo
+        # Registros 'O' del final del fichero: sid -> (count, t0, t_fin, inicio del estado, fin)
+        self.open_chunks = {}
+        self.open_offset = None         # dónde empieza el primero de ellos
+        data = self._data
+        for kind, start, end in _iter_records(data):
+            record_start, self.valid_size = self.valid_size, end
+            if kind in (CHUNK_RECORD, OPEN_CHUNK_RECORD):
+                sid, pos = _read_varint(data, start)
+                count, pos = _read_varint(data, pos)
+                t0, pos = _read_varint(data, pos)
+                span, pos = _read_varint(data, pos)
+                t0 = _unzigzag(t0)
+                if kind == OPEN_CHUNK_RECORD:
+                    if not self.open_chunks:
+                        self.open_offset = record_start
+                    self.open_chunks[sid] = (count, t0, t0 + span, pos, end)
+                    pos = _skip_state(data, pos)
+                else:
+                    self.open_chunks.clear()
+                self.chunks.append((sid, t0, t0 + span, count, pos, end))
+            else:
+                # Tras los 'O' sólo puede haber más 'O': si no, ya no son la cola
+                self.open_chunks.clear()
+                _read_schema_or_series(kind, data, start, end, self.schemas, self.series)
+
+    def read_range(self, start_ms=None, end_ms=None, sids=None):
+        """Genera (sid, timestamp, valor) en [start_ms, end_ms] en orden de escritura"""
+        start_ms = float('-inf') if start_ms is None else start_ms
+        end_ms = float('inf') if end_ms is None else end_ms
+        for sid, t_min, t_max, count, begin, end in self.chunks:
+            if t_max < start_ms or t_min > end_ms or (sids is not None and sid not in sids):
+                continue
+            for ts, value in decode_chunk(self._data[begin:end], count, t_min):
+                if start_ms <= ts <= end_ms:
+                    yield sid, ts, value
+
+    def find(self, name, **labels):
+        """sids de las series con ese nombre y (al menos) esas etiquetas"""
+        return {sid for sid, (family, series_name, series_labels) in self.series.items()
+                if series_name == name
+                and all(series_labels.get(k) == v for k, v in labels.items())}
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- Benchmark ----------------------------------------------------------------------
+
+def _synthetic_snapshots(metrics_text, n_snapshots, interval_ms=10000, seed=1):
+    """Snapshots sucesivos del dump: counters crecen, algunos gauges varían"""
+    rng = random.Random(seed)
+    store = SeriesStore()
+    base = store.ingest_text(metrics_text)
+    counters = array('b', (1 if s.name.endswith('_total') else 0 for s in store.series))
+    values = array('d', base.values)
+    for n in range(n_snapshots):
+        scrape = type(base)(store)
+        for i, (sid, ts) in enumerate(zip(base.sids, base.timestamps)):
+            if counters[sid]:
+                values[i] += rng.random() * 100
+            elif rng.random() < 0.1:
+                values[i] = round(values[i] * (0.9 + rng.random() * 0.2))
+            ts = NO_TIMESTAMP if ts == NO_TIMESTAMP else ts + n * interval_ms
+            scrape.sids.append(sid)
+            scrape.values.append(values[i])
+            scrape.timestamps.append(ts)
+        yield scrape, 1764230000000 + n * interval_ms
+
+
+def _write_snapshots(snapshots, out_path, reopen):
+    """Escribe los snapshots con un solo escritor o con uno por scrape (como export_metrics)
+
+    Devuelve (segundos, muestras escritas).
+    """
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    samples = 0
+    start = time.perf_counter()
+    if reopen:
+        for scrape, scrape_time in snapshots:
+            with TSDBWriter(out_path) as writer:
+                writer.append_scrape(scrape, scrape_time)
+            samples += writer.samples_written
+    else:
+        with TSDBWriter(out_path) as writer:
+            for scrape, scrape_time in snapshots:
+                writer.append_scrape(scrape, scrape_time)
+        samples = writer.samples_written
+    return time.perf_counter() - start, samples
+
+
+def benchmark(filepath, n_snapshots=30, out_path='/tmp/cadvisor_tsdb_bench.db'):
+    """{modo: resultados} con el escritor abierto todo el rato y reabierto en cada scrape"""
+    with open(filepath, encoding='utf-8') as f:
+        metrics_text = f.read()
+    raw_bytes = len(metrics_text.encode('utf-8')) * n_snapshots
+    snapshots = list(_synthetic_snapshots(metrics_text, n_snapshots))
+
+    results = {}
+    for mode, reopen in (('abierto', False), ('reabierto', True)):
+        write_seconds, samples = _write_snapshots(snapshots, out_path, reopen)
+        stored = os.path.getsize(out_path)
+
+        start = time.perf_counter()
+        with TSDBReader(out_path) as reader:
+            read_count = sum(1 for _ in reader.read_range())
+            chunks = len(reader.chunks)
+        read_seconds = time.perf_counter() - start
+
+        results[mode] = {
+            'snapshots': n_snapshots,
+            'samples': samples,
+            'read_samples': read_count,
+            'chunks': chunks,
+            'raw_text_bytes': raw_bytes,
+            'stored_bytes': stored,
+            'compression_ratio': round(raw_bytes / stored, 1),
+            'bytes_per_sample': round(stored / samples, 2),
+            'write_samples_per_s': int(samples / write_seconds),
+            'read_samples_per_s': int(read_count / read_seconds),
+        }
+    return results
+
+
+def main():
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'cadvisor_metrics.txt'
+    n_snapshots = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    for mode, results in benchmark(filepath, n_snapshots).items():
+        print(f"Escritor {mode}:")
+        for key, value in results.items():
+            print(f"  {key:20}: {value}")
+
+
+if __name__ == '__main__':
+    main()